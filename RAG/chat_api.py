@@ -5,9 +5,16 @@ from pydantic import BaseModel
 from langchain.chains import RetrievalQA
 from langchain_cohere import ChatCohere
 from langchain.prompts import PromptTemplate
+from langchain.callbacks.base import BaseCallbackHandler
 from .redundant_filter_retriever import CustomFaissRetriever
+from .semantic_cache import SemanticAnswerCache
+from .stub_llm import StubChatModel
 from dotenv import load_dotenv
 from pathlib import Path
+import os
+import time
+from services.metrics import observe, stage_timer
+from services.query_log import log_query
 
 load_dotenv()
 
@@ -24,8 +31,17 @@ QUORA_FAISS_INDEX = FAISS_STORE_PATH / "quora" / "index.faiss"
 ANTIQUE_DATA_FILE = DATA_PATH / "antique" / "collection.txt"
 QUORA_DATA_FILE = DATA_PATH / "quora" / "corpus.jsonl"
 
-# --- Initialize Cohere Chat Model ---
-chat = ChatCohere(model="command-r", verbose=True)
+# --- Initialize the Chat Model ---
+# IR_CHAT_MODEL=stub swaps Cohere for a deterministic local model (RAG/stub_llm.py) whose
+# latency is set by IR_STUB_LLM_LATENCY_MS / IR_STUB_LLM_JITTER_MS, e.g. for load tests.
+CHAT_MODEL = os.getenv("IR_CHAT_MODEL", "cohere")
+if CHAT_MODEL == "stub":
+    chat = StubChatModel(
+        latency_ms=float(os.getenv("IR_STUB_LLM_LATENCY_MS", "300")),
+        jitter_ms=float(os.getenv("IR_STUB_LLM_JITTER_MS", "0")),
+    )
+else:
+    chat = ChatCohere(model="command-r", verbose=True)
 
 # --- Initialize the CustomFaissRetriever ---
 try:
@@ -58,6 +74,45 @@ qa_chain = RetrievalQA.from_chain_type(
     return_source_documents=True
 )
 
+# --- Semantic answer cache in front of qa_chain ---
+# Reuses the retriever's encoder; dropped automatically when either FAISS index is rebuilt.
+answer_cache = SemanticAnswerCache(
+    encoder=retriever._embeddings_model,
+    watched_paths=[ANTIQUE_FAISS_INDEX, QUORA_FAISS_INDEX],
+    threshold=float(os.getenv("CHAT_CACHE_THRESHOLD", "0.92")),
+    max_entries=int(os.getenv("CHAT_CACHE_MAX_ENTRIES", "1000")),
+    ttl_seconds=float(os.getenv("CHAT_CACHE_TTL_SECONDS", "3600")),
+)
+
+class _StageTimingHandler(BaseCallbackHandler):
+    """Feeds the retrieval and LLM durations of one chain run into the stage histograms."""
+
+    def __init__(self):
+        self._starts = {}
+
+    def _start(self, run_id):
+        self._starts[run_id] = time.perf_counter()
+
+    def _finish(self, run_id, stage):
+        start = self._starts.pop(run_id, None)
+        if start is not None:
+            observe("chat", "all", stage, time.perf_counter() - start)
+
+    def on_retriever_start(self, serialized, query, *, run_id, **kwargs):
+        self._start(run_id)
+
+    def on_retriever_end(self, documents, *, run_id, **kwargs):
+        self._finish(run_id, "retrieve")
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._start(run_id)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._start(run_id)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self._finish(run_id, "llm")
+
 class ChatQuery(BaseModel):
     question: str
 
@@ -65,7 +120,17 @@ app = APIRouter()
 
 @router.post("/chat/")
 async def rag_chat(query: ChatQuery):
-    response = qa_chain.invoke(query.question)
+    log_query("chat", "all", query.question)
+    with stage_timer("chat", "all", "cache_lookup"):
+        cached, question_embedding = answer_cache.lookup(query.question)
+    if cached is not None:
+        return {
+            "answer": cached["answer"],
+            "sources": cached["sources"],
+            "cached": True
+        }
+
+    response = qa_chain.invoke(query.question, config={"callbacks": [_StageTimingHandler()]})
     
     answer = response.get("result")
     source_documents = response.get("source_documents", [])
@@ -84,7 +149,23 @@ async def rag_chat(query: ChatQuery):
             "metadata": metadata_copy # Use the modified copy
         })
 
+    answer_cache.store(query.question, question_embedding, answer, formatted_sources)
+
     return {
         "answer": answer,
-        "sources": formatted_sources
-    }
\ No newline at end of file
+        "sources": formatted_sources,
+        "cached": False
+    }
+
+
+@router.get("/chat/cache/stats")
+async def chat_cache_stats():
+    """Returns size, hit-rate and eviction counters for the semantic answer cache."""
+    return answer_cache.stats()
+
+
+@router.post("/chat/cache/clear")
+async def chat_cache_clear():
+    """Drops every cached answer."""
+    answer_cache.clear()
+    return {"status": "cleared"}
\ No newline at end of file
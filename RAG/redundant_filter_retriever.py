@@ -6,6 +6,8 @@ from pathlib import Path
 from sentence_transformers import SentenceTransformer
 from langchain.schema import BaseRetriever, Document
 from pydantic import Field, PrivateAttr # Import PrivateAttr
+from services.faiss_utils import read_faiss_index
+from services.database_utils import collapsed_doc_ids
 
 class CustomFaissRetriever(BaseRetriever):
     # Declare these as Pydantic fields. They will be passed to the constructor
@@ -35,8 +37,8 @@ class CustomFaissRetriever(BaseRetriever):
         # Load raw FAISS indexes
         if not all(Path(p).exists() for p in self.faiss_index_paths.values()):
             raise FileNotFoundError(f"One or more FAISS index files not found: {self.faiss_index_paths.values()}")
-        self._faiss_index_antique = faiss.read_index(str(self.faiss_index_paths["antique"]))
-        self._faiss_index_quora = faiss.read_index(str(self.faiss_index_paths["quora"]))
+        self._faiss_index_antique = read_faiss_index(self.faiss_index_paths["antique"])
+        self._faiss_index_quora = read_faiss_index(self.faiss_index_paths["quora"])
         print("CustomFaissRetriever: Loaded raw FAISS indexes.")
 
         # Load document texts from files
@@ -47,18 +49,22 @@ class CustomFaissRetriever(BaseRetriever):
         print("CustomFaissRetriever: Loaded document texts from files.")
 
 
+    # Near-duplicates collapsed by offline/dedup_service.py have no FAISS vector, so they are skipped
+    # to keep line i aligned with vector i
     def _load_antique_text(self, file_path: Path) -> list[str]:
         """Loads text from antique/collection.txt (one doc per line)."""
+        collapsed = collapsed_doc_ids("antique")
         with open(file_path, 'r', encoding='utf-8') as f:
-            return [line.strip() for line in f if line.strip()]
+            return [line.strip() for line in f if line.strip() and line.split("\t", 1)[0] not in collapsed]
 
     def _load_quora_text(self, file_path: Path) -> list[str]:
         """Loads text from quora/corpus.jsonl (JSON objects, 'text' field)."""
+        collapsed = collapsed_doc_ids("quora")
         docs = []
         with open(file_path, 'r', encoding='utf-8') as f:
             for line in f:
                 data = json.loads(line)
-                if 'text' in data:
+                if 'text' in data and data.get('_id') not in collapsed:
                     docs.append(data['text'])
         return docs
 
@@ -0,0 +1,162 @@
+# RAG/semantic_cache.py
+
+import os
+import time
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import faiss
+import numpy as np
+
+
+class SemanticAnswerCache:
+    """
+    Caches RAG answers keyed by the meaning of the question.
+
+    Questions are embedded with the retriever's encoder and stored in a small
+    inner-product FAISS index over normalized vectors, so a search returns the
+    cosine similarity directly. A new question whose nearest cached question is
+    at or above `threshold` gets the cached answer and sources back without
+    running retrieval or the LLM.
+
+    Entries expire after `ttl_seconds`, the least recently used entry is evicted
+    once `max_entries` is reached, and the whole cache is dropped whenever one of
+    the `watched_paths` (the faiss_store indexes) changes on disk.
+    """
+
+    def __init__(self, encoder, watched_paths=(), threshold=0.92, max_entries=1000, ttl_seconds=3600):
+        self.encoder = encoder
+        self.watched_paths = [Path(p) for p in watched_paths]
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+
+        self._dimension = encoder.get_sentence_embedding_dimension()
+        self._index = faiss.IndexIDMap2(faiss.IndexFlatIP(self._dimension))
+        self._entries = OrderedDict()  # id -> entry dict, ordered from least to most recently used
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._fingerprint = self._compute_fingerprint()
+
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._invalidations = 0
+
+    # --- Internal helpers ---
+    def _compute_fingerprint(self):
+        """Returns (path, mtime, size) for every watched index file."""
+        fingerprint = []
+        for path in self.watched_paths:
+            try:
+                stat = os.stat(path)
+                fingerprint.append((str(path), stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                fingerprint.append((str(path), None, None))
+        return tuple(fingerprint)
+
+    def _reset(self):
+        self._index.reset()
+        self._entries.clear()
+
+    def _check_invalidation(self):
+        fingerprint = self._compute_fingerprint()
+        if fingerprint != self._fingerprint:
+            print("SemanticAnswerCache: FAISS indexes changed on disk, dropping cached answers.")
+            self._fingerprint = fingerprint
+            self._reset()
+            self._invalidations += 1
+
+    def _remove(self, entry_id):
+        self._entries.pop(entry_id, None)
+        self._index.remove_ids(np.array([entry_id], dtype="int64"))
+
+    def _evict_expired(self, now):
+        expired = [entry_id for entry_id, entry in self._entries.items()
+                   if now - entry["created_at"] > self.ttl_seconds]
+        for entry_id in expired:
+            self._remove(entry_id)
+        self._expirations += len(expired)
+
+    def embed(self, question):
+        embedding = self.encoder.encode([question], convert_to_tensor=False)
+        embedding = np.asarray(embedding, dtype="float32").reshape(1, -1)
+        faiss.normalize_L2(embedding)
+        return embedding
+
+    # --- Public API ---
+    def lookup(self, question):
+        """
+        Returns (entry, embedding). `entry` is None on a miss; the embedding is
+        returned either way so the caller can pass it to `store` without
+        encoding the question a second time.
+        """
+        embedding = self.embed(question)
+        now = time.time()
+
+        with self._lock:
+            self._check_invalidation()
+            self._evict_expired(now)
+
+            if self._index.ntotal == 0:
+                self._misses += 1
+                return None, embedding
+
+            similarities, ids = self._index.search(embedding, 1)
+            entry_id = int(ids[0][0])
+            similarity = float(similarities[0][0])
+
+            if entry_id == -1 or similarity < self.threshold or entry_id not in self._entries:
+                self._misses += 1
+                return None, embedding
+
+            self._entries.move_to_end(entry_id)
+            entry = self._entries[entry_id]
+            entry["hits"] += 1
+            self._hits += 1
+            return {**entry, "similarity": similarity}, embedding
+
+    def store(self, question, embedding, answer, sources):
+        """Adds an answer to the cache, evicting the least recently used entry if full."""
+        if self.max_entries <= 0:
+            return
+
+        with self._lock:
+            while len(self._entries) >= self.max_entries:
+                oldest_id = next(iter(self._entries))
+                self._remove(oldest_id)
+                self._evictions += 1
+
+            entry_id = self._next_id
+            self._next_id += 1
+            self._index.add_with_ids(embedding, np.array([entry_id], dtype="int64"))
+            self._entries[entry_id] = {
+                "question": question,
+                "answer": answer,
+                "sources": sources,
+                "created_at": time.time(),
+                "hits": 0,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._reset()
+            self._invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "threshold": self.threshold,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": (self._hits / lookups) if lookups else 0.0,
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+                "invalidations": self._invalidations,
+            }
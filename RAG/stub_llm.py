@@ -0,0 +1,45 @@
+# RAG/stub_llm.py
+
+import hashlib
+import re
+import time
+from typing import Any, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+_QUESTION = re.compile(r"Question:\s*(.*?)\s*(?:\nAnswer:|$)", re.S)
+
+
+class StubChatModel(BaseChatModel):
+    """
+    Deterministic local stand-in for ChatCohere (IR_CHAT_MODEL=stub), for load tests and
+    offline development: no network and no API key. Every call sleeps `latency_ms`, plus a
+    jitter of up to `jitter_ms` derived from the prompt, so the same prompt always takes
+    as long and gets the same answer.
+    """
+
+    latency_ms: float = 300.0
+    jitter_ms: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[Any] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        prompt = "\n".join(str(message.content) for message in messages)
+        digest = hashlib.blake2b(prompt.encode("utf-8"), digest_size=8).digest()
+        fraction = int.from_bytes(digest, "big") / 2 ** 64
+        time.sleep((self.latency_ms + self.jitter_ms * fraction) / 1000)
+
+        match = _QUESTION.search(prompt)
+        question = match.group(1) if match else prompt[-200:]
+        answer = f"Stub answer to '{question}' from {len(prompt)} characters of context."
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=answer))])
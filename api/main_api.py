@@ -1,6 +1,20 @@
-from fastapi import FastAPI
-from services.search_service import router as search_router
+import asyncio
+import gc
+import os
+import threading
+import time
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse
+from services.search_service import (
+    router as search_router, preload_search_services, warm_up_search_services, WARMUP_TOP_N,
+    reload_search_services, search_services_status, start_artifact_watcher
+)
+from services.query_log import stats as query_log_stats
+from services.memory_report import memory_report, format_memory_report
+from services.metrics import render_prometheus, server_timing_header, start_request_timings
+from services.profiling import PROFILING_ENABLED, profile_requests, router as profiling_router
 from starlette.middleware.cors import CORSMiddleware 
+from starlette.middleware.gzip import GZipMiddleware
 from RAG.chat_api import router as chat_router
 
 app = FastAPI()
@@ -16,8 +30,104 @@ app.add_middleware(
     allow_credentials=True,         # Allow cookies to be included in requests
     allow_methods=["*"],            # Allows all methods (GET, POST, OPTIONS, etc.)
     allow_headers=["*"],            # Allows all headers
+    # Which engines a (possibly partial) search answer came from
+    expose_headers=["X-Search-Engines", "X-Search-Missing", "X-Search-Partial"],
 )
 
+# --- Response compression ---
+# Brotli when brotli-asgi is installed (it falls back to gzip for clients without br), else gzip.
+# Small responses are not worth compressing.
+try:
+    from brotli_asgi import BrotliMiddleware
+    app.add_middleware(BrotliMiddleware, minimum_size=1000, gzip_fallback=True)
+except ImportError:
+    app.add_middleware(GZipMiddleware, minimum_size=1000)
+
+@app.middleware("http")
+async def add_server_timing(request: Request, call_next):
+    """Collects the stage timings recorded while serving a request into a Server-Timing header."""
+    timings = start_request_timings()
+    start = time.perf_counter()
+    response = await call_next(request)
+    response.headers["Server-Timing"] = server_timing_header(timings, time.perf_counter() - start)
+    return response
+
 app.include_router(search_router, prefix="/api")
 app.include_router(chat_router, prefix="/api")
 
+# --- On-demand request profiling (IR_PROFILING=1) ---
+# Not installed at all otherwise, so it costs nothing when disabled.
+if PROFILING_ENABLED:
+    app.middleware("http")(profile_requests)
+    app.include_router(profiling_router)
+
+# --- Multi-worker mode ---
+# With IR_PRELOAD set (e.g. "all" or "bm25:*,bert:quora") the search engines are opened at import
+# time. Under `gunicorn -c gunicorn.conf.py` the app is imported once in the master, so the forked
+# workers inherit the mapped artifacts and the loaded models instead of each loading their own.
+PRELOAD_SPEC = os.getenv("IR_PRELOAD", "")
+if PRELOAD_SPEC:
+    preload_search_services(PRELOAD_SPEC)
+    # Warm the caches before forking so every worker inherits them
+    if WARMUP_TOP_N:
+        warm_up_search_services(WARMUP_TOP_N)
+    # Move everything loaded so far out of the GC's reach; otherwise the collector touching
+    # object headers in the workers would copy the shared pages one by one.
+    gc.collect()
+    gc.freeze()
+    print(format_memory_report(memory_report(), label="preload"))
+
+# --- Hot reload of rebuilt artifacts ---
+WATCH_ARTIFACTS_SECONDS = float(os.getenv("IR_WATCH_ARTIFACTS", "0"))
+
+def _reload_in_background():
+    try:
+        reload_search_services()
+    except Exception as e:
+        print(f"Warning: engine reload failed, the previous generation keeps serving: {e}")
+
+@app.on_event("startup")
+async def warm_up_and_report_memory():
+    # Without preloading, warm up here: the server accepts requests only after startup finishes
+    if not PRELOAD_SPEC and WARMUP_TOP_N:
+        warm_up_search_services(WARMUP_TOP_N)
+    print(format_memory_report(memory_report(), label="worker"))
+    # Threads do not survive the fork, so each worker starts its own watcher
+    if WATCH_ARTIFACTS_SECONDS > 0:
+        start_artifact_watcher(WATCH_ARTIFACTS_SECONDS)
+
+@app.get("/admin/memory")
+async def admin_memory():
+    """Shared vs private resident memory of the worker that serves this request."""
+    return memory_report()
+
+@app.post("/admin/reload")
+async def admin_reload(wait: bool = False):
+    """
+    Loads every open engine again from disk into a new generation and swaps it in.
+    Only reloads the worker serving this request; use IR_WATCH_ARTIFACTS for all workers.
+    """
+    if search_services_status()["reloading"]:
+        raise HTTPException(status_code=409, detail="A reload is already running.")
+    if wait:
+        try:
+            return await asyncio.to_thread(reload_search_services)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Reload failed: {e}")
+    threading.Thread(target=_reload_in_background, name="engine-reload", daemon=True).start()
+    return {"status": "started", "generation": search_services_status()["generation"]}
+
+@app.get("/admin/engines")
+async def admin_engines():
+    """Live engine generation, its open engines, in-flight requests and generations still draining."""
+    return search_services_status()
+
+@app.get("/admin/query-log")
+async def admin_query_log():
+    """Pending and dropped entries of this worker's query log writer."""
+    return query_log_stats()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Per (engine, dataset, stage) latency histograms in Prometheus text format."""
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
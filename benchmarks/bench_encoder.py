@@ -0,0 +1,93 @@
+# benchmarks/bench_encoder.py
+#
+# Compares the query encoder backends (services/encoder.py) with the float32 model:
+#   accuracy - cosine between each backend's query embedding and the float32 one, and how many
+#              of the float32 top-10 FAISS results the backend still retrieves
+#   latency  - single-query encode time (what a request pays) and batched throughput
+#
+#     python -m benchmarks.bench_encoder --dataset quora --queries 500 --backends torch,int8,onnx
+
+import argparse
+import statistics
+import time
+from pathlib import Path
+
+import numpy as np
+
+from benchmarks.fts_vs_bm25 import sample_queries
+from services.encoder import get_encoder, encoder_threads
+from services.faiss_utils import read_faiss_index
+from services.preprocessing_service import preprocess
+
+BATCH_SIZE = 64
+
+
+def encode(encoder, texts, batch_size=BATCH_SIZE):
+    return np.asarray(encoder.encode(texts, batch_size=batch_size, convert_to_tensor=False), dtype="float32")
+
+
+def single_query_latencies(encoder, texts):
+    encode(encoder, texts[:10], batch_size=1)  # warm up kernels and allocator
+    latencies = []
+    for text in texts:
+        start = time.perf_counter()
+        encoder.encode([text], convert_to_tensor=False)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Accuracy and latency of the query encoder backends.")
+    parser.add_argument("--dataset", default="quora")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--backends", default="torch,int8,onnx")
+    args = parser.parse_args()
+
+    texts = [preprocess(query) for query in sample_queries(args.dataset, args.queries)]
+    print(f"{len(texts)} queries from '{args.dataset}', {encoder_threads()} encoder thread(s)")
+
+    index_path = Path("faiss_store") / args.dataset / "index.faiss"
+    index = read_faiss_index(index_path) if index_path.exists() else None
+    if index is None:
+        print(f"No FAISS index at {index_path}; skipping the result-overlap check.")
+
+    reference_encoder = get_encoder(backend="torch")
+    reference = encode(reference_encoder, texts)
+    reference_ids = index.search(reference, 10)[1] if index is not None else None
+
+    rows = []
+    for backend in args.backends.split(","):
+        encoder = get_encoder(backend=backend)
+        if encoder.encoder_backend != backend:
+            print(f"Skipping '{backend}': its dependencies are not installed.")
+            continue
+
+        embeddings = encode(encoder, texts)
+        cosines = np.sum(embeddings * reference, axis=1) / (
+            np.linalg.norm(embeddings, axis=1) * np.linalg.norm(reference, axis=1)
+        )
+        overlap = top1 = float("nan")
+        if index is not None:
+            ids = index.search(embeddings, 10)[1]
+            overlap = np.mean([len(set(a) & set(b)) / 10 for a, b in zip(ids, reference_ids)])
+            top1 = np.mean(ids[:, 0] == reference_ids[:, 0])
+
+        latencies = single_query_latencies(encoder, texts)
+        start = time.perf_counter()
+        encode(encoder, texts)
+        throughput = len(texts) / (time.perf_counter() - start)
+
+        rows.append((backend, float(np.mean(cosines)), float(np.min(cosines)), overlap, top1,
+                     statistics.median(latencies), statistics.quantiles(latencies, n=20)[-1], throughput))
+
+    header = (f"{'backend':<8}{'mean cos':>10}{'min cos':>10}{'overlap@10':>12}{'top1 same':>11}"
+              f"{'p50 ms':>9}{'p95 ms':>9}{'batch q/s':>11}")
+    print(header)
+    print("-" * len(header))
+    for backend, mean_cos, min_cos, overlap, top1, p50, p95, throughput in rows:
+        print(f"{backend:<8}{mean_cos:>10.4f}{min_cos:>10.4f}{overlap:>12.3f}{top1:>11.3f}"
+              f"{p50:>9.2f}{p95:>9.2f}{throughput:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+# benchmarks/bench_suggest.py
+#
+# Measures /suggest latency at the index level (no HTTP): prefix completion for
+# prefixes of every length and spelling correction of randomly misspelled words.
+#
+#     python -m benchmarks.bench_suggest --dataset quora --samples 5000
+
+import argparse
+import random
+import statistics
+import time
+
+from services.suggest_index import SuggestIndex
+
+
+def sample_inputs(index, count, seed=0):
+    """Prefixes of random completions, and dictionary words with one or two random typos."""
+    rng = random.Random(seed)
+    n = len(index.completions)
+    prefixes, typos = [], []
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    while len(prefixes) < count:
+        text = index.completions.term(rng.randrange(n))
+        prefixes.append(text[:rng.randint(1, len(text))])
+        word = text.split()[0]
+        if len(word) < 4:
+            continue
+        chars = list(word)
+        for _ in range(rng.randint(1, 2)):
+            i = rng.randrange(len(chars))
+            edit = rng.choice(("replace", "delete", "insert", "swap"))
+            if edit == "replace":
+                chars[i] = rng.choice(letters)
+            elif edit == "delete" and len(chars) > 1:
+                del chars[i]
+            elif edit == "insert":
+                chars.insert(i, rng.choice(letters))
+            elif i + 1 < len(chars):
+                chars[i], chars[i + 1] = chars[i + 1], chars[i]
+        typos.append("".join(chars))
+    return prefixes, typos
+
+
+def time_calls(fn, inputs):
+    latencies = []
+    for value in inputs:
+        start = time.perf_counter_ns()
+        fn(value)
+        latencies.append((time.perf_counter_ns() - start) / 1000)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark autocomplete and spelling correction latency.")
+    parser.add_argument("--dataset", default="quora")
+    parser.add_argument("--samples", type=int, default=5000)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    index = SuggestIndex(f"offline_data/suggest_{args.dataset}")
+    print(f"Opened suggest index for '{args.dataset}' in {(time.perf_counter() - start) * 1000:.1f} ms "
+          f"({index.meta['n_completions']} completions, {index.meta['n_prefixes']} precomputed prefixes)")
+
+    prefixes, typos = sample_inputs(index, args.samples)
+    # One untimed pass pages in the memory-mapped files
+    time_calls(index.complete, prefixes)
+    time_calls(index.correct, typos)
+
+    header = f"{'operation':<12}{'p50 us':>10}{'p95 us':>10}{'p99 us':>10}{'mean us':>10}"
+    print(header)
+    print("-" * len(header))
+    for name, fn, inputs in (("complete", index.complete, prefixes), ("correct", index.correct, typos)):
+        latencies = time_calls(fn, inputs)
+        percentiles = statistics.quantiles(latencies, n=100)
+        print(f"{name:<12}{statistics.median(latencies):>10.1f}{percentiles[94]:>10.1f}"
+              f"{percentiles[98]:>10.1f}{statistics.fmean(latencies):>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+# benchmarks/bench_suite.py
+#
+# Reproducible micro-benchmarks of every engine and pipeline stage on a synthetic Zipfian corpus
+# (benchmarks/synthetic_corpus.py), built with the real offline builders into a scratch workspace:
+#   build      - database (+ FTS5), tfidf, bm25 (+ positions), docstore, bert
+#   preprocess - query preprocessing
+#   search:*   - execute_search of each engine (result cache bypassed)
+#   hydrate    - fetching the text of a top-10
+#   fusion     - hybrid score normalization and fusion
+#   expansion  - query expansion (when its model and vocabulary are available)
+# Results are written as JSON; compare two runs (e.g. two commits) with `compare`.
+#
+#     python -m benchmarks.bench_suite run --docs 20000 --queries 300
+#     python -m benchmarks.bench_suite compare benchmarks/results/abc1234.json benchmarks/results/def5678.json
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_DIR))
+# The suite's own queries must not end up in the real query log
+os.environ.setdefault("IR_QUERY_LOG", "0")
+
+from benchmarks.synthetic_corpus import SyntheticCorpus, write_database
+
+DATASET = "synthetic"
+DEFAULT_WORKSPACE = REPO_DIR / "benchmarks" / ".workspace"
+RESULTS_DIR = REPO_DIR / "benchmarks" / "results"
+WARMUP_QUERIES = 10
+
+
+def _stats(latencies):
+    """Latency summary (ms) of one part."""
+    if not latencies:
+        return {"n": 0}
+    ordered = sorted(latencies)
+    mean = statistics.fmean(ordered)
+    return {
+        "n": len(ordered),
+        "mean_ms": round(mean, 4),
+        "p50_ms": round(ordered[len(ordered) // 2], 4),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 4),
+        "p99_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))], 4),
+        "qps": round(1000 / mean, 1) if mean else None,
+    }
+
+
+def _time_each(fn, items):
+    """Calls fn(item) for every item; returns (results, per-call latencies in ms)."""
+    results, latencies = [], []
+    for item in items:
+        start = time.perf_counter()
+        results.append(fn(item))
+        latencies.append((time.perf_counter() - start) * 1000)
+    return results, latencies
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# --- Build ---
+def build_workspace(workspace, corpus, n_docs, engines):
+    """Writes the synthetic database and every requested artifact; returns the build timings (s)."""
+    from offline.tfidf_service import process_tfidf
+    from offline.bm25_service import process_bm25
+    from offline.docstore_service import process_docstore
+
+    db_path = workspace / "offline" / "ir_project.db"
+    output_dir = workspace / "offline_data"
+    timings = {}
+
+    def timed(name, fn, *args, **kwargs):
+        start = time.perf_counter()
+        fn(*args, **kwargs)
+        timings[name] = round(time.perf_counter() - start, 3)
+        print(f"  built {name} in {timings[name]}s")
+
+    documents = corpus.documents(n_docs)
+    if db_path.exists():
+        os.remove(db_path)
+    timed("database", write_database, db_path, DATASET, documents)
+    timed("tfidf", process_tfidf, DATASET, 1, db_path=db_path, output_dir=output_dir)
+    timed("bm25", process_bm25, DATASET, 1, True, db_path=db_path, output_dir=output_dir)
+    timed("docstore", process_docstore, DATASET, db_path=db_path, output_dir=output_dir)
+    if "bert" in engines:
+        try:
+            from offline.bert_service import process_bert
+        except ImportError as e:
+            print(f"  skipping bert build: {e}")
+        else:
+            timed("bert", process_bert, DATASET, 1, db_path=db_path, store_dir=workspace / "faiss_store")
+    return timings
+
+
+# --- Measure ---
+def measure(queries, engines):
+    """Latency of every part, run against the workspace in the current directory."""
+    from services.preprocessing_service import preprocess
+    from services.search_service import _get_search_service, _fuse_results, HYBRID_WEIGHTS
+    from services.search_classes import _hydrate_results
+
+    parts = {}
+    _, latencies = _time_each(preprocess, queries)
+    parts["preprocess"] = _stats(latencies)
+
+    results_by_engine = {}
+    for engine in engines:
+        try:
+            service = _get_search_service(engine, DATASET)
+        except Exception as e:
+            print(f"  skipping {engine}: {e}")
+            continue
+        for query in queries[:WARMUP_QUERIES]:
+            service.execute_search(query)
+        results, latencies = _time_each(service.execute_search, queries)
+        results_by_engine[engine] = results
+        parts[f"search:{engine}"] = _stats(latencies)
+
+    if "bm25" in results_by_engine:
+        bm25 = _get_search_service("bm25", DATASET)
+        hits = [bm25.search_rows(query, 10) for query in queries]
+        _, latencies = _time_each(lambda hit: _hydrate_results("bench", DATASET, bm25.doc_ids, *hit), hits)
+        parts["hydrate"] = _stats(latencies)
+
+    # Fusion over whichever hybrid engines ran, with their configured weights
+    weights = {engine: weight for engine, weight in HYBRID_WEIGHTS.items() if engine in results_by_engine}
+    if len(weights) > 1:
+        per_query = [{engine: [dict(r) for r in results_by_engine[engine][i]] for engine in weights}
+                     for i in range(len(queries))]
+        _, latencies = _time_each(lambda results: _fuse_results(results, weights), per_query)
+        parts["fusion"] = _stats(latencies)
+
+    try:
+        import services.query_expansion_service as expansion
+    except ImportError as e:
+        print(f"  skipping expansion: {e}")
+    else:
+        if expansion.model is not None and expansion.faiss_index is not None:
+            _, latencies = _time_each(expansion.expand_query_with_synonyms, queries)
+            parts["expansion"] = _stats(latencies)
+        else:
+            print("  skipping expansion: model or semantic vocabulary not available")
+    return parts
+
+
+def run(args):
+    workspace = Path(args.workspace).resolve()
+    engines = [engine for engine in args.engines.split(",") if engine]
+    corpus = SyntheticCorpus(vocab_size=args.vocab, zipf_s=args.zipf, seed=args.seed)
+    queries = corpus.queries(args.queries)
+
+    print(f"Building a {args.docs}-document synthetic corpus in {workspace}...")
+    build = build_workspace(workspace, corpus, args.docs, engines)
+
+    # Engines resolve offline_data/, faiss_store/ and offline/ir_project.db relative to the working directory
+    os.chdir(workspace)
+    print(f"Measuring {len(queries)} queries...")
+    parts = measure(queries, engines)
+
+    commit = _git_commit()
+    result = {
+        "meta": {
+            "label": args.label or commit or "local",
+            "commit": commit,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "corpus": {"docs": args.docs, "queries": args.queries, "vocab_size": args.vocab,
+                   "zipf_s": args.zipf, "seed": args.seed},
+        "build_seconds": build,
+        "parts": parts,
+    }
+
+    out = Path(args.out) if args.out else RESULTS_DIR / f"{result['meta']['label']}.json"
+    out = out if out.is_absolute() else REPO_DIR / out
+    os.makedirs(out.parent, exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+
+    print(f"{'part':<16}{'n':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'q/s':>10}")
+    for name, stats in parts.items():
+        print(f"{name:<16}{stats['n']:>6}{stats['p50_ms']:>10.3f}{stats['p95_ms']:>10.3f}"
+              f"{stats['p99_ms']:>10.3f}{stats['qps']:>10.1f}")
+    print(f"Results written to {out}")
+
+
+# --- Compare ---
+def compare(args):
+    """Prints the change of every part between two result files; exits 1 on a regression."""
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.candidate, encoding="utf-8") as f:
+        candidate = json.load(f)
+    if baseline.get("corpus") != candidate.get("corpus"):
+        print(f"Warning: different corpora ({baseline.get('corpus')} vs {candidate.get('corpus')}).")
+
+    rows = [(f"build:{name}", {"p50_ms": seconds * 1000}, {"p50_ms": candidate["build_seconds"][name] * 1000})
+            for name, seconds in baseline["build_seconds"].items() if name in candidate["build_seconds"]]
+    rows += [(name, stats, candidate["parts"][name])
+             for name, stats in baseline["parts"].items() if name in candidate["parts"]]
+
+    print(f"{baseline['meta']['label']} -> {candidate['meta']['label']}")
+    print(f"{'part':<18}{'p50 before':>12}{'p50 after':>12}{'change':>9}{'p95 change':>12}")
+    regressions = []
+    for name, before, after in rows:
+        change = after["p50_ms"] / before["p50_ms"] - 1 if before["p50_ms"] else 0.0
+        p95 = (f"{after['p95_ms'] / before['p95_ms'] - 1:+.1%}"
+               if before.get("p95_ms") and after.get("p95_ms") else "")
+        flag = ""
+        if change > args.threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print(f"{name:<18}{before['p50_ms']:>12.3f}{after['p50_ms']:>12.3f}{change:>+9.1%}{p95:>12}{flag}")
+
+    for name in sorted(set(baseline["parts"]) ^ set(candidate["parts"])):
+        print(f"{name:<18} only in {'baseline' if name in baseline['parts'] else 'candidate'}")
+    if regressions:
+        print(f"{len(regressions)} regression(s) above {args.threshold:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetic-corpus benchmarks of every engine and pipeline stage.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Build a synthetic corpus, measure every part, write JSON.")
+    run_parser.add_argument("--docs", type=int, default=20000)
+    run_parser.add_argument("--queries", type=int, default=300)
+    run_parser.add_argument("--vocab", type=int, default=20000)
+    run_parser.add_argument("--zipf", type=float, default=1.1, help="Zipf exponent of the word frequencies.")
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--engines", default="tfidf,bm25,fts,bert")
+    run_parser.add_argument("--workspace", default=str(DEFAULT_WORKSPACE))
+    run_parser.add_argument("--label", help="Name of the run (default: the current commit).")
+    run_parser.add_argument("--out", help="Result file (default: benchmarks/results/<label>.json).")
+    run_parser.set_defaults(func=run)
+
+    compare_parser = commands.add_parser("compare", help="Compare two result files.")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("candidate")
+    compare_parser.add_argument("--threshold", type=float, default=0.10,
+                                help="Relative p50 slowdown reported as a regression (default 0.10).")
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+# benchmarks/fts_vs_bm25.py
+#
+# Compares the SQLite FTS5 engine with the memory-mapped BM25 engine on latency and memory.
+# Each engine runs in a fresh process so its RSS is measured in isolation.
+#
+#     python -m benchmarks.fts_vs_bm25 --dataset quora --queries 500
+
+import argparse
+import multiprocessing
+import random
+import sqlite3
+import statistics
+import time
+
+from services.database_utils import DB_PATH
+from services.memory_report import memory_report
+
+
+def sample_queries(dataset, count, seed=0):
+    """Builds queries from the first words of randomly chosen documents."""
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        texts = [row[0] for row in conn.execute(
+            f"SELECT doc FROM `{dataset}` ORDER BY random() LIMIT ?", (count * 2,)
+        )]
+    finally:
+        conn.close()
+    rng = random.Random(seed)
+    queries = [" ".join(text.split()[:rng.randint(2, 8)]) for text in texts if text.strip()]
+    return queries[:count]
+
+
+def _run_engine(engine, dataset, queries, result_queue):
+    # Imported here so the parent process never loads either engine
+    from services.search_service import _get_search_service
+
+    before = memory_report()
+    start = time.perf_counter()
+    service = _get_search_service(engine, dataset)
+    load_seconds = time.perf_counter() - start
+    after_load = memory_report()
+
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        service.execute_search(query)
+        latencies.append((time.perf_counter() - start) * 1000)
+    after_queries = memory_report()
+
+    result_queue.put({
+        "engine": engine,
+        "load_ms": load_seconds * 1000,
+        "p50_ms": statistics.median(latencies),
+        "p95_ms": statistics.quantiles(latencies, n=20)[-1],
+        "mean_ms": statistics.fmean(latencies),
+        "rss_load_mb": after_load.get("rss_mb", 0) - before.get("rss_mb", 0),
+        "rss_total_mb": after_queries.get("rss_mb", 0),
+        "private_mb": after_queries.get("private_mb", 0),
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare FTS5 and BM25 latency and memory.")
+    parser.add_argument("--dataset", default="quora")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--engines", default="bm25,fts")
+    args = parser.parse_args()
+
+    queries = sample_queries(args.dataset, args.queries)
+    print(f"Running {len(queries)} queries against '{args.dataset}'...")
+
+    results = []
+    for engine in args.engines.split(","):
+        result_queue = multiprocessing.Queue()
+        process = multiprocessing.Process(target=_run_engine, args=(engine, args.dataset, queries, result_queue))
+        process.start()
+        results.append(result_queue.get())
+        process.join()
+
+    header = f"{'engine':<8}{'load ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'mean ms':>10}{'+RSS MB':>10}{'RSS MB':>10}{'private MB':>12}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(f"{r['engine']:<8}{r['load_ms']:>10.1f}{r['p50_ms']:>10.2f}{r['p95_ms']:>10.2f}{r['mean_ms']:>10.2f}"
+              f"{r['rss_load_mb']:>10.1f}{r['rss_total_mb']:>10.1f}{r['private_mb']:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
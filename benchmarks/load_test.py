@@ -0,0 +1,256 @@
+# benchmarks/load_test.py
+#
+# Open-loop HTTP load test of a locally started api.main_api:app, per worker count:
+#   - starts the app with gunicorn.conf.py (uvicorn --workers if gunicorn is missing), with the
+#     Cohere model replaced by the deterministic stub (IR_CHAT_MODEL=stub, RAG/stub_llm.py)
+#   - for every endpoint, ramps the arrival rate step by step; requests are sent on schedule
+#     whether or not earlier ones have finished, and latency counts from the scheduled send
+#     time, so a saturated server shows up as growing latency instead of a slower client
+#   - reports p50/p95/p99, error rate and achieved q/s per step, and the saturation point:
+#     the highest rate that met the SLO (p99, error rate, achieved >= 90% of sent)
+#
+#     python -m benchmarks.load_test --endpoints bm25,hybrid,chat --workers 1,2,4 --rates 5,10,20,40,80
+#     python -m benchmarks.load_test --url http://127.0.0.1:8000 --endpoints bm25   # already running server
+
+import argparse
+import asyncio
+import importlib.util
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+RESULTS_DIR = REPO_DIR / "benchmarks" / "results"
+
+# name -> (path, payload builder)
+ENDPOINTS = {
+    "tfidf": ("/api/search/tfidf", lambda q, ds: {"query": q, "dataset": ds}),
+    "bm25": ("/api/search/bm25", lambda q, ds: {"query": q, "dataset": ds}),
+    "bert": ("/api/search/bert", lambda q, ds: {"query": q, "dataset": ds}),
+    "fts": ("/api/search/fts", lambda q, ds: {"query": q, "dataset": ds}),
+    "rerank": ("/api/search/rerank", lambda q, ds: {"query": q, "dataset": ds}),
+    "hybrid": ("/api/search/hybrid", lambda q, ds: {"query": q, "dataset": ds}),
+    "refine": ("/api/refineQuery/", lambda q, ds: {"query": q}),
+    "chat": ("/api/chat/", lambda q, ds: {"question": q}),
+}
+
+FALLBACK_QUERIES = [
+    "how to make my car faster", "why is the sky blue", "best way to learn python",
+    "what causes headaches", "how do airplanes fly", "is coffee bad for you",
+    "how to lose weight fast", "what is machine learning", "why do cats purr",
+    "how to save money", "what is the meaning of life", "how does the stock market work",
+]
+
+
+def load_queries(dataset, count):
+    """Document-derived queries when the local database is available, else a fixed list."""
+    try:
+        from benchmarks.fts_vs_bm25 import sample_queries
+        queries = sample_queries(dataset, count)
+        if queries:
+            return queries
+    except Exception as e:
+        print(f"Using built-in queries ({e}).")
+    return FALLBACK_QUERIES
+
+
+# --- Server ---
+def start_server(workers, port, args):
+    env = dict(os.environ)
+    env.update({
+        "WEB_CONCURRENCY": str(workers),
+        "IR_BIND": f"127.0.0.1:{port}",
+        "IR_CHAT_MODEL": "stub",
+        "IR_STUB_LLM_LATENCY_MS": str(args.llm_latency_ms),
+        "IR_STUB_LLM_JITTER_MS": str(args.llm_jitter_ms),
+        "IR_QUERY_LOG": "0",  # load-test traffic must not skew the popular-query log
+    })
+    if not args.chat_cache:
+        env["CHAT_CACHE_THRESHOLD"] = "2"  # cosine never reaches 2: every chat runs retrieval and the LLM
+
+    if importlib.util.find_spec("gunicorn") is not None:
+        command = [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "api.main_api:app"]
+    else:
+        command = [sys.executable, "-m", "uvicorn", "api.main_api:app", "--host", "127.0.0.1",
+                   "--port", str(port), "--workers", str(workers)]
+    log = open(RESULTS_DIR / f"load_server_{workers}w.log", "w", encoding="utf-8")
+    process = subprocess.Popen(command, cwd=REPO_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+    process.log = log
+    return process
+
+
+def wait_ready(base_url, process, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode}; see benchmarks/results/load_server_*.log")
+        try:
+            if httpx.get(f"{base_url}/metrics", timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(1)
+    raise TimeoutError(f"Server at {base_url} not ready after {timeout}s.")
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+    process.log.close()
+
+
+# --- Load generation ---
+def _percentile(ordered, fraction):
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * fraction))], 2) if ordered else None
+
+
+async def run_step(client, base_url, endpoint, dataset, queries, rate, duration, arrivals, seed):
+    """Sends rate * duration requests on an open-loop schedule; returns the step's statistics."""
+    path, payload = ENDPOINTS[endpoint]
+    rng = random.Random(seed)
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+
+    async def one(scheduled, query):
+        try:
+            response = await client.post(f"{base_url}{path}", json=payload(query, dataset))
+            ok = response.status_code == 200
+        except httpx.HTTPError:
+            ok = False
+        return ok, (loop.time() - scheduled) * 1000, loop.time()
+
+    tasks, scheduled = [], start
+    for i in range(max(1, int(rate * duration))):
+        delay = scheduled - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(one(scheduled, queries[i % len(queries)])))
+        scheduled += rng.expovariate(rate) if arrivals == "poisson" else 1 / rate
+    outcomes = await asyncio.gather(*tasks)
+
+    latencies = sorted(latency for ok, latency, _ in outcomes if ok)
+    errors = sum(1 for ok, _, _ in outcomes if not ok)
+    # Poisson arrivals only average `rate`; compare completions with what was actually sent
+    sent_window = scheduled - start
+    elapsed = max(finished for _, _, finished in outcomes) - start
+    return {
+        "offered_qps": rate,
+        "sent_qps": round(len(outcomes) / sent_window, 2),
+        "achieved_qps": round(len(latencies) / max(elapsed, sent_window), 2),
+        "requests": len(outcomes),
+        "error_rate": round(errors / len(outcomes), 4),
+        "p50_ms": _percentile(latencies, 0.50),
+        "p95_ms": _percentile(latencies, 0.95),
+        "p99_ms": _percentile(latencies, 0.99),
+    }
+
+
+def meets_slo(step, args):
+    return (step["error_rate"] <= args.max_error_rate
+            and step["p99_ms"] is not None and step["p99_ms"] <= args.slo_p99_ms
+            and step["achieved_qps"] >= 0.9 * step["sent_qps"])
+
+
+async def ramp_endpoint(base_url, endpoint, queries, args):
+    """Runs the rate steps in order until one misses the SLO; returns (steps, saturation)."""
+    limits = httpx.Limits(max_connections=args.max_connections, max_keepalive_connections=args.max_connections)
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+        # A few sequential requests load the engines and fill caches before measuring
+        path, payload = ENDPOINTS[endpoint]
+        for query in queries[:args.warmup]:
+            try:
+                await client.post(f"{base_url}{path}", json=payload(query, args.dataset))
+            except httpx.HTTPError:
+                pass
+
+        steps, sustained = [], None
+        for i, rate in enumerate(args.rates):
+            step = await run_step(client, base_url, endpoint, args.dataset, queries, rate,
+                                  args.duration, args.arrivals, args.seed + i)
+            step["meets_slo"] = meets_slo(step, args)
+            steps.append(step)
+            p99 = f"{step['p99_ms']:.0f}" if step["p99_ms"] is not None else "-"
+            print(f"  {endpoint:<8}{rate:>8.1f} q/s offered {step['achieved_qps']:>8.1f} achieved  "
+                  f"p99 {p99:>6} ms  errors {step['error_rate']:.1%}{'' if step['meets_slo'] else '  <- saturated'}")
+            if not step["meets_slo"]:
+                break
+            sustained = step
+    return steps, sustained
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Open-loop load test of the API with a stub LLM.")
+    parser.add_argument("--endpoints", default="bm25,hybrid,refine,chat",
+                        help=f"Comma list of: {', '.join(ENDPOINTS)}")
+    parser.add_argument("--workers", default="1,2,4", help="Worker counts to test (ignored with --url).")
+    parser.add_argument("--rates", default="5,10,20,40,80,160", help="Arrival rates (q/s) to ramp through.")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per rate step.")
+    parser.add_argument("--arrivals", choices=["poisson", "uniform"], default="poisson")
+    parser.add_argument("--dataset", default="antique")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--slo-p99-ms", type=float, default=1000.0)
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--max-connections", type=int, default=1000)
+    parser.add_argument("--llm-latency-ms", type=float, default=300.0)
+    parser.add_argument("--llm-jitter-ms", type=float, default=100.0)
+    parser.add_argument("--chat-cache", action="store_true", help="Keep the semantic answer cache enabled.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--startup-timeout", type=float, default=600.0)
+    parser.add_argument("--url", help="Test this running server instead of starting one.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="Result file (default: benchmarks/results/load_<timestamp>.json).")
+    args = parser.parse_args()
+    args.rates = [float(rate) for rate in args.rates.split(",")]
+    endpoints = [endpoint for endpoint in args.endpoints.split(",") if endpoint]
+    unknown = set(endpoints) - set(ENDPOINTS)
+    if unknown:
+        parser.error(f"unknown endpoint(s): {', '.join(sorted(unknown))}")
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    queries = load_queries(args.dataset, args.queries)
+    worker_counts = ["external"] if args.url else [int(w) for w in args.workers.split(",")]
+
+    report = {"args": {k: v for k, v in vars(args).items() if k != "out"}, "runs": {}}
+    for workers in worker_counts:
+        process = None
+        base_url = args.url.rstrip("/") if args.url else f"http://127.0.0.1:{args.port}"
+        if not args.url:
+            print(f"Starting the API with {workers} worker(s)...")
+            process = start_server(workers, args.port, args)
+        try:
+            wait_ready(base_url, process, args.startup_timeout)
+            run = {}
+            for endpoint in endpoints:
+                steps, sustained = asyncio.run(ramp_endpoint(base_url, endpoint, queries, args))
+                run[endpoint] = {"steps": steps, "saturation_qps": sustained["offered_qps"] if sustained else None,
+                                 "p99_ms_at_saturation": sustained["p99_ms"] if sustained else None}
+            report["runs"][str(workers)] = run
+        finally:
+            if process is not None:
+                stop_server(process)
+
+    print(f"\nHighest arrival rate meeting p99 <= {args.slo_p99_ms:.0f} ms and errors <= {args.max_error_rate:.0%}:")
+    print(f"{'workers':<10}" + "".join(f"{endpoint:>12}" for endpoint in endpoints))
+    for workers, run in report["runs"].items():
+        cells = [run[endpoint]["saturation_qps"] for endpoint in endpoints]
+        print(f"{workers:<10}" + "".join(f"{cell:>12.1f}" if cell is not None else f"{'< min':>12}" for cell in cells))
+
+    out = Path(args.out) if args.out else RESULTS_DIR / f"load_{time.strftime('%Y%m%d-%H%M%S')}.json"
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+# benchmarks/synthetic_corpus.py
+#
+# Reproducible synthetic corpora for the benchmark suite: word frequencies follow a Zipf law
+# like natural text, so postings lengths, vocabulary growth and query selectivity behave like
+# the real datasets at any size, without needing the ANTIQUE / Quora files.
+
+import os
+import sqlite3
+from pathlib import Path
+
+import numpy as np
+
+# The most frequent ranks are real stopwords, so preprocessing has something to remove
+STOPWORDS = ["the", "of", "and", "to", "a", "in", "is", "it", "you", "that", "for", "on", "with", "as", "are"]
+SYLLABLES = ["ka", "lo", "mi", "ne", "ru", "sa", "ti", "vo", "ze", "pa", "qui", "dor", "len", "mar", "sol",
+             "tra", "ven", "gil", "bro", "nix", "pel", "cor", "dan", "fu", "hy"]
+
+
+class SyntheticCorpus:
+    """
+    Zipfian vocabulary of `vocab_size` pseudo-words: the word of rank r is drawn with
+    probability proportional to 1 / r**zipf_s. Everything is derived from `seed`.
+    """
+
+    def __init__(self, vocab_size=20000, zipf_s=1.1, seed=0):
+        self.rng = np.random.default_rng(seed)
+        self.vocabulary = self._words(vocab_size)
+        weights = 1.0 / np.arange(1, vocab_size + 1) ** zipf_s
+        self.cumulative = np.cumsum(weights / weights.sum())
+
+    def _words(self, size):
+        words, seen = list(STOPWORDS[:size]), set(STOPWORDS)
+        while len(words) < size:
+            syllables = self.rng.choice(SYLLABLES, size=self.rng.integers(2, 5))
+            word = "".join(syllables)
+            if word not in seen:
+                seen.add(word)
+                words.append(word)
+        return words
+
+    def _sample(self, count):
+        ranks = np.searchsorted(self.cumulative, self.rng.random(count))
+        return [self.vocabulary[min(rank, len(self.vocabulary) - 1)] for rank in ranks]
+
+    def documents(self, n_docs, min_length=10, max_length=120):
+        """Returns {doc_id: text} with document lengths uniform in [min_length, max_length]."""
+        lengths = self.rng.integers(min_length, max_length + 1, size=n_docs)
+        words = self._sample(int(lengths.sum()))
+        docs, start = {}, 0
+        for i, length in enumerate(lengths):
+            docs[f"syn{i:08d}"] = " ".join(words[start:start + length])
+            start += length
+        return docs
+
+    def queries(self, count, min_length=2, max_length=6):
+        """Returns `count` queries drawn from the same distribution as the documents."""
+        lengths = self.rng.integers(min_length, max_length + 1, size=count)
+        return [" ".join(self._sample(int(length))) for length in lengths]
+
+
+def write_database(db_path, table, documents):
+    """Loads `documents` into `table` of a fresh ir_project.db with the real database builder (+ FTS5)."""
+    from offline.database_builder import create_table, insert_documents
+    from offline.fts_service import build_fts_index
+
+    os.makedirs(Path(db_path).parent, exist_ok=True)
+    conn = sqlite3.connect(db_path)
+    try:
+        create_table(conn, table)
+        insert_documents(conn, table, documents)
+        build_fts_index(conn, table)
+    finally:
+        conn.close()
@@ -1,7 +1,8 @@
-# dataPipline.py (Hardcoded Paths)
+# dataPipline.py
 
 import sqlite3
-import pandas as pd
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
 from sentence_transformers import SentenceTransformer
 import faiss
 import numpy as np
@@ -9,85 +10,144 @@ import os
 from pathlib import Path
 import joblib
 
-from services.preprocessing_service import preprocess
-
-DB_PATH = Path("C:/Users/Lenovo/Desktop/5th/second simester/IR/IR_PROJECT/offline/ir_project.db")
-FAISS_STORE = Path("C:/Users/Lenovo/Desktop/5th/second simester/IR/IR_PROJECT/offline_data")
-
-os.makedirs(FAISS_STORE, exist_ok=True)
+BASE_DIR = Path(__file__).parent
+DB_PATH = BASE_DIR / "offline" / "ir_project.db"
+FAISS_STORE = BASE_DIR / "offline_data"
+
+DATABASE_TABLES = ["antique", "quora"]
+
+# --- Vocabulary settings ---
+CHUNK_SIZE = 5000          # documents per worker task
+MIN_DF = 2                 # drop words seen in fewer documents (mostly typos and ids)
+MAX_VOCABULARY_SIZE = 100_000
+ENCODE_BATCH_SIZE = 256
+WORKERS = max(1, (os.cpu_count() or 2) - 1)
+
+# --- Streaming document reader ---
+def iter_document_chunks(db_path=DB_PATH, tables=DATABASE_TABLES, chunk_size=CHUNK_SIZE):
+    """
+    Yields lists of `processed_doc` strings straight from SQLite, `chunk_size` at a time.
+    processed_doc already holds the output of services.preprocessing_service.preprocess
+    (database_builder runs the same pipeline), so nothing is preprocessed again here.
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        for table_name in tables:
+            print(f"Streaming documents from table: {table_name}...")
+            cursor = conn.execute(f"SELECT processed_doc FROM {table_name}")
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield [row[0] or "" for row in rows]
+    finally:
+        conn.close()
 
-DATABASE_TABLES = ["antique", "quora"] 
+def count_chunk(documents):
+    """Term and document frequencies of one chunk (runs in a worker process)."""
+    term_freqs = Counter()
+    doc_freqs = Counter()
+    for document in documents:
+        words = document.split()
+        term_freqs.update(words)
+        doc_freqs.update(set(words))
+    return term_freqs, doc_freqs, len(documents)
+
+def count_frequencies(chunks, workers=WORKERS):
+    """
+    Counts term/document frequencies of all chunks in parallel and merges them.
+    At most 2 * workers chunks are in flight, so memory stays bounded by the
+    vocabulary size rather than the corpus size.
+    """
+    term_freqs = Counter()
+    doc_freqs = Counter()
+    total_docs = 0
+
+    def merge(future):
+        nonlocal total_docs
+        chunk_tf, chunk_df, chunk_docs = future.result()
+        term_freqs.update(chunk_tf)
+        doc_freqs.update(chunk_df)
+        total_docs += chunk_docs
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        in_flight = set()
+        for chunk in chunks:
+            if len(in_flight) >= 2 * workers:
+                finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    merge(future)
+            in_flight.add(executor.submit(count_chunk, chunk))
+        for future in in_flight:
+            merge(future)
+
+    return term_freqs, doc_freqs, total_docs
+
+def prune_vocabulary(doc_freqs, min_df=MIN_DF, max_size=MAX_VOCABULARY_SIZE):
+    """Keeps words with df >= min_df, at most `max_size` of them by descending df; sorted."""
+    kept = [(word, df) for word, df in doc_freqs.items() if df >= min_df]
+    if max_size and len(kept) > max_size:
+        kept.sort(key=lambda item: (-item[1], item[0]))
+        kept = kept[:max_size]
+    return sorted(word for word, _ in kept)
 
 # --- Main Vocabulary Preparation Logic ---
-def prepare_general_vocabulary_and_faiss_index():
+def prepare_general_vocabulary_and_faiss_index(min_df=MIN_DF, max_size=MAX_VOCABULARY_SIZE):
+    os.makedirs(FAISS_STORE, exist_ok=True)
     if not DB_PATH.exists():
         print(f"Error: Database not found at {DB_PATH}. Please ensure 'ir_project.db' exists.")
         return
 
-    all_document_texts = []
-    print(f"Connecting to database: {DB_PATH}")
-
+    # --- Step 1: Count term and document frequencies over all documents ---
+    print(f"Counting word frequencies from {DB_PATH} with {WORKERS} workers...")
     try:
-        conn = sqlite3.connect(DB_PATH)
-        for table_name in DATABASE_TABLES:
-            print(f"Reading documents from table: {table_name}...")
-            df = pd.read_sql(f"SELECT doc FROM {table_name}", conn)
-            all_document_texts.extend(df["doc"].tolist())
-            print(f"  - Added {len(df)} documents from {table_name}.")
-        conn.close()
-        print(f"Total documents loaded from database: {len(all_document_texts)}")
-
+        term_freqs, doc_freqs, total_docs = count_frequencies(iter_document_chunks())
     except sqlite3.Error as e:
         print(f"Database error: {e}")
         return
-    except Exception as e:
-        print(f"An unexpected error occurred while loading documents: {e}")
-        return
 
-    if not all_document_texts:
-        print("No documents loaded. Cannot create vocabulary.")
+    print(f"Total documents read: {total_docs}; distinct words: {len(doc_freqs)}")
+    if not doc_freqs:
+        print("No words collected. Cannot create vocabulary.")
         return
 
-    # --- Step 1: Preprocess all documents and collect unique words ---
-    all_unique_words = set()
-    print("Preprocessing all documents and collecting unique words...")
-    for doc_text in all_document_texts:
-        preprocessed_text = preprocess(doc_text)
-        if preprocessed_text:
-            for word in preprocessed_text.split():
-                all_unique_words.add(word)
-
-    vocabulary_words = sorted(list(all_unique_words))
-    print(f"\nTotal unique words for vocabulary: {len(vocabulary_words)}")
+    # --- Step 2: Prune rare words before paying for their embeddings ---
+    vocabulary_words = prune_vocabulary(doc_freqs, min_df=min_df, max_size=max_size)
+    print(f"\nVocabulary after pruning (min_df={min_df}, max_size={max_size}): {len(vocabulary_words)} words")
 
     if not vocabulary_words:
-        print("No unique words collected after preprocessing. Cannot create embeddings/FAISS index.")
+        print("No words left after pruning. Cannot create embeddings/FAISS index.")
         return
 
-    # --- Step 2: Encode the vocabulary words using SentenceTransformer ---
+    # --- Step 3: Encode the vocabulary words using SentenceTransformer ---
     print("Loading SentenceTransformer model for encoding...")
     model = SentenceTransformer("all-MiniLM-L6-v2")
     print(f"Encoding {len(vocabulary_words)} vocabulary words...")
-    vocabulary_embeddings = model.encode(vocabulary_words, batch_size=64, convert_to_tensor=False)
+    vocabulary_embeddings = model.encode(vocabulary_words, batch_size=ENCODE_BATCH_SIZE, convert_to_tensor=False)
     vocabulary_embeddings = np.array(vocabulary_embeddings).astype("float32")
     print("Encoding complete.")
 
-    # --- Step 3: Build a FAISS index ---
+    # --- Step 4: Build a FAISS index ---
     print("Building FAISS index...")
     dimension = vocabulary_embeddings.shape[1]
     index = faiss.IndexFlatL2(dimension)
     index.add(vocabulary_embeddings)
     print(f"FAISS index built with {index.ntotal} vectors.")
 
-    # --- Step 4: Save the vocabulary and FAISS index ---
+    # --- Step 5: Save the vocabulary, its frequencies and the FAISS index ---
     VOCAB_FILE_PATH = FAISS_STORE / "general_semantic_vocabulary.joblib"
+    FREQS_FILE_PATH = FAISS_STORE / "general_semantic_vocabulary_freqs.npz"
     FAISS_INDEX_PATH = FAISS_STORE / "general_semantic_vocabulary.faiss"
 
     print(f"Saving vocabulary to: {VOCAB_FILE_PATH}")
     joblib.dump(vocabulary_words, VOCAB_FILE_PATH)
+    np.savez(FREQS_FILE_PATH,
+             df=np.array([doc_freqs[word] for word in vocabulary_words], dtype="int64"),
+             tf=np.array([term_freqs[word] for word in vocabulary_words], dtype="int64"),
+             total_docs=np.int64(total_docs))
     print(f"Saving FAISS index to: {FAISS_INDEX_PATH}")
     faiss.write_index(index, str(FAISS_INDEX_PATH))
     print("Vocabulary and FAISS index saved successfully!")
 
 if __name__ == "__main__":
-    prepare_general_vocabulary_and_faiss_index()
\ No newline at end of file
+    prepare_general_vocabulary_and_faiss_index()
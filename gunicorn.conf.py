@@ -0,0 +1,37 @@
+# gunicorn.conf.py
+#
+# Multi-worker deployment with shared read-only index memory:
+#
+#     gunicorn -c gunicorn.conf.py api.main_api:app
+#
+# The app is imported once in the master (preload_app) with IR_PRELOAD=all, which opens every
+# engine before the fork. BM25/TF-IDF arrays, doc-id arrays and FAISS indexes are memory-mapped
+# read-only, so all workers share one physical copy through the page cache; the SentenceTransformer
+# weights are inherited copy-on-write. Each worker prints its shared vs private RSS on startup.
+
+#
+# Metrics: each worker keeps its own stage histograms, so a scrape of /metrics would only see the
+# worker that happened to answer it. PROMETHEUS_MULTIPROC_DIR makes every worker write its
+# histograms to that directory and /metrics serve their sum (services/metrics.py); the directory is
+# emptied here, once per master start. Observations from other workers show up within a second.
+
+import os
+import shutil
+import tempfile
+
+from services.memory_report import memory_report, format_memory_report
+
+os.environ.setdefault("IR_PRELOAD", "all")
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "ir_metrics"))
+# Before the app (and services.metrics) is imported, so the master's preload warmup counts too
+shutil.rmtree(os.environ["PROMETHEUS_MULTIPROC_DIR"], ignore_errors=True)
+
+bind = os.getenv("IR_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", "4"))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+timeout = 120
+
+
+def when_ready(server):
+    server.log.info(format_memory_report(memory_report(), label="master"))
@@ -4,16 +4,25 @@ from sentence_transformers import SentenceTransformer
 import faiss
 import numpy as np
 import os
+import sys
+import json
 from pathlib import Path
 
 BASE_DIR = Path(__file__).parent.parent
 DATA_DIR = BASE_DIR / "offline"
 FAISS_STORE = BASE_DIR / "faiss_store"
 
-def process_bert(table_name):
-    db_path = DATA_DIR / "ir_project.db" 
+sys.path.append(str(BASE_DIR))
+from services.database_utils import indexed_docs_query
+from services.doc_id_table import write_doc_id_table
+from offline.shard_config import shard_count
+from services.array_utils import shard_row_offsets, shard_dir_name
+from services.artifacts import publish_directory
+
+def process_bert(table_name, num_shards=None, db_path=DATA_DIR / "ir_project.db", store_dir=FAISS_STORE):
     conn = sqlite3.connect(db_path)
-    df = pd.read_sql(f"SELECT doc_id, doc FROM {table_name}", conn)
+    # One representative per near-duplicate cluster when offline/dedup_service.py has run
+    df = pd.read_sql(indexed_docs_query(conn, table_name, "doc_id, doc"), conn)
     conn.close()
 
     model = SentenceTransformer("all-MiniLM-L6-v2")
@@ -23,9 +32,27 @@ def process_bert(table_name):
     index = faiss.IndexFlatL2(embeddings.shape[1])
     index.add(embeddings)
 
-    store_path = FAISS_STORE / table_name
-    os.makedirs(store_path, exist_ok=True)
-    faiss.write_index(index, str(store_path / "index.faiss"))
+    # Published as a new version, never over the files a running API has mapped
+    with publish_directory(Path(store_dir) / table_name) as store_path:
+        faiss.write_index(index, str(store_path / "index.faiss"))
+        # Raw vectors by row, memory-mapped by RerankSearch to re-score lexical candidates
+        np.save(store_path / "embeddings.npy", embeddings)
+        # Row -> doc_id table in the order the vectors were added; BertSearch checks it against index.ntotal
+        table = write_doc_id_table(store_path, df["doc_id"].tolist())
+        with open(store_path / "meta.json", "w", encoding="utf-8") as f:
+            json.dump({"n_docs": len(embeddings), "doc_ids_fingerprint": table["fingerprint"]}, f, indent=2)
+
+        # Per-shard indexes over contiguous row ranges for parallel scatter-gather search.
+        # index.faiss above stays the complete index used by the RAG retriever.
+        num_shards = num_shards or shard_count(table_name)
+        if num_shards > 1:
+            row_offsets = shard_row_offsets(len(embeddings), num_shards)
+            for shard in range(len(row_offsets) - 1):
+                shard_index = faiss.IndexFlatL2(embeddings.shape[1])
+                shard_index.add(embeddings[row_offsets[shard]:row_offsets[shard + 1]])
+                faiss.write_index(shard_index, str(store_path / f"{shard_dir_name(shard)}.faiss"))
+            with open(store_path / "shards.json", "w", encoding="utf-8") as f:
+                json.dump({"num_shards": len(row_offsets) - 1, "row_offsets": row_offsets}, f, indent=2)
 
 if __name__ == "__main__":
     process_bert("antique")
@@ -1,29 +1,46 @@
 import sqlite3
 import pandas as pd
-import joblib
-from rank_bm25 import BM25Okapi
 import os
+import sys
 from pathlib import Path
 
 BASE_DIR = Path(__file__).parent.parent  
 DATA_DIR = BASE_DIR / "offline"
+OUTPUT_DIR = BASE_DIR / "offline_data"
 
+sys.path.append(str(BASE_DIR))
+from services.database_utils import indexed_docs_query
+from services.bm25_index import write_bm25_index
+from services.positional_index import write_positional_index
+from services.artifacts import publish_directory
+from offline.shard_config import shard_count, WRITE_POSITIONS
 
-def process_bm25(table_name):
-    path = DATA_DIR / "ir_project.db" 
-    conn = sqlite3.connect(path)
-    df = pd.read_sql(f"SELECT doc_id, processed_doc FROM {table_name}", conn)
+
+def process_bm25(table_name, num_shards=None, positions=WRITE_POSITIONS,
+                 db_path=DATA_DIR / "ir_project.db", output_dir=OUTPUT_DIR):
+    conn = sqlite3.connect(db_path)
+    # One representative per near-duplicate cluster when offline/dedup_service.py has run
+    df = pd.read_sql(indexed_docs_query(conn, table_name, "doc_id, processed_doc"), conn)
     conn.close()
 
     tokenized = [doc.split() for doc in df["processed_doc"]]
-    bm25 = BM25Okapi(tokenized)
-
-    os.makedirs("offline_data", exist_ok=True)
-    joblib.dump({
-        "doc_ids": df["doc_id"].tolist(),
-        "bm25": bm25,
-        "tokenized_docs": tokenized
-    }, f"offline_data/bm25_{table_name}.joblib")
+
+    # Columnar, memory-mappable index instead of a pickled BM25Okapi + tokenized_docs
+    output_dir = Path(output_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    num_shards = num_shards or shard_count(table_name)
+    # The row -> doc_id table is written next to the index, in the order the rows were indexed.
+    # Published as a new version, never over the files a running API has mapped.
+    with publish_directory(output_dir / f"bm25_{table_name}") as staging:
+        meta = write_bm25_index(staging, tokenized, num_shards=num_shards, doc_ids=df["doc_id"].tolist())
+    print(f"BM25 index for '{table_name}': {meta['n_docs']} docs, {meta['n_terms']} terms, "
+          f"{meta['n_postings']} postings, {meta['num_shards']} shard(s).")
+
+    if positions:
+        with publish_directory(output_dir / f"positions_{table_name}") as staging:
+            meta = write_positional_index(staging, tokenized, doc_ids=df["doc_id"].tolist())
+        print(f"Positional index for '{table_name}': {meta['n_positions']} positions "
+              f"({meta['positions_dtype']} deltas) in {meta['n_postings']} postings.")
 
 if __name__ == "__main__":
     process_bm25("antique")
@@ -0,0 +1,313 @@
+# offline/build.py
+#
+# One command for every offline artifact:
+#
+#     python -m offline.build                      # build whatever is out of date
+#     python -m offline.build --tables quora       # only quora's stages (+ the shared ones they feed)
+#     python -m offline.build --force bm25:quora   # rebuild a stage even if nothing changed
+#
+# The stages form a dependency graph. Each stage's fingerprint hashes the content of its
+# inputs (source files or SQLite table rows), its parameters and the source code of the
+# modules that build it. The fingerprint is stored in offline_data/manifests/<stage>.json
+# and the stage is skipped when it is unchanged. Stages whose dependencies are done run in
+# parallel, each in a fresh process so its wall time and peak RSS can be reported.
+
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+
+BASE_DIR = Path(__file__).parent.parent
+DB_PATH = BASE_DIR / "offline" / "ir_project.db"
+OFFLINE_DATA = BASE_DIR / "offline_data"
+FAISS_STORE = BASE_DIR / "faiss_store"
+MANIFEST_DIR = OFFLINE_DATA / "manifests"
+
+sys.path.append(str(BASE_DIR))
+from offline.shard_config import shard_count, WRITE_POSITIONS, DEDUP_TABLES, DEDUP_THRESHOLD
+from offline.suggest_service import QUERY_FILES
+from services.query_log import QUERY_LOG_PATH
+from services.database_utils import table_fingerprint, DOCSTORE_COLUMNS
+
+TABLES = ["antique", "quora"]
+
+
+@dataclass
+class Stage:
+    name: str
+    target: str                                          # "module:function" run in a fresh process
+    args: tuple = ()
+    deps: list = field(default_factory=list)             # names of stages that must finish first
+    input_files: list = field(default_factory=list)      # files whose content is hashed
+    input_tables: list = field(default_factory=list)     # (table, columns) whose rows are hashed
+    code: list = field(default_factory=list)             # source files whose content is hashed
+    params: dict = field(default_factory=dict)
+    outputs: list = field(default_factory=list)          # must exist for a skip to be valid
+    resources: tuple = ()                                # stages sharing a resource never overlap
+
+
+# --- Stage graph ---
+def build_stages(tables):
+    stages = []
+    source_files = {
+        "antique": BASE_DIR / "data" / "antique" / "collection.txt",
+        "quora": BASE_DIR / "data" / "quora" / "corpus.jsonl",
+    }
+
+    for table in tables:
+        num_shards = shard_count(table)
+        # The index builders read one document per near-duplicate cluster once the dedup stage has run
+        index_deps, index_tables = [f"database:{table}"], []
+        if table in DEDUP_TABLES:
+            index_deps.append(f"dedup:{table}")
+            index_tables.append((f"{table}_dups", "doc_id, canonical_id"))
+        stages.append(Stage(
+            name=f"database:{table}",
+            target="offline.database_builder:build_table",
+            args=(table,),
+            input_files=[source_files[table]],
+            code=["offline/database_builder.py", "offline/fts_service.py"],
+            outputs=[DB_PATH],
+            resources=("sqlite-write",),
+        ))
+        if table in DEDUP_TABLES:
+            stages.append(Stage(
+                name=f"dedup:{table}",
+                target="offline.dedup_service:process_dedup",
+                args=(table, DEDUP_THRESHOLD),
+                deps=[f"database:{table}"],
+                input_tables=[(table, "doc_id, processed_doc")],
+                code=["offline/dedup_service.py"],
+                params={"threshold": DEDUP_THRESHOLD},
+                outputs=[OFFLINE_DATA / f"dedup_{table}.json"],
+                resources=("sqlite-write",),
+            ))
+        stages.append(Stage(
+            name=f"tfidf:{table}",
+            target="offline.tfidf_service:process_tfidf",
+            args=(table, num_shards),
+            deps=index_deps,
+            input_tables=[(table, "doc_id, processed_doc")] + index_tables,
+            code=["offline/tfidf_service.py", "services/tfidf_index.py", "services/term_table.py",
+                  "services/doc_id_table.py"],
+            params={"num_shards": num_shards},
+            outputs=[OFFLINE_DATA / f"tfidf_{table}" / "meta.json"],
+        ))
+        stages.append(Stage(
+            name=f"bm25:{table}",
+            target="offline.bm25_service:process_bm25",
+            args=(table, num_shards, WRITE_POSITIONS),
+            deps=index_deps,
+            input_tables=[(table, "doc_id, processed_doc")] + index_tables,
+            code=["offline/bm25_service.py", "services/bm25_index.py", "services/positional_index.py",
+                  "services/term_table.py", "services/doc_id_table.py"],
+            params={"num_shards": num_shards, "positions": WRITE_POSITIONS},
+            outputs=[OFFLINE_DATA / f"bm25_{table}" / "meta.json"]
+                    + ([OFFLINE_DATA / f"positions_{table}" / "meta.json"] if WRITE_POSITIONS else []),
+        ))
+        stages.append(Stage(
+            name=f"bert:{table}",
+            target="offline.bert_service:process_bert",
+            args=(table, num_shards),
+            deps=index_deps,
+            input_tables=[(table, "doc_id, doc")] + index_tables,
+            code=["offline/bert_service.py", "services/doc_id_table.py"],
+            params={"num_shards": num_shards, "model": "all-MiniLM-L6-v2"},
+            outputs=[FAISS_STORE / table / "index.faiss", FAISS_STORE / table / "embeddings.npy",
+                     FAISS_STORE / table / "meta.json"],
+        ))
+        stages.append(Stage(
+            name=f"docstore:{table}",
+            target="offline.docstore_service:process_docstore",
+            args=(table,),
+            deps=[f"database:{table}"],
+            input_tables=[(table, DOCSTORE_COLUMNS)],
+            code=["offline/docstore_service.py", "services/docstore.py", "services/term_table.py"],
+            outputs=[OFFLINE_DATA / f"docstore_{table}" / "meta.json"],
+        ))
+        query_inputs = [path for path in (QUERY_FILES[table], BASE_DIR / QUERY_LOG_PATH) if path.exists()]
+        stages.append(Stage(
+            name=f"suggest:{table}",
+            target="offline.suggest_service:process_suggest",
+            args=(table,),
+            deps=[f"database:{table}"],
+            input_files=query_inputs,
+            input_tables=[(table, "doc")],
+            code=["offline/suggest_service.py", "services/suggest_index.py", "services/term_table.py"],
+            outputs=[OFFLINE_DATA / f"suggest_{table}" / "meta.json"],
+        ))
+
+    if set(TABLES) <= set(tables):
+        stages.append(Stage(
+            name="vocabulary",
+            target="dataPipline:prepare_general_vocabulary_and_faiss_index",
+            deps=[f"database:{table}" for table in TABLES],
+            input_tables=[(table, "processed_doc") for table in TABLES],
+            code=["dataPipline.py"],
+            params={"model": "all-MiniLM-L6-v2"},
+            outputs=[OFFLINE_DATA / "general_semantic_vocabulary.faiss"],
+        ))
+    return stages
+
+
+# --- Fingerprints and manifests ---
+def _hash_file(path, digest):
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+
+def stage_fingerprint(stage):
+    """Combined hash of the stage's input files, input tables, parameters and code."""
+    parts = {"params": stage.params, "args": list(stage.args), "files": {}, "tables": {}, "code": {}}
+    for path in stage.input_files:
+        digest = hashlib.blake2b(digest_size=16)
+        _hash_file(path, digest)
+        parts["files"][str(Path(path).relative_to(BASE_DIR))] = digest.hexdigest()
+    for table, columns in stage.input_tables:
+        parts["tables"][f"{table}({columns})"] = table_fingerprint(table, columns, DB_PATH)
+    for path in stage.code:
+        digest = hashlib.blake2b(digest_size=16)
+        _hash_file(BASE_DIR / path, digest)
+        parts["code"][path] = digest.hexdigest()
+    combined = hashlib.blake2b(json.dumps(parts, sort_keys=True, default=str).encode("utf-8"), digest_size=16)
+    return combined.hexdigest(), parts
+
+def _manifest_path(stage):
+    return MANIFEST_DIR / f"{stage.name.replace(':', '_')}.json"
+
+def load_manifest(stage):
+    try:
+        with open(_manifest_path(stage), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def write_manifest(stage, fingerprint, inputs, result):
+    os.makedirs(MANIFEST_DIR, exist_ok=True)
+    manifest = {
+        "stage": stage.name,
+        "fingerprint": fingerprint,
+        "inputs": inputs,
+        "completed_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "wall_seconds": result["wall_seconds"],
+        "peak_rss_mb": result["peak_rss_mb"],
+    }
+    tmp_path = _manifest_path(stage).with_suffix(".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, _manifest_path(stage))
+
+
+# --- Execution ---
+def _run_stage(target, args):
+    """Runs in a fresh worker process; returns its wall time and peak RSS."""
+    os.chdir(BASE_DIR)
+    if str(BASE_DIR) not in sys.path:
+        sys.path.insert(0, str(BASE_DIR))
+    module_name, function_name = target.split(":")
+    start = time.perf_counter()
+    module = __import__(module_name, fromlist=[function_name])
+    getattr(module, function_name)(*args)
+    return {
+        "wall_seconds": time.perf_counter() - start,
+        # ru_maxrss is in kB on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+def run_build(stages, jobs, force=()):
+    by_name = {stage.name: stage for stage in stages}
+    pending = dict(by_name)
+    done, failed = set(), set()
+    running = {}  # future -> (stage, fingerprint, inputs)
+    busy_resources = set()
+    report = []
+
+    # One task per process (spawn): isolates stages and makes ru_maxrss a per-stage peak
+    executor = ProcessPoolExecutor(max_workers=jobs, max_tasks_per_child=1,
+                                   mp_context=multiprocessing.get_context("spawn"))
+    try:
+        while pending or running:
+            for name, stage in list(pending.items()):
+                if any(dep in failed for dep in stage.deps if dep in by_name):
+                    del pending[name]
+                    failed.add(name)
+                    report.append((name, "blocked", 0.0, 0.0))
+                    continue
+                if not all(dep in done for dep in stage.deps if dep in by_name):
+                    continue
+                if len(running) >= jobs or busy_resources & set(stage.resources):
+                    continue
+
+                del pending[name]
+                fingerprint, inputs = stage_fingerprint(stage)
+                manifest = load_manifest(stage)
+                if (name not in force and manifest and manifest.get("fingerprint") == fingerprint
+                        and all(Path(out).exists() for out in stage.outputs)):
+                    done.add(name)
+                    report.append((name, "skipped", 0.0, 0.0))
+                    print(f"[build] {name}: up to date")
+                    continue
+
+                print(f"[build] {name}: running")
+                busy_resources |= set(stage.resources)
+                future = executor.submit(_run_stage, stage.target, stage.args)
+                running[future] = (stage, fingerprint, inputs)
+
+            if not running:
+                if pending:
+                    continue
+                break
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                stage, fingerprint, inputs = running.pop(future)
+                busy_resources -= set(stage.resources)
+                try:
+                    result = future.result()
+                except Exception:
+                    failed.add(stage.name)
+                    report.append((stage.name, "failed", 0.0, 0.0))
+                    print(f"[build] {stage.name}: FAILED\n{traceback.format_exc()}")
+                    continue
+                write_manifest(stage, fingerprint, inputs, result)
+                done.add(stage.name)
+                report.append((stage.name, "built", result["wall_seconds"], result["peak_rss_mb"]))
+                print(f"[build] {stage.name}: built in {result['wall_seconds']:.1f}s "
+                      f"(peak {result['peak_rss_mb']:.0f} MB)")
+    finally:
+        executor.shutdown()
+
+    print(f"\n{'stage':<22}{'status':<10}{'wall s':>10}{'peak MB':>10}")
+    for name, status, wall, peak in report:
+        print(f"{name:<22}{status:<10}{wall:>10.1f}{peak:>10.0f}")
+    return not failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build all offline IR artifacts incrementally.")
+    parser.add_argument("--tables", nargs="+", default=TABLES, choices=TABLES)
+    parser.add_argument("--jobs", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument("--force", nargs="*", default=[], help="stage names to rebuild regardless of manifests")
+    parser.add_argument("--list", action="store_true", help="print the stage graph and exit")
+    args = parser.parse_args()
+
+    stages = build_stages(args.tables)
+    if args.list:
+        for stage in stages:
+            print(f"{stage.name:<22} <- {', '.join(stage.deps) or '-'}")
+        return
+
+    ok = run_build(stages, args.jobs, force=set(args.force))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
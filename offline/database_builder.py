@@ -7,6 +7,7 @@ from nltk.tokenize import word_tokenize
 from nltk.corpus import stopwords
 from nltk.stem import PorterStemmer
 from pathlib import Path
+import sys
 import nltk
 nltk.download("punkt")
 nltk.download("stopwords")
@@ -15,6 +16,9 @@ nltk.download('punkt_tab')
 BASE_DIR = Path(__file__).parent.parent  
 DATA_DIR = BASE_DIR / "data"
 
+sys.path.append(str(BASE_DIR))
+from offline.fts_service import build_fts_index
+
 def preprocess(text):
     text = text.lower()
     text = text.translate(str.maketrans('', '', string.punctuation))
@@ -26,6 +30,9 @@ def preprocess(text):
     return " ".join(stems)
 
 def create_table(conn, name):
+    # The FTS index reads from this table, so it must go first
+    conn.execute(f"DROP TABLE IF EXISTS {name}_fts")
+    conn.execute(f"DROP TABLE IF EXISTS {name}_dups")
     conn.execute(f"DROP TABLE IF EXISTS {name}")
     conn.execute(f"""
         CREATE TABLE {name} (
@@ -62,23 +69,32 @@ def load_quora():
             docs[item["_id"]] = item["text"]
     return docs
 
-def main():
-    import sys
-    sys.stdout.reconfigure(line_buffering=True)
-    print("STARTED")
-    os.makedirs("data", exist_ok=True)
-    conn = sqlite3.connect("offline/ir_project.db")
+DB_PATH = BASE_DIR / "offline" / "ir_project.db"
 
-    antique_docs = load_antique()
-    quora_docs = load_quora()
+# Source file and loader of every dataset table
+SOURCES = {
+    "antique": (DATA_DIR / "antique" / "collection.txt", load_antique),
+    "quora": (DATA_DIR / "quora" / "corpus.jsonl", load_quora),
+}
 
-    create_table(conn, "antique")
-    insert_documents(conn, "antique", antique_docs)
+def build_table(table_name):
+    """(Re)creates one dataset table from its source file, plus its FTS5 index."""
+    _, loader = SOURCES[table_name]
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        create_table(conn, table_name)
+        insert_documents(conn, table_name, loader())
+        build_fts_index(conn, table_name)
+    finally:
+        conn.close()
 
-    create_table(conn, "quora")
-    insert_documents(conn, "quora", quora_docs)
+def main():
+    sys.stdout.reconfigure(line_buffering=True)
+    print("STARTED")
+    os.makedirs(DATA_DIR, exist_ok=True)
 
-    conn.close()
+    build_table("antique")
+    build_table("quora")
 
 if __name__ == "__main__":
     main()
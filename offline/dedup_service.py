@@ -0,0 +1,236 @@
+import json
+import multiprocessing
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+BASE_DIR = Path(__file__).parent.parent
+DATA_DIR = BASE_DIR / "offline"
+OUTPUT_DIR = BASE_DIR / "offline_data"
+
+sys.path.append(str(BASE_DIR))
+from offline.shard_config import DEDUP_THRESHOLD
+
+# --- Settings ---
+NUM_PERM = 64              # MinHash permutations per document
+BANDS = 16                 # LSH bands of NUM_PERM // BANDS rows: candidates from ~(1/16)**(1/4) = 0.5 Jaccard
+SHINGLE_SIZE = 2           # word n-grams of processed_doc; shorter documents use their whole text
+CHUNK_SIZE = 5000          # documents per signature task
+LATENCY_QUERIES = 200      # sampled queries for the before/after BM25 timing in the report
+
+_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+
+def _permutations(num_perm, seed=1):
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, _MAX_HASH, size=num_perm, dtype="uint64")
+    b = rng.integers(0, _MAX_HASH, size=num_perm, dtype="uint64")
+    return a, b
+
+
+def _shingles(text, size):
+    tokens = text.split()
+    if len(tokens) <= size:
+        return {" ".join(tokens)} if tokens else set()
+    return {" ".join(tokens[i:i + size]) for i in range(len(tokens) - size + 1)}
+
+
+def minhash_signatures(texts, num_perm=NUM_PERM, shingle_size=SHINGLE_SIZE):
+    """
+    (len(texts), num_perm) uint32 MinHash signatures of the texts' word shingles.
+    Runs in a pool worker; all shingles of the chunk are hashed in one vectorized pass.
+    Documents without any shingle get an all-max signature and never become candidates.
+    """
+    hashes, counts = [], []
+    for text in texts:
+        shingles = _shingles(text or "", shingle_size)
+        hashes.extend(zlib.crc32(shingle.encode("utf-8")) for shingle in shingles)
+        counts.append(len(shingles))
+    signatures = np.full((len(texts), num_perm), _MAX_HASH, dtype="uint32")
+    if not hashes:
+        return signatures
+
+    a, b = _permutations(num_perm)
+    values = np.array(hashes, dtype="uint64")
+    # (a * x + b) mod p, truncated to 32 bits: one universal hash per permutation
+    permuted = ((a[:, None] * values[None, :] + b[:, None]) % _PRIME) & _MAX_HASH
+    counts = np.array(counts)
+    has_shingles = counts > 0
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))[has_shingles]
+    signatures[has_shingles] = np.minimum.reduceat(permuted, starts, axis=1).T.astype("uint32")
+    return signatures
+
+
+def _find(parent, i):
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+def lsh_clusters(signatures, threshold, bands=BANDS):
+    """
+    Groups near-duplicates: documents sharing all rows of any band are candidates, and a
+    candidate joins a cluster when its signature agrees with the cluster's first member on
+    at least `threshold` of the permutations (the estimated Jaccard similarity).
+    Returns the canonical row of every row: the smallest row of its cluster.
+    """
+    n_docs, num_perm = signatures.shape
+    rows_per_band = num_perm // bands
+    parent = np.arange(n_docs)
+    valid = (signatures != _MAX_HASH).any(axis=1)
+    mixers = np.random.default_rng(2).integers(1, 1 << 62, size=rows_per_band, dtype="uint64") | 1
+
+    for band in range(bands):
+        block = signatures[:, band * rows_per_band:(band + 1) * rows_per_band].astype("uint64")
+        keys = (block * mixers).sum(axis=1)  # wraps modulo 2**64; collisions are caught by the check below
+        keys = keys[valid]
+        members = np.flatnonzero(valid)
+        order = np.argsort(keys, kind="stable")
+        keys, members = keys[order], members[order]
+        boundaries = np.flatnonzero(np.diff(keys)) + 1
+        for bucket in np.split(members, boundaries):
+            if len(bucket) < 2:
+                continue
+            pending = np.sort(bucket)
+            while len(pending) > 1:
+                leader = pending[0]
+                agreement = (signatures[pending] == signatures[leader]).mean(axis=1)
+                close = agreement >= threshold
+                root = _find(parent, leader)
+                for member in pending[close][1:]:
+                    other = _find(parent, member)
+                    # The smaller row becomes the root, so roots are canonical rows
+                    parent[max(root, other)] = min(root, other)
+                    root = min(root, other)
+                pending = pending[~close]
+
+    return np.array([_find(parent, i) for i in range(n_docs)], dtype="int64")
+
+
+def _bm25_footprint(tokenized, queries):
+    """On-disk bytes of a BM25 index over `tokenized` and its mean scoring + top-10 time (ms) per query."""
+    from services.bm25_index import write_bm25_index, Bm25Index
+    from services.array_utils import top_k_indices
+
+    with tempfile.TemporaryDirectory() as directory:
+        meta = write_bm25_index(directory, tokenized)
+        size = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+        index = Bm25Index(directory)
+        start = time.perf_counter()
+        for query in queries:
+            top_k_indices(index.get_scores(query), 10)
+        latency = (time.perf_counter() - start) * 1000 / max(len(queries), 1)
+        del index
+    return {"postings": meta["n_postings"], "bytes": size, "latency_ms": round(latency, 3)}
+
+
+def process_dedup(table_name, threshold=DEDUP_THRESHOLD, workers=None, measure=True,
+                  db_path=DATA_DIR / "ir_project.db", output_dir=OUTPUT_DIR):
+    """
+    Writes `<table>_dups` (doc_id -> canonical_id, one row per collapsed duplicate) and a
+    report to offline_data/dedup_<table>.json. The tfidf/bm25/bert builders and the API's
+    row -> doc_id map then leave the duplicates out (services/database_utils.indexed_docs_filter).
+    """
+    start = time.perf_counter()
+    conn = sqlite3.connect(db_path)
+    try:
+        rows = conn.execute(f"SELECT doc_id, processed_doc FROM {table_name} ORDER BY rowid").fetchall()
+    finally:
+        conn.close()
+    doc_ids = [doc_id for doc_id, _ in rows]
+    texts = [text or "" for _, text in rows]
+
+    # Signatures in parallel, one chunk per task (spawn, like the build's own stage processes)
+    chunks = [texts[i:i + CHUNK_SIZE] for i in range(0, len(texts), CHUNK_SIZE)]
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1,
+                             mp_context=multiprocessing.get_context("spawn")) as executor:
+        parts = list(executor.map(minhash_signatures, chunks))
+    signatures = np.concatenate(parts) if parts else np.empty((0, NUM_PERM), dtype="uint32")
+    canonical = lsh_clusters(signatures, threshold)
+
+    duplicates = np.flatnonzero(canonical != np.arange(len(canonical)))
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute(f"DROP TABLE IF EXISTS {table_name}_dups")
+        conn.execute(f"CREATE TABLE {table_name}_dups (doc_id TEXT PRIMARY KEY, canonical_id TEXT NOT NULL)")
+        conn.execute(f"CREATE INDEX {table_name}_dups_canonical ON {table_name}_dups (canonical_id)")
+        conn.executemany(f"INSERT INTO {table_name}_dups (doc_id, canonical_id) VALUES (?, ?)",
+                         ((doc_ids[row], doc_ids[canonical[row]]) for row in duplicates.tolist()))
+        conn.commit()
+    finally:
+        conn.close()
+
+    sizes = np.bincount(canonical, minlength=len(canonical))
+    largest = np.argsort(sizes)[::-1][:10]
+    report = {
+        "table": table_name,
+        "threshold": threshold,
+        "num_perm": NUM_PERM,
+        "bands": BANDS,
+        "shingle_size": SHINGLE_SIZE,
+        "docs": len(doc_ids),
+        "indexed_docs": len(doc_ids) - len(duplicates),
+        "duplicates": len(duplicates),
+        "clusters": int((sizes > 1).sum()),
+        "removed_fraction": round(len(duplicates) / max(len(doc_ids), 1), 4),
+        "largest_clusters": [{"canonical_id": doc_ids[row], "size": int(sizes[row])}
+                             for row in largest.tolist() if sizes[row] > 1],
+    }
+
+    if measure and len(duplicates):
+        # Before/after BM25 index size and latency; TF-IDF rows and FAISS vectors shrink by removed_fraction
+        kept = np.ones(len(texts), dtype=bool)
+        kept[duplicates] = False
+        tokenized = [text.split() for text in texts]
+        rng = np.random.default_rng(0)
+        queries = []
+        for row in rng.choice(len(tokenized), size=min(LATENCY_QUERIES, len(tokenized)), replace=False):
+            tokens = tokenized[row]
+            if tokens:
+                queries.append([tokens[i] for i in rng.choice(len(tokens), size=min(3, len(tokens)), replace=False)])
+        before = _bm25_footprint(tokenized, queries)
+        after = _bm25_footprint([tokens for tokens, keep in zip(tokenized, kept) if keep], queries)
+        report["bm25"] = {
+            "before": before,
+            "after": after,
+            "bytes_saved_fraction": round(1 - after["bytes"] / max(before["bytes"], 1), 4),
+            "latency_saved_fraction": round(1 - after["latency_ms"] / max(before["latency_ms"], 1e-9), 4),
+        }
+    report["seconds"] = round(time.perf_counter() - start, 2)
+
+    os.makedirs(output_dir, exist_ok=True)
+    with open(Path(output_dir) / f"dedup_{table_name}.json", "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    print(f"Dedup of '{table_name}': {report['duplicates']} of {report['docs']} documents are near-duplicates "
+          f"in {report['clusters']} clusters ({report['removed_fraction']:.1%} fewer rows to index).")
+    if "bm25" in report:
+        bm25 = report["bm25"]
+        print(f"  BM25 index {bm25['before']['bytes'] / 1e6:.1f} -> {bm25['after']['bytes'] / 1e6:.1f} MB, "
+              f"query {bm25['before']['latency_ms']:.2f} -> {bm25['after']['latency_ms']:.2f} ms")
+    return report
+
+
+def clear_dedup(table_name, db_path=DATA_DIR / "ir_project.db"):
+    """Drops `<table>_dups`, so the next index builds include every document again."""
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute(f"DROP TABLE IF EXISTS {table_name}_dups")
+        conn.commit()
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    if "--clear" in sys.argv:
+        clear_dedup("quora")
+    else:
+        process_dedup("quora")
@@ -0,0 +1,32 @@
+import sqlite3
+import sys
+from pathlib import Path
+
+BASE_DIR = Path(__file__).parent.parent
+DATA_DIR = BASE_DIR / "offline"
+OUTPUT_DIR = BASE_DIR / "offline_data"
+
+sys.path.append(str(BASE_DIR))
+from services.docstore import write_docstore
+from services.artifacts import publish_directory
+from services.database_utils import table_fingerprint, DOCSTORE_COLUMNS
+
+
+def process_docstore(table_name, db_path=DATA_DIR / "ir_project.db", output_dir=OUTPUT_DIR):
+    conn = sqlite3.connect(db_path)
+    try:
+        # Streamed in doc_id order (BINARY collation = UTF-8 byte order, as the term table requires)
+        cursor = conn.execute(f"SELECT {DOCSTORE_COLUMNS} FROM {table_name} ORDER BY doc_id")
+        # The API compares this with the live table, not the database file's mtime
+        source = table_fingerprint(table_name, DOCSTORE_COLUMNS, db_path)
+        with publish_directory(Path(output_dir) / f"docstore_{table_name}") as staging:
+            meta = write_docstore(staging, cursor, source_fingerprint=source)
+    finally:
+        conn.close()
+    ratio = meta["compressed_bytes"] / max(meta["raw_bytes"], 1)
+    print(f"Document store for '{table_name}': {meta['n_docs']} docs in {meta['n_blocks']} blocks, "
+          f"{meta['raw_bytes'] / 1e6:.1f} MB -> {meta['compressed_bytes'] / 1e6:.1f} MB ({ratio:.0%}).")
+
+if __name__ == "__main__":
+    process_docstore("antique")
+    process_docstore("quora")
@@ -0,0 +1,40 @@
+import sqlite3
+from pathlib import Path
+
+BASE_DIR = Path(__file__).parent.parent  
+DATA_DIR = BASE_DIR / "offline"
+
+
+def build_fts_index(conn, table_name):
+    """
+    Creates `<table>_fts`, an FTS5 index over the table's processed_doc column.
+    It is an external-content table: it stores only the inverted index and reads
+    doc text from `<table>` by rowid, so the database grows by the postings alone.
+    """
+    fts_table = f"{table_name}_fts"
+    conn.execute(f"DROP TABLE IF EXISTS {fts_table}")
+    conn.execute(f"""
+        CREATE VIRTUAL TABLE {fts_table} USING fts5(
+            processed_doc,
+            content='{table_name}',
+            content_rowid='rowid'
+        )
+    """)
+    conn.execute(f"INSERT INTO {fts_table}({fts_table}) VALUES('rebuild')")
+    # Merge the b-tree segments written by the rebuild into one for faster queries
+    conn.execute(f"INSERT INTO {fts_table}({fts_table}) VALUES('optimize')")
+    conn.commit()
+
+
+def process_fts(table_name):
+    conn = sqlite3.connect(DATA_DIR / "ir_project.db")
+    try:
+        build_fts_index(conn, table_name)
+        count = conn.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
+        print(f"FTS5 index '{table_name}_fts' built over {count} documents.")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    process_fts("antique")
+    process_fts("quora")
@@ -0,0 +1,21 @@
+import os
+
+# Number of shards each dataset's BM25 / TF-IDF / FAISS artifacts are split into.
+# 1 keeps the single-index layout. Override per dataset with IR_SHARDS_<DATASET>=N.
+DEFAULT_SHARDS = {
+    "antique": 1,
+    "quora": 1,
+}
+
+def shard_count(table_name):
+    return int(os.getenv(f"IR_SHARDS_{table_name.upper()}", DEFAULT_SHARDS.get(table_name, 1)))
+
+# Whether the bm25 builder also writes offline_data/positions_<table>, the positional
+# index behind quoted phrase / proximity queries. IR_POSITIONS=0 skips it.
+WRITE_POSITIONS = os.getenv("IR_POSITIONS", "1") == "1"
+
+# Tables whose near-duplicate documents are collapsed before indexing (offline/dedup_service.py),
+# and the estimated Jaccard similarity of word shingles at which two documents count as one.
+# IR_DEDUP_TABLES= (empty) disables the stage.
+DEDUP_TABLES = [table for table in os.getenv("IR_DEDUP_TABLES", "quora").split(",") if table]
+DEDUP_THRESHOLD = float(os.getenv("IR_DEDUP_THRESHOLD", "0.9"))
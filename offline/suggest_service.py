@@ -0,0 +1,166 @@
+import bisect
+import json
+import os
+import sqlite3
+import sys
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+
+BASE_DIR = Path(__file__).parent.parent
+DATA_DIR = BASE_DIR / "offline"
+OUTPUT_DIR = BASE_DIR / "offline_data"
+
+sys.path.append(str(BASE_DIR))
+from services.term_table import write_term_table
+from services.suggest_index import normalize, deletes, delete_hash, MAX_EDIT_DISTANCE, PREFIX_LENGTH
+from services.query_log import query_counts, QUERY_LOG_PATH
+from services.artifacts import publish_directory
+
+QUERY_FILES = {
+    "antique": BASE_DIR / "data" / "antique" / "queries.txt",   # query_id \t text
+    "quora": BASE_DIR / "data" / "quora" / "queries.jsonl",      # {"_id", "text"}
+}
+
+# --- Settings ---
+MIN_WORD_FREQ = 2          # corpus words seen fewer times are left out (mostly typos)
+MAX_WORD_LENGTH = 30
+QUERY_WEIGHT = 100         # one past query counts as much as 100 corpus occurrences of a word
+SCAN_LIMIT = 64            # prefixes matching more completions than this get a precomputed top-k
+TOP_K = 10
+
+
+def count_corpus_words(table_name, chunk_size=5000):
+    """Frequency of every alphabetic surface word in the table's original text."""
+    counts = Counter()
+    conn = sqlite3.connect(DATA_DIR / "ir_project.db")
+    try:
+        cursor = conn.execute(f"SELECT doc FROM {table_name}")
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            for (doc,) in rows:
+                counts.update(w for w in normalize(doc or "").split() if w.isalpha() and len(w) <= MAX_WORD_LENGTH)
+    finally:
+        conn.close()
+    return Counter({w: c for w, c in counts.items() if c >= MIN_WORD_FREQ})
+
+
+def read_queries(table_name):
+    """
+    Normalized query strings with their counts: the dataset's query file plus
+    everything users searched for, from the API's query log.
+    """
+    queries = Counter()
+    path = QUERY_FILES.get(table_name)
+    if path is not None and path.exists():
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if path.suffix == ".jsonl":
+                    text = json.loads(line).get("text", "")
+                else:
+                    text = line.rstrip("\n").split("\t", 1)[-1]
+                text = normalize(text)
+                if text:
+                    queries[text] += 1
+    for query, count in query_counts(table_name, BASE_DIR / QUERY_LOG_PATH):
+        text = normalize(query)
+        if text:
+            queries[text] += count
+    return queries
+
+
+def heavy_prefixes(entries, scan_limit):
+    """
+    Every prefix shared by more than `scan_limit` entries. In sorted order a prefix of
+    entries[i] is shared by > scan_limit entries exactly when it is also a prefix of
+    entries[i + scan_limit], so the common prefix of those two bounds it.
+    """
+    prefixes = set()
+    for i in range(len(entries) - scan_limit):
+        a, b = entries[i], entries[i + scan_limit]
+        common = 0
+        for x, y in zip(a, b):
+            if x != y:
+                break
+            common += 1
+        for length in range(1, common + 1):
+            prefixes.add(a[:length])
+    return sorted(prefixes, key=lambda p: p.encode("utf-8"))
+
+
+def write_suggest_index(directory, words, queries, scan_limit=SCAN_LIMIT, top_k=TOP_K,
+                        max_distance=MAX_EDIT_DISTANCE, prefix_length=PREFIX_LENGTH):
+    """
+    Writes the autocomplete + spelling index read by services.suggest_index.SuggestIndex.
+    `words` and `queries` are Counters of normalized strings.
+    """
+    directory = Path(directory)
+    os.makedirs(directory, exist_ok=True)
+
+    scores = Counter(words)
+    for query, count in queries.items():
+        scores[query] += count * QUERY_WEIGHT
+    entries = sorted(scores, key=lambda e: e.encode("utf-8"))
+    entry_scores = np.array([scores[e] for e in entries], dtype="int64")
+    write_term_table(directory, entries, name="completions")
+    np.save(directory / "scores.npy", entry_scores)
+
+    # Precomputed top-k for prefixes with large ranges; -1 pads short lists
+    encoded = [e.encode("utf-8") for e in entries]
+    prefixes = heavy_prefixes(entries, scan_limit)
+    prefix_topk = np.full((len(prefixes), top_k), -1, dtype="int32")
+    for row, prefix in enumerate(prefixes):
+        key = prefix.encode("utf-8")
+        start, end = bisect.bisect_left(encoded, key), bisect.bisect_left(encoded, key + b"\xff")
+        range_scores = entry_scores[start:end]
+        best = np.argpartition(-range_scores, top_k - 1)[:top_k] if end - start > top_k else np.arange(end - start)
+        best = best[np.argsort(-range_scores[best], kind="stable")]
+        prefix_topk[row, :len(best)] = start + best
+    write_term_table(directory, prefixes, name="prefixes")
+    np.save(directory / "prefix_topk.npy", prefix_topk)
+
+    # SymSpell deletion index over single dictionary words, sorted by hash for searchsorted
+    entry_ids = {e: i for i, e in enumerate(entries)}
+    hashes, ids = [], []
+    for word in words:
+        for variant in deletes(word, max_distance, prefix_length):
+            hashes.append(delete_hash(variant))
+            ids.append(entry_ids[word])
+    hashes = np.array(hashes, dtype="uint64")
+    ids = np.array(ids, dtype="int32")
+    order = np.argsort(hashes, kind="stable")
+    np.save(directory / "delete_hashes.npy", hashes[order])
+    np.save(directory / "delete_ids.npy", ids[order])
+
+    meta = {
+        "format": "suggest",
+        "n_completions": len(entries),
+        "n_words": len(words),
+        "n_queries": len(queries),
+        "n_prefixes": len(prefixes),
+        "n_deletes": int(len(hashes)),
+        "scan_limit": scan_limit,
+        "top_k": top_k,
+        "max_edit_distance": max_distance,
+        "prefix_length": prefix_length,
+        "query_weight": QUERY_WEIGHT,
+    }
+    with open(directory / "meta.json", "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+def process_suggest(table_name):
+    words = count_corpus_words(table_name)
+    queries = read_queries(table_name)
+    with publish_directory(OUTPUT_DIR / f"suggest_{table_name}") as staging:
+        meta = write_suggest_index(staging, words, queries)
+    print(f"Suggest index for '{table_name}': {meta['n_words']} words, {meta['n_queries']} queries, "
+          f"{meta['n_prefixes']} precomputed prefixes, {meta['n_deletes']} deletes.")
+
+if __name__ == "__main__":
+    process_suggest("antique")
+    process_suggest("quora")
@@ -1,29 +1,39 @@
 import sqlite3
 import pandas as pd
-import joblib
 from sklearn.feature_extraction.text import TfidfVectorizer
 import os
+import sys
 
 from pathlib import Path
 
 BASE_DIR = Path(__file__).parent.parent  
 DATA_DIR = BASE_DIR / "offline"
+OUTPUT_DIR = BASE_DIR / "offline_data"
 
-def process_tfidf(table_name):
-    path = DATA_DIR / "ir_project.db" 
-    conn = sqlite3.connect(path)
-    df = pd.read_sql(f"SELECT doc_id, processed_doc FROM {table_name}", conn)
+sys.path.append(str(BASE_DIR))
+from services.database_utils import indexed_docs_query
+from services.tfidf_index import write_tfidf_index
+from services.artifacts import publish_directory
+from offline.shard_config import shard_count
+
+def process_tfidf(table_name, num_shards=None, db_path=DATA_DIR / "ir_project.db", output_dir=OUTPUT_DIR):
+    conn = sqlite3.connect(db_path)
+    # One representative per near-duplicate cluster when offline/dedup_service.py has run
+    df = pd.read_sql(indexed_docs_query(conn, table_name, "doc_id, processed_doc"), conn)
     conn.close()
 
     vectorizer = TfidfVectorizer()
     tfidf_matrix = vectorizer.fit_transform(df['processed_doc'])
 
-    os.makedirs("offline_data", exist_ok=True)
-    joblib.dump({
-        "doc_ids": df['doc_id'].tolist(),
-        "vectorizer": vectorizer,
-        "matrix": tfidf_matrix
-    }, f"offline_data/tfidf_{table_name}.joblib")
+    # Raw CSC arrays + term table; the API never unpickles the sklearn vectorizer
+    os.makedirs(output_dir, exist_ok=True)
+    num_shards = num_shards or shard_count(table_name)
+    # The row -> doc_id table is written next to the index, in the order the rows were indexed.
+    # Published as a new version, never over the files a running API has mapped.
+    with publish_directory(Path(output_dir) / f"tfidf_{table_name}") as staging:
+        meta = write_tfidf_index(staging, vectorizer, tfidf_matrix, num_shards=num_shards,
+                                 doc_ids=df["doc_id"].tolist())
+    print(f"TF-IDF index for '{table_name}': {meta['n_docs']} docs, {meta['n_terms']} terms, {meta['nnz']} non-zeros, {meta['num_shards']} shard(s).")
 
 if __name__ == "__main__":
     process_tfidf("antique")
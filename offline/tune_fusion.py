@@ -0,0 +1,479 @@
+# offline/tune_fusion.py
+#
+# Tunes BM25's k1/b and the hybrid fusion (weights, method, RRF constant, per-engine depth)
+# against a dataset's qrels, without re-running the engines for every setting:
+#   - each hybrid engine's top-N run over the sampled queries is computed once and cached in
+#     offline_data/tuning/<dataset>/run_<engine>.npz (rows + scores as padded arrays)
+#   - BM25 is not run through the engine at all: the postings statistics the query terms touch
+#     (tf, idf, document length) are cached once, and every k1/b pair is re-scored from them
+#   - every fusion setting is a vectorized re-scoring of the cached runs
+# The cached files are reused while the artifacts and the query sample stay the same. The best
+# settings are merged into offline_data/search_config.json, which the API applies on its next
+# (re)load: BM25 k1/b for the bm25 engine, and the fusion settings for /search/hybrid.
+#
+#     python -m offline.tune_fusion --dataset antique --queries 500 --metric ndcg
+
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+BASE_DIR = Path(__file__).parent.parent
+sys.path.append(str(BASE_DIR))
+# Tuning queries must not end up in the popular-query log
+os.environ.setdefault("IR_QUERY_LOG", "0")
+
+from offline.suggest_service import QUERY_FILES
+from services.fusion import fusion_contributions, FUSION_METHODS
+from services.search_config import SEARCH_CONFIG_PATH
+
+QRELS_FILES = {
+    "antique": BASE_DIR / "data" / "antique" / "qrels.tsv",          # query_id 0 doc_id relevance
+    "quora": BASE_DIR / "data" / "quora" / "qrels" / "test.tsv",     # query-id corpus-id score (header)
+}
+TUNING_DIR = Path("offline_data") / "tuning"
+METRICS = ("ndcg", "map", "mrr", "recall")
+# Part of every cached run's stamp; bumped when the engines change what a run holds
+# (2: lexical runs hold matching documents only, no zero-score padding)
+RUN_VERSION = 2
+
+
+# --- Evaluation data ---
+def load_queries(dataset):
+    """{query_id: text} from the dataset's query file."""
+    queries = {}
+    path = QUERY_FILES[dataset]
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            if path.suffix == ".jsonl":
+                data = json.loads(line)
+                queries[str(data["_id"])] = data.get("text", "")
+            else:
+                query_id, _, text = line.rstrip("\n").partition("\t")
+                queries[query_id] = text
+    return queries
+
+
+def load_qrels(dataset):
+    """{query_id: [relevant doc_id, ...]}; any relevance >= 1 counts, as in evaluation.ipynb."""
+    qrels = {}
+    with open(QRELS_FILES[dataset], encoding="utf-8") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 4:
+                query_id, _, doc_id, relevance = parts
+            elif len(parts) == 3:
+                query_id, doc_id, relevance = parts
+            else:
+                continue
+            try:
+                if int(relevance) >= 1:
+                    qrels.setdefault(query_id, []).append(doc_id)
+            except ValueError:
+                continue  # header line
+    return qrels
+
+
+class Judgments:
+    """The relevant rows of the sampled queries, as sorted query * n_docs + row keys."""
+
+    def __init__(self, query_ids, qrels, doc_ids):
+        self.n_docs = len(doc_ids)
+        keys = []
+        for q, query_id in enumerate(query_ids):
+            rows = doc_ids.lookup(qrels[query_id])
+            keys.extend(q * self.n_docs + int(row) for row in set(rows.tolist()) if row >= 0)
+        self.keys = np.array(sorted(keys), dtype="int64")
+        self.n_relevant = np.bincount(self.keys // max(self.n_docs, 1), minlength=len(query_ids))
+
+    def relevant(self, rows):
+        """Bool array like `rows` (queries on axis -2, -1 = padding): is the row relevant for its query?"""
+        rows = np.asarray(rows, dtype="int64")
+        query = np.arange(rows.shape[-2], dtype="int64")[:, None]
+        keys = query * self.n_docs + rows
+        found = np.minimum(np.searchsorted(self.keys, keys), max(len(self.keys) - 1, 0))
+        return (rows >= 0) & (self.keys[found] == keys) if len(self.keys) else np.zeros(rows.shape, dtype=bool)
+
+
+def evaluate(relevant, n_relevant, metric):
+    """Mean `metric` over the queries (axis -2) of ranked relevance flags (..., queries, cutoff)."""
+    cutoff = relevant.shape[-1]
+    positions = np.arange(1, cutoff + 1)
+    relevant = relevant.astype("float64")
+    if metric == "ndcg":
+        discounts = 1 / np.log2(positions + 1)
+        ideal = np.cumsum(discounts)[np.minimum(n_relevant, cutoff) - 1]
+        per_query = (relevant * discounts).sum(axis=-1) / ideal
+    elif metric == "map":
+        precision = np.cumsum(relevant, axis=-1) / positions
+        per_query = (precision * relevant).sum(axis=-1) / np.minimum(n_relevant, cutoff)
+    elif metric == "mrr":
+        per_query = (relevant / positions).max(axis=-1)
+    elif metric == "recall":
+        per_query = relevant.sum(axis=-1) / n_relevant
+    else:
+        raise ValueError(f"Unknown metric '{metric}'; expected one of {METRICS}.")
+    return per_query.mean(axis=-1)
+
+
+# --- Cached runs ---
+def _fingerprint(paths, *extra):
+    """Changes whenever one of the files under `paths` or any of `extra` changes."""
+    digest = hashlib.sha1(json.dumps(extra, sort_keys=True).encode("utf-8"))
+    for path in sorted(map(str, paths)):
+        files = [path] if os.path.isfile(path) else sorted(
+            os.path.join(root, name) for root, _, names in os.walk(path) for name in names
+        )
+        for file_path in files:
+            stat = os.stat(file_path)
+            digest.update(f"{file_path}:{stat.st_mtime_ns}:{stat.st_size}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _cached(path, stamp, compute):
+    """Arrays stored at `path` if they were computed for `stamp`, else compute() saved there."""
+    if path.exists():
+        with np.load(path) as data:
+            if str(data["stamp"]) == stamp:
+                print(f"  reusing {path}")
+                return {name: data[name] for name in data.files if name != "stamp"}
+    arrays = compute()
+    os.makedirs(path.parent, exist_ok=True)
+    np.savez(path, stamp=np.array(stamp), **arrays)
+    return arrays
+
+
+def engine_run(dataset, engine, queries, depth, doc_ids, query_ids):
+    """
+    Top-`depth` rows and scores of `engine` for every query, as (queries, depth) arrays
+    padded with row -1 / score NaN; cached per engine.
+    """
+    from services.search_service import _artifact_paths
+
+    paths = [path for path in _artifact_paths(engine, dataset) if path != str(SEARCH_CONFIG_PATH)]
+    stamp = _fingerprint(paths, RUN_VERSION, engine, depth, query_ids, queries)
+
+    def compute():
+        from services.search_service import _get_search_service
+
+        service = _get_search_service(engine, dataset)
+        if hasattr(service, "search_rows") and service.doc_ids.fingerprint != doc_ids.fingerprint:
+            # Runs and judgments are joined on rows, so every engine must share the dataset's row order
+            raise ValueError(f"The {engine} index of '{dataset}' has a different row order than "
+                             f"'{doc_ids.directory}'; rebuild the indexes from the same database.")
+        rows = np.full((len(queries), depth), -1, dtype="int32")
+        scores = np.full((len(queries), depth), np.nan, dtype="float32")
+        start = time.perf_counter()
+        for q, query in enumerate(queries):
+            if hasattr(service, "search_rows"):
+                hit_rows, hit_scores = service.search_rows(query, depth)
+            else:
+                # FTS returns doc_ids only
+                results = service.execute_search(query, top_k=depth)
+                hit_rows = doc_ids.lookup(res["doc_id"] for res in results)
+                hit_scores = [res["score"] for res in results]
+            rows[q, :len(hit_rows)] = hit_rows
+            scores[q, :len(hit_scores)] = hit_scores
+        print(f"  ran {engine} on {len(queries)} queries in {time.perf_counter() - start:.1f}s")
+        return {"rows": rows, "scores": scores}
+
+    return _cached(TUNING_DIR / dataset / f"run_{engine}.npz", stamp, compute)
+
+
+def bm25_postings(dataset, queries, query_ids, doc_ids):
+    """
+    Every (query, row) posting the query tokens touch, with the statistics BM25 needs:
+    tf, idf and the document length. Repeated query tokens appear once per occurrence,
+    as in Bm25Index.get_scores.
+    """
+    from services.bm25_index import Bm25Index
+    from services.preprocessing_service import preprocess
+
+    directory = Path("offline_data") / f"bm25_{dataset}"
+    stamp = _fingerprint([directory], query_ids, queries)
+
+    def compute():
+        index = Bm25Index(directory)
+        index_fingerprint = index.meta.get("doc_ids_fingerprint")
+        if index_fingerprint is not None and index_fingerprint != doc_ids.fingerprint:
+            raise ValueError(f"The bm25 index of '{dataset}' has a different row order than "
+                             f"'{doc_ids.directory}'; rebuild the indexes from the same database.")
+        shards = ([Bm25Index(directory, shard=s) for s in range(index.num_shards)]
+                  if index.is_sharded else [index])
+        columns = {"query": [], "rows": [], "tf": [], "idf": [], "doc_len": []}
+        for q, query in enumerate(queries):
+            for token in preprocess(query).split():
+                term_id = index.terms.lookup(token)
+                if term_id < 0:
+                    continue
+                for shard, offset in zip(shards, index.row_offsets):
+                    docs, tf = shard.postings(term_id)
+                    columns["query"].append(np.full(len(docs), q, dtype="int32"))
+                    columns["rows"].append(np.asarray(docs, dtype="int32") + offset)
+                    columns["tf"].append(np.asarray(tf, dtype="float32"))
+                    columns["idf"].append(np.full(len(docs), index.idf[term_id], dtype="float32"))
+                    columns["doc_len"].append(np.asarray(shard.doc_len[docs], dtype="int32"))
+        arrays = {name: np.concatenate(parts) if parts else np.empty(0, dtype="float32")
+                  for name, parts in columns.items()}
+        arrays["avgdl"] = np.array(index.avgdl)
+        arrays["defaults"] = np.array([index.meta["k1"], index.meta["b"]])
+        print(f"  cached {len(arrays['rows'])} BM25 postings")
+        return arrays
+
+    return _cached(TUNING_DIR / dataset / "bm25_postings.npz", stamp, compute)
+
+
+class Bm25Rescorer:
+    """
+    Top-k BM25 runs for any k1/b from the cached postings, without touching the index.
+    Like Bm25Search, a run holds only documents with a positive score, so it may be shorter than k.
+    """
+
+    def __init__(self, postings, n_queries, n_docs):
+        self.n_queries = n_queries
+        keys = postings["query"].astype("int64") * n_docs + postings["rows"]
+        pairs, self.inverse = np.unique(keys, return_inverse=True)
+        self.pair_query = pairs // n_docs
+        self.pair_row = pairs % n_docs
+        self.tf = postings["tf"].astype("float64")
+        self.idf = postings["idf"].astype("float64")
+        self.length_ratio = postings["doc_len"] / float(postings["avgdl"]) if float(postings["avgdl"]) else 0.0
+
+    def run(self, k1, b, depth):
+        norm = k1 * (1 - b + b * self.length_ratio)
+        scores = np.bincount(self.inverse, self.idf * (self.tf * (k1 + 1) / (self.tf + norm)),
+                             minlength=len(self.pair_query))
+        # Best first within each query, then the first `depth` pairs of every query
+        order = np.lexsort((self.pair_row, -scores, self.pair_query))
+        query = self.pair_query[order]
+        starts = np.searchsorted(query, np.arange(self.n_queries))
+        rank = np.arange(len(order)) - starts[query]
+        keep = (rank < depth) & (scores[order] > 0)
+        rows = np.full((self.n_queries, depth), -1, dtype="int32")
+        top = np.full((self.n_queries, depth), np.nan, dtype="float32")
+        rows[query[keep], rank[keep]] = self.pair_row[order][keep]
+        top[query[keep], rank[keep]] = scores[order][keep]
+        return {"rows": rows, "scores": top}
+
+
+def tune_bm25(rescorer, judgments, k1_grid, b_grid, cutoff, metric):
+    """Metric of every k1/b pair; returns (best (k1, b), best score, {(k1, b): score})."""
+    results = {}
+    for k1, b in itertools.product(k1_grid, b_grid):
+        run = rescorer.run(k1, b, cutoff)
+        results[(k1, b)] = float(evaluate(judgments.relevant(run["rows"]), judgments.n_relevant, metric))
+    best = max(results, key=results.get)
+    return best, results[best], results
+
+
+# --- Fusion grid ---
+def weight_grid(n_engines, step):
+    """Every weight vector on the simplex with the given step (weights >= 0, sum 1)."""
+    units = round(1 / step)
+    grid = [combo for combo in itertools.product(range(units + 1), repeat=n_engines) if sum(combo) == units]
+    return np.array(grid, dtype="float64") / units
+
+
+def fusion_candidates(runs, depth):
+    """
+    The union of the engines' top-`depth` rows per query, as (queries, U) rows padded with -1,
+    and each engine's score and rank (0 = best) for them as (engines, queries, U) arrays,
+    NaN where it did not return the row.
+    """
+    # Engine by engine, best first: the order in which _fuse_results meets the documents,
+    # which decides between equal fused scores
+    stacked = np.concatenate([run["rows"][:, :depth] for run in runs], axis=1).astype("int64")
+    by_row = np.argsort(stacked, axis=1, kind="stable")
+    ordered = np.take_along_axis(stacked, by_row, axis=1)
+    later = np.zeros_like(stacked, dtype=bool)
+    later[:, 1:] = ordered[:, 1:] == ordered[:, :-1]
+    duplicate = np.zeros_like(later)
+    np.put_along_axis(duplicate, by_row, later, axis=1)
+    # Repeats and padding become -1 and move to the end, keeping the order of the rest
+    stacked[duplicate] = -1
+    candidates = np.take_along_axis(stacked, np.argsort(stacked < 0, axis=1, kind="stable"), axis=1)
+    candidates = candidates[:, :max(1, int((candidates >= 0).sum(axis=1).max()))]
+
+    n_rows = max(int(candidates.max()) + 1, 1)
+    query = np.arange(len(candidates), dtype="int64")[:, None]
+    candidate_keys = query * n_rows + candidates
+    scores = np.full((len(runs),) + candidates.shape, np.nan)
+    ranks = np.full((len(runs),) + candidates.shape, np.nan)
+    for e, run in enumerate(runs):
+        rows = run["rows"][:, :depth].astype("int64")
+        valid = rows >= 0
+        keys = (query * n_rows + rows)[valid]
+        order = np.argsort(keys)
+        keys, values = keys[order], run["scores"][:, :depth][valid][order]
+        positions = np.broadcast_to(np.arange(rows.shape[1]), rows.shape)[valid][order]
+        found = np.minimum(np.searchsorted(keys, candidate_keys), max(len(keys) - 1, 0))
+        hit = (candidates >= 0) & (keys[found] == candidate_keys) if len(keys) else np.zeros(candidates.shape, bool)
+        scores[e][hit] = values[found[hit]]
+        ranks[e][hit] = positions[found[hit]]
+    return candidates, scores, ranks
+
+
+def tune_fusion(runs, judgments, weights, depths, rrf_ks, methods, cutoff, metric, chunk_cells=20_000_000):
+    """Metric of every (depth, method, rrf_k, weights) setting; returns the settings and scores, best first."""
+    results = []
+    for depth in depths:
+        candidates, scores, ranks = fusion_candidates(runs, depth)
+        relevant = judgments.relevant(candidates)
+        padding = candidates < 0
+        for method in methods:
+            for rrf_k in (rrf_ks if method == "rrf" else [rrf_ks[0]]):
+                # RRF goes by each engine's own order, which also settles its equal scores
+                contributions = fusion_contributions(-ranks if method == "rrf" else scores, method, rrf_k)
+                chunk = max(1, chunk_cells // max(candidates.size, 1))
+                for start in range(0, len(weights), chunk):
+                    block = weights[start:start + chunk]
+                    fused = np.einsum("ge,equ->gqu", block, contributions)
+                    fused[:, padding] = -np.inf
+                    k = min(cutoff, fused.shape[-1])
+                    top = np.argsort(-fused, axis=-1, kind="stable")[..., :k]
+                    ranked = np.take_along_axis(np.broadcast_to(relevant, fused.shape), top, -1)
+                    if k < cutoff:
+                        ranked = np.pad(ranked, ((0, 0), (0, 0), (0, cutoff - k)))
+                    values = evaluate(ranked, judgments.n_relevant, metric)
+                    for w, value in zip(block, values):
+                        results.append(({"depth": depth, "method": method, "rrf_k": rrf_k,
+                                          "weights": w.tolist()}, float(value)))
+    results.sort(key=lambda item: item[1], reverse=True)
+    return results
+
+
+# --- Output ---
+def write_config(dataset, metric, section):
+    """Merges one dataset's tuned settings into SEARCH_CONFIG_PATH (atomically, other datasets kept)."""
+    config = {}
+    if SEARCH_CONFIG_PATH.exists():
+        with open(SEARCH_CONFIG_PATH, encoding="utf-8") as f:
+            config = json.load(f)
+    config["generated_at"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+    config["metric"] = metric
+    config.setdefault("datasets", {}).setdefault(dataset, {}).update(section)
+
+    os.makedirs(SEARCH_CONFIG_PATH.parent, exist_ok=True)
+    tmp_path = SEARCH_CONFIG_PATH.with_suffix(".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(config, f, indent=2)
+    os.replace(tmp_path, SEARCH_CONFIG_PATH)
+    print(f"Wrote the tuned settings of '{dataset}' to {SEARCH_CONFIG_PATH}")
+
+
+def _floats(text):
+    return [float(value) for value in text.split(",") if value]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tune BM25 k1/b and hybrid fusion over cached engine runs.")
+    parser.add_argument("--dataset", default="antique", choices=sorted(QRELS_FILES))
+    parser.add_argument("--queries", type=int, default=500, help="Judged queries to sample (0 = all).")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--metric", default="ndcg", choices=METRICS)
+    parser.add_argument("--cutoff", type=int, default=10, help="Rank cutoff of the metric (the API returns 10).")
+    parser.add_argument("--depth", type=int, default=100, help="Depth of the cached engine runs.")
+    parser.add_argument("--fusion-depths", default="10,20,50,100", help="Per-engine depths tried for fusion.")
+    parser.add_argument("--k1", default="0.6,0.9,1.2,1.5,1.8,2.1")
+    parser.add_argument("--b", default="0.3,0.45,0.6,0.75,0.9")
+    parser.add_argument("--rrf-k", default="10,20,30,60,100")
+    parser.add_argument("--methods", default=",".join(FUSION_METHODS))
+    parser.add_argument("--weight-step", type=float, default=0.1)
+    parser.add_argument("--dry-run", action="store_true", help="Report only; do not write the config.")
+    args = parser.parse_args()
+
+    # Engines resolve offline_data/, faiss_store/ and offline/ir_project.db relative to the working directory
+    os.chdir(BASE_DIR)
+    from services.database_utils import load_doc_ids
+    from services.search_service import HYBRID_WEIGHTS
+
+    doc_ids = load_doc_ids(args.dataset)
+    all_queries, qrels = load_queries(args.dataset), load_qrels(args.dataset)
+    judged = sorted(query_id for query_id in qrels if query_id in all_queries)
+    rng = np.random.default_rng(args.seed)
+    if 0 < args.queries < len(judged):
+        judged = sorted(rng.choice(judged, size=args.queries, replace=False).tolist())
+    judgments = Judgments(judged, qrels, doc_ids)
+    # Queries none of whose relevant documents are in the table cannot be scored
+    query_ids = [query_id for query_id, n in zip(judged, judgments.n_relevant) if n > 0]
+    judgments = Judgments(query_ids, qrels, doc_ids)
+    queries = [all_queries[query_id] for query_id in query_ids]
+    print(f"Tuning '{args.dataset}' on {len(queries)} judged queries ({args.metric}@{args.cutoff}).")
+
+    depth = max([args.depth] + [int(d) for d in _floats(args.fusion_depths)])
+    engines = list(HYBRID_WEIGHTS)
+    section = {}
+
+    # BM25 k1/b
+    defaults, best_bm25 = None, None
+    if os.path.exists(os.path.join("offline_data", f"bm25_{args.dataset}", "meta.json")):
+        postings = bm25_postings(args.dataset, queries, query_ids, doc_ids)
+        rescorer = Bm25Rescorer(postings, len(queries), len(doc_ids))
+        defaults = tuple(postings["defaults"].tolist())
+        k1_grid, b_grid = _floats(args.k1), _floats(args.b)
+        start = time.perf_counter()
+        best_bm25, best_score, grid = tune_bm25(rescorer, judgments, k1_grid, b_grid, args.cutoff, args.metric)
+        baseline = tune_bm25(rescorer, judgments, [defaults[0]], [defaults[1]], args.cutoff, args.metric)[1]
+        if best_score <= baseline:
+            # No grid point beats the defaults; keep them rather than a tie
+            best_bm25, best_score = defaults, baseline
+        print(f"BM25: {len(grid)} k1/b pairs in {time.perf_counter() - start:.1f}s; "
+              f"k1={defaults[0]}, b={defaults[1]}: {baseline:.4f} -> k1={best_bm25[0]}, b={best_bm25[1]}: {best_score:.4f}")
+        section["bm25"] = {"k1": best_bm25[0], "b": best_bm25[1], "score": round(best_score, 4),
+                           "baseline": round(baseline, 4)}
+
+    # Fusion
+    runs, baseline_runs = [], []
+    for engine in engines:
+        if engine == "bm25" and best_bm25 is not None:
+            runs.append(rescorer.run(*best_bm25, depth))
+            baseline_runs.append(rescorer.run(*defaults, depth))
+        else:
+            runs.append(engine_run(args.dataset, engine, queries, depth, doc_ids, query_ids))
+            baseline_runs.append(runs[-1])
+
+    default_weights = np.array([[HYBRID_WEIGHTS[engine] for engine in engines]])
+    baseline = tune_fusion(baseline_runs, judgments, default_weights, [10], [60], ["minmax"],
+                           args.cutoff, args.metric)[0][1]
+    start = time.perf_counter()
+    weights = weight_grid(len(engines), args.weight_step)
+    depths = [int(d) for d in _floats(args.fusion_depths) if d <= depth]
+    methods = [method for method in args.methods.split(",") if method]
+    results = tune_fusion(runs, judgments, weights, depths, [int(k) for k in _floats(args.rrf_k)], methods,
+                          args.cutoff, args.metric)
+    settings, best_score = results[0]
+    if best_score <= baseline:
+        settings, best_score = {"depth": 10, "method": "minmax", "rrf_k": 60,
+                                "weights": default_weights[0].tolist()}, baseline
+    print(f"Fusion: {len(results)} settings in {time.perf_counter() - start:.1f}s")
+    print(f"  default ({', '.join(f'{e}={w}' for e, w in HYBRID_WEIGHTS.items())}, minmax, depth 10): {baseline:.4f}")
+    for candidate, score in results[:5]:
+        described = ", ".join(f"{e}={w:.2f}" for e, w in zip(engines, candidate["weights"]))
+        print(f"  {score:.4f}  {described}, {candidate['method']}"
+              f"{'(k=%d)' % candidate['rrf_k'] if candidate['method'] == 'rrf' else ''}, depth {candidate['depth']}")
+    section["hybrid"] = {
+        "engines": engines,
+        "weights": {engine: round(weight, 4) for engine, weight in zip(engines, settings["weights"])},
+        "method": settings["method"],
+        "rrf_k": settings["rrf_k"],
+        "depth": settings["depth"],
+        "score": round(best_score, 4),
+        "baseline": round(baseline, 4),
+    }
+
+    if args.dry_run:
+        print(json.dumps(section, indent=2))
+    else:
+        write_config(args.dataset, args.metric, section)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+# services/array_utils.py
+
+import numpy as np
+
+
+def top_k_indices(scores, k):
+    """
+    Returns the indices of the k highest scores, best first.
+    Uses argpartition so only the selected k entries are fully sorted.
+    """
+    n = len(scores)
+    if n == 0 or k <= 0:
+        return np.empty(0, dtype="int64")
+    if k >= n:
+        return np.argsort(scores)[::-1]
+    top = np.argpartition(scores, n - k)[n - k:]
+    return top[np.argsort(scores[top])[::-1]]
+
+
+def restricted_top_k(scores, k, rows=None, mask=None):
+    """
+    Returns (row ids, scores) of the k best rows, best first. With `rows` (sorted
+    row ids) only those rows compete, e.g. the matches of a phrase constraint; with
+    `mask` (bool per row) only the rows set in it.
+    """
+    if mask is not None:
+        scores = np.where(mask, scores, -np.inf)
+        top = top_k_indices(scores, k)
+        top = top[np.isfinite(scores[top])]
+        return top, scores[top]
+    if rows is None:
+        top = top_k_indices(scores, k)
+        return top, scores[top]
+    rows = np.asarray(rows, dtype="int64")
+    subset = scores[rows]
+    top = top_k_indices(subset, k)
+    return rows[top], subset[top]
+
+
+def drop_unmatched(rows, scores):
+    """
+    Drops the rows a lexical query does not match (score 0) from a top-k. Otherwise fewer
+    matches than k are padded with arbitrary zero-score rows: FTS returns only matches, and
+    offline/tune_fusion.py tunes fusion on runs of matches only.
+    """
+    matched = scores > 0
+    return rows[matched], scores[matched]
+
+
+def shard_row_offsets(n_rows, num_shards):
+    """
+    Splits rows [0, n_rows) into `num_shards` contiguous, near-equal ranges.
+    Returns num_shards + 1 offsets; shard s covers [offsets[s], offsets[s + 1]).
+    """
+    num_shards = max(1, min(num_shards, n_rows)) if n_rows else 1
+    return [n_rows * s // num_shards for s in range(num_shards + 1)]
+
+
+def shard_dir_name(shard):
+    return f"shard_{shard:03d}"
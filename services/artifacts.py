@@ -0,0 +1,70 @@
+# services/artifacts.py
+
+import contextlib
+import os
+import shutil
+import time
+from pathlib import Path
+
+# Published versions kept per artifact: the live one and the one a draining generation may still read
+KEEP_VERSIONS = int(os.getenv("IR_ARTIFACT_VERSIONS", "2"))
+
+
+def resolve_artifact(path):
+    """
+    The version directory `path` points at right now. Readers open every file through it,
+    so a later publish never changes what an already loaded generation reads.
+    """
+    return Path(os.path.realpath(path))
+
+
+def artifact_stamp(path):
+    """(mtime, size) of an artifact file: tells the files of two builds apart, even ones rewritten in place."""
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _versions(path):
+    prefix = f"{path.name}.v"
+    return sorted((entry for entry in path.parent.iterdir()
+                   if entry.name.startswith(prefix) and entry.is_dir() and not entry.is_symlink()),
+                  key=lambda entry: entry.name)
+
+
+@contextlib.contextmanager
+def publish_directory(path):
+    """
+    Yields an empty staging directory to write an artifact into. When the block finishes,
+    the staging directory becomes the version directory `<path>.v<time>`. `path` is then
+    atomically re-pointed at it with a symlink swap.
+
+    The files of earlier versions are never rewritten, so engines that mapped them keep
+    working until their generation is released. Only the newest KEEP_VERSIONS versions
+    are kept. If the block raises, the staging directory is removed and `path` is
+    left unchanged.
+    """
+    path = Path(path)
+    os.makedirs(path.parent, exist_ok=True)
+    staging = path.parent / f".{path.name}.{os.getpid()}.tmp"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    try:
+        yield staging
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    version = path.parent / f"{path.name}.v{time.time_ns()}"
+    os.rename(staging, version)
+    if path.exists() and not path.is_symlink():
+        # Written in place by an older build: it becomes a version of its own
+        os.rename(path, path.parent / f"{path.name}.v0")
+    link = path.parent / f".{path.name}.{os.getpid()}.link"
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(link)
+    os.symlink(version.name, link)
+    os.replace(link, path)
+
+    # Unlinking files another process has mapped is safe; only rewriting them in place is not
+    for old in _versions(path)[:-KEEP_VERSIONS]:
+        shutil.rmtree(old, ignore_errors=True)
@@ -0,0 +1,183 @@
+# services/bm25_index.py
+
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+from services.term_table import TermTable, write_term_table
+from services.doc_id_table import write_doc_id_table
+from services.array_utils import shard_row_offsets, shard_dir_name
+from services.artifacts import resolve_artifact, artifact_stamp
+
+BM25_FORMAT = "bm25-columnar"
+BM25_FORMAT_VERSION = 1
+
+# Same defaults as rank_bm25.BM25Okapi, so scores match the old pickled model
+DEFAULT_K1 = 1.5
+DEFAULT_B = 0.75
+DEFAULT_EPSILON = 0.25
+
+
+# --- Offline writer ---
+def write_bm25_index(directory, tokenized_docs, k1=DEFAULT_K1, b=DEFAULT_B, epsilon=DEFAULT_EPSILON, num_shards=1,
+                     doc_ids=None):
+    """
+    Writes a columnar BM25 index for `tokenized_docs` (one token list per row):
+      - terms.bin / terms_offsets.npy : sorted term dictionary, position = term id
+      - postings_ptr.npy              : int64, postings of term t are [ptr[t], ptr[t + 1])
+      - postings_docs.npy             : int32 row ids, ascending within a term
+      - postings_tf.npy               : term frequency of the term in that row
+      - doc_len.npy                   : int32 token count per row
+      - idf.npy                       : float64 idf per term (BM25Okapi formula and epsilon floor)
+      - meta.json                     : corpus statistics and default parameters
+      - doc_ids.*                     : with `doc_ids`, the row -> doc_id table (services/doc_id_table.py)
+
+    With num_shards > 1 the rows are split into contiguous ranges and each range gets
+    its own postings_*.npy and doc_len.npy under shard_NNN/ (row ids local to the shard).
+    The term table, idf and avgdl stay at the top level and are computed over the whole
+    corpus, so every shard scores exactly like the unsharded index.
+    """
+    directory = Path(directory)
+    os.makedirs(directory, exist_ok=True)
+
+    n_docs = len(tokenized_docs)
+    doc_len = np.fromiter((len(doc) for doc in tokenized_docs), dtype="int64", count=n_docs)
+
+    vocabulary = sorted({token for doc in tokenized_docs for token in doc})
+    term_ids = {term: i for i, term in enumerate(vocabulary)}
+    n_terms = len(vocabulary)
+
+    # One (term, row) key per token occurrence; unique() groups them by term, then row
+    token_ids = np.fromiter((term_ids[token] for doc in tokenized_docs for token in doc),
+                            dtype="int64", count=int(doc_len.sum()))
+    token_rows = np.repeat(np.arange(n_docs, dtype="int64"), doc_len)
+    keys, tf = np.unique(token_ids * max(n_docs, 1) + token_rows, return_counts=True)
+    posting_terms = keys // max(n_docs, 1)
+    posting_docs = keys % max(n_docs, 1)
+
+    df = np.bincount(posting_terms, minlength=n_terms)
+    idf = np.log(n_docs - df + 0.5) - np.log(df + 0.5)
+    average_idf = float(idf.mean()) if n_terms else 0.0
+    idf[idf < 0] = epsilon * average_idf
+
+    tf_dtype = "uint16" if tf.size == 0 or tf.max() <= np.iinfo("uint16").max else "uint32"
+
+    write_term_table(directory, vocabulary)
+    np.save(directory / "idf.npy", idf.astype("float64"))
+
+    row_offsets = shard_row_offsets(n_docs, num_shards)
+    for shard in range(len(row_offsets) - 1):
+        lo, hi = row_offsets[shard], row_offsets[shard + 1]
+        shard_dir = directory if len(row_offsets) == 2 else directory / shard_dir_name(shard)
+        os.makedirs(shard_dir, exist_ok=True)
+
+        # Selecting a row range keeps the (term, row) order, so postings stay grouped by term
+        in_shard = (posting_docs >= lo) & (posting_docs < hi)
+        postings_ptr = np.zeros(n_terms + 1, dtype="int64")
+        postings_ptr[1:] = np.cumsum(np.bincount(posting_terms[in_shard], minlength=n_terms))
+
+        np.save(shard_dir / "postings_ptr.npy", postings_ptr)
+        np.save(shard_dir / "postings_docs.npy", (posting_docs[in_shard] - lo).astype("int32"))
+        np.save(shard_dir / "postings_tf.npy", tf[in_shard].astype(tf_dtype))
+        np.save(shard_dir / "doc_len.npy", doc_len[lo:hi].astype("int32"))
+
+    meta = {
+        "format": BM25_FORMAT,
+        "version": BM25_FORMAT_VERSION,
+        "n_docs": n_docs,
+        "n_terms": n_terms,
+        "n_postings": int(posting_docs.size),
+        "avgdl": float(doc_len.sum()) / n_docs if n_docs else 0.0,
+        "k1": k1,
+        "b": b,
+        "epsilon": epsilon,
+        "num_shards": len(row_offsets) - 1,
+        "row_offsets": row_offsets,
+    }
+    if doc_ids is not None:
+        meta["doc_ids_fingerprint"] = write_doc_id_table(directory, doc_ids)["fingerprint"]
+    with open(directory / "meta.json", "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+# --- Query-time reader ---
+class Bm25Index:
+    """
+    Memory-mapped BM25 index written by `write_bm25_index`.
+    Every array is opened with mmap_mode='r', so loading is a handful of
+    syscalls and all worker processes share the pages through the OS page cache.
+
+    For a sharded index, `Bm25Index(directory)` opens only the shared term table and
+    idf (`is_sharded` is True; scoring goes through services.sharded_search), while
+    `Bm25Index(directory, shard=s)` opens one shard and scores its rows locally.
+    """
+
+    def __init__(self, directory, shard=None):
+        # Pinned to the version published right now (services/artifacts.py)
+        directory = resolve_artifact(directory)
+        meta_path = directory / "meta.json"
+        if not meta_path.exists():
+            raise FileNotFoundError(f"BM25 index not found at '{directory}'. Run offline/bm25_service.py first.")
+        with open(meta_path, encoding="utf-8") as f:
+            self.meta = json.load(f)
+        if self.meta.get("format") != BM25_FORMAT:
+            raise ValueError(f"'{directory}' does not contain a {BM25_FORMAT} index.")
+
+        self.directory = directory
+        # Identifies this build to the shard pool workers (services/sharded_search.py)
+        self.stamp = artifact_stamp(meta_path)
+        self.terms = TermTable(directory)
+        self.idf = np.load(directory / "idf.npy", mmap_mode="r")
+
+        self.row_offsets = self.meta.get("row_offsets", [0, self.meta["n_docs"]])
+        self.num_shards = len(self.row_offsets) - 1
+        self.is_sharded = self.num_shards > 1 and shard is None
+        self.n_docs = self.meta["n_docs"]
+        self.avgdl = self.meta["avgdl"]
+        self.k1 = self.meta["k1"]
+        self.b = self.meta["b"]
+
+        if self.is_sharded:
+            return
+        shard_dir = directory
+        if shard is not None and self.num_shards > 1:
+            shard_dir = directory / shard_dir_name(shard)
+            self.n_docs = self.row_offsets[shard + 1] - self.row_offsets[shard]
+        self.postings_ptr = np.load(shard_dir / "postings_ptr.npy", mmap_mode="r")
+        self.postings_docs = np.load(shard_dir / "postings_docs.npy", mmap_mode="r")
+        self.postings_tf = np.load(shard_dir / "postings_tf.npy", mmap_mode="r")
+        self.doc_len = np.load(shard_dir / "doc_len.npy", mmap_mode="r")
+
+    def __len__(self):
+        return self.n_docs
+
+    def postings(self, term_id):
+        """Returns (row ids, term frequencies) for one term id."""
+        start, end = self.postings_ptr[term_id], self.postings_ptr[term_id + 1]
+        return self.postings_docs[start:end], self.postings_tf[start:end]
+
+    def get_scores(self, tokens, k1=None, b=None):
+        """
+        BM25 score of every row for the query tokens; equivalent to
+        BM25Okapi.get_scores (repeated query tokens count once per occurrence).
+        Only the postings of the query terms are touched. k1 / b default to the
+        index's own (meta.json, or the tuned values set by search_service).
+        """
+        scores = np.zeros(self.n_docs, dtype="float64")
+        if not self.n_docs or not self.avgdl:
+            return scores
+
+        k1 = self.k1 if k1 is None else k1
+        b = self.b if b is None else b
+        for token in tokens:
+            term_id = self.terms.lookup(token)
+            if term_id < 0:
+                continue
+            docs, tf = self.postings(term_id)
+            tf = tf.astype("float64")
+            norm = k1 * (1 - b + b * self.doc_len[docs] / self.avgdl)
+            scores[docs] += self.idf[term_id] * (tf * (k1 + 1) / (tf + norm))
+        return scores
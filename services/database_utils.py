@@ -1,16 +1,73 @@
 # services/database_utils.py
 
+import hashlib
+import json
 import sqlite3
 from pathlib import Path
 
+from services.docstore import DocStore
+from services.doc_id_table import DocIdTable, write_doc_id_table, has_doc_id_table
+from services.artifacts import publish_directory
+
 # Ensure this path is correct relative to your project's root directory
 DB_PATH = Path("offline/ir_project.db") 
+DOC_IDS_DIR = Path("offline_data")
+DOCSTORE_DIR = Path("offline_data")
+
+# Columns of a dataset table the document store is built from (and fingerprinted over)
+DOCSTORE_COLUMNS = "doc_id, doc"
+
+def table_fingerprint(table, columns, db_path=DB_PATH):
+    """Hashes every row of `columns` in `table`, in rowid order."""
+    digest = hashlib.blake2b(digest_size=16)
+    conn = sqlite3.connect(db_path)
+    try:
+        cursor = conn.execute(f"SELECT {columns} FROM `{table}` ORDER BY rowid")
+        while True:
+            rows = cursor.fetchmany(10000)
+            if not rows:
+                break
+            for row in rows:
+                digest.update("\x1f".join("" if value is None else str(value) for value in row).encode("utf-8"))
+                digest.update(b"\x1e")
+    finally:
+        conn.close()
+    return digest.hexdigest()
 
-def get_doc_text_by_id(dataset: str, doc_id: str) -> str:
+def open_docstore(dataset: str):
     """
-    Fetches the full text of a single document from the SQLite database
-    for a given dataset and document ID.
+    Opens the dataset's compressed document store (offline/docstore_service.py), or returns None
+    when it has not been built or its source table has changed since. Other stages writing the
+    database (dedup, FTS) do not matter: the table itself is compared, by the fingerprint the
+    store records. That hashes the whole table, so the search service calls this once per engine
+    generation (at load / reload), never per document.
     """
+    meta_path = DOCSTORE_DIR / f"docstore_{dataset}" / "meta.json"
+    if not meta_path.exists() or not DB_PATH.exists():
+        return None
+    docstore = DocStore(DOCSTORE_DIR / f"docstore_{dataset}")
+    source = docstore.meta.get("source_fingerprint")
+    if source is None:
+        # Stores built before they recorded their source: only trust them while the database is older
+        fresh = meta_path.stat().st_mtime_ns >= DB_PATH.stat().st_mtime_ns
+    else:
+        try:
+            fresh = table_fingerprint(dataset, DOCSTORE_COLUMNS) == source
+        except sqlite3.OperationalError:
+            fresh = False
+    if not fresh:
+        print(f"Warning: the docstore of '{dataset}' does not match its table; reading documents from SQLite.")
+        return None
+    return docstore
+
+def get_doc_text_by_id(dataset: str, doc_id: str, docstore=None) -> str:
+    """
+    Fetches the full text of a single document for a given dataset and document ID,
+    from `docstore` (see open_docstore) when given, else from the SQLite database.
+    """
+    if docstore is not None:
+        return docstore.get(doc_id)
+
     conn = None
     try:
         conn = sqlite3.connect(DB_PATH)
@@ -28,4 +85,81 @@ def get_doc_text_by_id(dataset: str, doc_id: str) -> str:
         return ""
     finally:
         if conn:
-            conn.close()
\ No newline at end of file
+            conn.close()
+
+
+def _has_table(conn, name: str) -> bool:
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)).fetchone() is not None
+
+def indexed_docs_filter(conn, dataset: str) -> str:
+    """
+    SQL condition (" WHERE ...") selecting the documents the indexes hold: one per near-duplicate
+    cluster when offline/dedup_service.py has written `<dataset>_dups`, else "" (every document).
+    Builders and the fallback row -> doc_id table select through indexed_docs_query below.
+    """
+    if not _has_table(conn, f"{dataset}_dups"):
+        return ""
+    return f" WHERE doc_id NOT IN (SELECT doc_id FROM `{dataset}_dups`)"
+
+def collapsed_doc_ids(dataset: str) -> set:
+    """doc_ids left out of the indexes as near-duplicates of another document (empty without dedup)."""
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        if not _has_table(conn, f"{dataset}_dups"):
+            return set()
+        return {doc_id for (doc_id,) in conn.execute(f"SELECT doc_id FROM `{dataset}_dups`")}
+    finally:
+        conn.close()
+
+def get_duplicates(dataset: str, doc_ids) -> dict:
+    """{canonical doc_id: [doc_ids collapsed into it]} for the given canonical ids (empty without dedup)."""
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        if not _has_table(conn, f"{dataset}_dups"):
+            return {}
+        rows = conn.execute(
+            f"SELECT canonical_id, doc_id FROM `{dataset}_dups` "
+            f"WHERE canonical_id IN (SELECT value FROM json_each(?)) ORDER BY doc_id",
+            (json.dumps(list(doc_ids)),),
+        ).fetchall()
+    finally:
+        conn.close()
+    duplicates = {}
+    for canonical_id, doc_id in rows:
+        duplicates.setdefault(canonical_id, []).append(doc_id)
+    return duplicates
+
+
+def indexed_docs_query(conn, dataset: str, columns: str = "doc_id") -> str:
+    """
+    SELECT of the documents the indexes hold, in the row order every builder indexes them in
+    (rowid). The row -> doc_id fallback table below reads with the same query so rows line up.
+    """
+    return f"SELECT {columns} FROM `{dataset}`{indexed_docs_filter(conn, dataset)} ORDER BY rowid"
+
+
+def load_doc_ids(dataset: str, directory=None) -> DocIdTable:
+    """
+    The row -> doc_id table of an index: the one its builder wrote into `directory`
+    (services/doc_id_table.py), memory-mapped. Indexes built before builders wrote
+    tables, and callers without an index, get a table read from SQLite in the builders'
+    row order (near-duplicates left out), materialized once into
+    offline_data/doc_ids_<dataset>/ and rebuilt whenever the database is newer.
+    """
+    if directory is not None and has_doc_id_table(directory):
+        return DocIdTable(directory)
+
+    cache_dir = DOC_IDS_DIR / f"doc_ids_{dataset}"
+    meta_path = cache_dir / "doc_ids.json"
+    if not meta_path.exists() or meta_path.stat().st_mtime < DB_PATH.stat().st_mtime:
+        conn = sqlite3.connect(DB_PATH)
+        try:
+            ids = [doc_id for (doc_id,) in conn.execute(indexed_docs_query(conn, dataset))]
+        finally:
+            conn.close()
+
+        # Published as a new version, so concurrently starting workers never map a half-written table
+        with publish_directory(cache_dir) as staging:
+            write_doc_id_table(staging, ids)
+
+    return DocIdTable(cache_dir)
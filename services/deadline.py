@@ -0,0 +1,40 @@
+# services/deadline.py
+
+import contextlib
+import contextvars
+import os
+import time
+
+# Latency budget of a search request: the X-Search-Budget-Ms header or the `budget_ms` field,
+# else IR_SEARCH_BUDGET_MS (0 = no deadline). Work that misses it is cancelled or ignored.
+DEFAULT_BUDGET_MS = int(os.getenv("IR_SEARCH_BUDGET_MS", "0"))
+BUDGET_HEADER = "x-search-budget-ms"
+
+# Absolute time.monotonic() deadline of the current request. Context variables follow the request
+# into its asyncio tasks and asyncio.to_thread workers, so engines can check it too.
+_deadline = contextvars.ContextVar("search_deadline", default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised by work that gave up because the request's budget ran out."""
+
+
+@contextlib.contextmanager
+def deadline_scope(budget_ms):
+    """Sets the deadline to now + budget_ms for the enclosed code; no deadline for a falsy budget."""
+    token = _deadline.set(time.monotonic() + budget_ms / 1000 if budget_ms else None)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining():
+    """Seconds left before the deadline (0 when past it), or None without a deadline."""
+    deadline = _deadline.get()
+    return None if deadline is None else max(0.0, deadline - time.monotonic())
+
+
+def expired():
+    deadline = _deadline.get()
+    return deadline is not None and time.monotonic() >= deadline
@@ -0,0 +1,64 @@
+# services/doc_filter.py
+
+from typing import NamedTuple, Optional
+
+import faiss
+import numpy as np
+
+
+class DocFilter(NamedTuple):
+    """
+    Which documents a search may return: only `include` (when given) minus `exclude`.
+    Hashable, so it is part of the result-cache key.
+    """
+    include: Optional[frozenset] = None
+    exclude: frozenset = frozenset()
+
+    @classmethod
+    def from_ids(cls, include=None, exclude=None):
+        """Returns a DocFilter, or None when neither list restricts anything."""
+        if include is None and not exclude:
+            return None
+        return cls(frozenset(include) if include is not None else None, frozenset(exclude or ()))
+
+
+def compile_row_mask(doc_ids, doc_filter):
+    """
+    Compiles `doc_filter` into a bool mask over the rows of `doc_ids` (a DocIdTable).
+    Ids that are not in the dataset are ignored.
+    """
+    if doc_filter.include is not None:
+        mask = np.zeros(len(doc_ids), dtype=bool)
+        mask[doc_ids.rows(doc_filter.include)] = True
+    else:
+        mask = np.ones(len(doc_ids), dtype=bool)
+    mask[doc_ids.rows(doc_filter.exclude)] = False
+    return mask
+
+
+def eligible_rows(doc_ids, doc_filter, rows=None):
+    """
+    Combines `doc_filter` with an optional sorted row subset (e.g. phrase matches) into
+    (rows, mask) for `restricted_top_k`: a short row list when the filter is an allow-list
+    or a subset is given, otherwise a mask over all rows (an exclusion list).
+    """
+    if doc_filter is None:
+        return rows, None
+    mask = compile_row_mask(doc_ids, doc_filter)
+    if rows is not None:
+        return rows[mask[rows]], None
+    if doc_filter.include is not None:
+        return np.flatnonzero(mask), None
+    return None, mask
+
+
+def faiss_search_params(mask):
+    """SearchParameters restricting a FAISS search to the rows set in `mask` (None: no restriction)."""
+    if mask is None:
+        return None
+    bitmap = np.packbits(mask, bitorder="little")
+    selector = faiss.IDSelectorBitmap(mask.size, faiss.swig_ptr(bitmap))
+    params = faiss.SearchParameters(sel=selector)
+    # SWIG objects only hold raw pointers; keep the selector and bitmap alive with the params
+    params.selector, params.bitmap = selector, bitmap
+    return params
@@ -0,0 +1,171 @@
+# services/doc_id_table.py
+
+import hashlib
+import json
+import mmap
+import os
+import zlib
+from pathlib import Path
+
+import numpy as np
+
+from services.artifacts import resolve_artifact
+
+DOC_ID_TABLE_FORMAT = "doc-id-table"
+DOC_ID_TABLE_VERSION = 1
+
+
+def _pack(doc_ids):
+    encoded = [doc_id.encode("utf-8") for doc_id in doc_ids]
+    offsets = np.zeros(len(encoded) + 1, dtype="int64")
+    if encoded:
+        offsets[1:] = np.cumsum([len(key) for key in encoded])
+    return encoded, offsets, b"".join(encoded)
+
+
+def _fingerprint(offsets, blob):
+    """Content hash of a table: equal fingerprints mean the same ids in the same row order."""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(np.ascontiguousarray(offsets, dtype="<i8").tobytes())
+    digest.update(blob)
+    return digest.hexdigest()
+
+
+def doc_ids_fingerprint(doc_ids):
+    """Fingerprint a table of `doc_ids` (in this row order) would have, for artifacts that do not ship one."""
+    _, offsets, blob = _pack(doc_ids)
+    return _fingerprint(offsets, blob)
+
+
+def _hash_keys(encoded):
+    return np.fromiter((zlib.crc32(key) for key in encoded), dtype="int64", count=len(encoded))
+
+
+def _build_slots(hashes, n_slots):
+    """
+    Open-addressing (linear probing) table of rows: slot -> row, -1 = empty.
+    Placed in rounds: every unplaced row claims its next probe slot, and of the rows
+    claiming the same empty slot the lowest one wins, so lookups find the first row of an id.
+    """
+    mask = n_slots - 1
+    slots = np.full(n_slots, -1, dtype="int32")
+    pending = np.arange(len(hashes), dtype="int64")
+    probe = hashes & mask
+    while pending.size:
+        free = slots[probe] < 0
+        claimed, first = np.unique(probe[free], return_index=True)
+        winners = pending[free][first]
+        slots[claimed] = winners
+        placed = np.zeros(pending.size, dtype=bool)
+        placed[np.flatnonzero(free)[first]] = True
+        pending, probe = pending[~placed], (probe[~placed] + 1) & mask
+    return slots
+
+
+def write_doc_id_table(directory, doc_ids, name="doc_ids"):
+    """
+    Writes the row -> doc_id map of an index in the exact row order it was built with:
+      - {name}.bin          : every doc_id's UTF-8 bytes concatenated, row order
+      - {name}_offsets.npy  : int64 offsets, row i is bin[offsets[i]:offsets[i + 1]]
+      - {name}_hash.npy     : int32 open-addressing slots (crc32, linear probing), -1 = empty
+      - {name}.json         : row count and fingerprint, which the index records too
+    Returns the meta dict.
+    """
+    directory = Path(directory)
+    os.makedirs(directory, exist_ok=True)
+
+    encoded, offsets, blob = _pack(doc_ids)
+
+    # At most half full, so probe chains stay short
+    n_slots = 1 << max(2 * len(encoded) - 1, 1).bit_length()
+    slots = _build_slots(_hash_keys(encoded), n_slots)
+
+    with open(directory / f"{name}.bin", "wb") as f:
+        f.write(blob)
+    np.save(directory / f"{name}_offsets.npy", offsets)
+    np.save(directory / f"{name}_hash.npy", slots)
+
+    meta = {
+        "format": DOC_ID_TABLE_FORMAT,
+        "version": DOC_ID_TABLE_VERSION,
+        "n_docs": len(encoded),
+        "hash_slots": n_slots,
+        "fingerprint": _fingerprint(offsets, blob),
+    }
+    with open(directory / f"{name}.json", "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+def has_doc_id_table(directory, name="doc_ids"):
+    return (Path(directory) / f"{name}.json").exists()
+
+
+class DocIdTable:
+    """
+    Read-only, memory-mapped view of a table written by `write_doc_id_table`.
+    row -> doc_id slices the mapped bytes; doc_id -> row probes the mapped hash slots.
+    Both are O(1), and opening the table creates no per-id Python objects.
+    """
+
+    def __init__(self, directory, name="doc_ids"):
+        # Pinned to the version published right now (services/artifacts.py)
+        directory = resolve_artifact(directory)
+        with open(directory / f"{name}.json", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        if self.meta.get("format") != DOC_ID_TABLE_FORMAT:
+            raise ValueError(f"'{directory}' does not contain a {DOC_ID_TABLE_FORMAT}.")
+
+        self.directory = directory
+        self.fingerprint = self.meta["fingerprint"]
+        self.offsets = np.load(directory / f"{name}_offsets.npy", mmap_mode="r")
+        self._offsets = memoryview(self.offsets)  # plain int indexing without numpy scalars
+        self._slots = memoryview(np.load(directory / f"{name}_hash.npy", mmap_mode="r"))
+        self._mask = len(self._slots) - 1
+
+        with open(directory / f"{name}.bin", "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            # mmap refuses zero-length files; an empty dataset is still a valid table
+            self._blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def _key(self, i):
+        return self._blob[self._offsets[i]:self._offsets[i + 1]]
+
+    def __getitem__(self, i):
+        i = int(i)
+        if not 0 <= i < len(self):
+            raise IndexError(f"row {i} out of range for {len(self)} doc_ids")
+        return self._key(i).decode("utf-8")
+
+    def row(self, doc_id):
+        """Row of `doc_id`, or -1 if the index does not hold it."""
+        key = doc_id.encode("utf-8")
+        slot = zlib.crc32(key) & self._mask
+        while True:
+            i = self._slots[slot]
+            if i < 0:
+                return -1
+            if self._key(i) == key:
+                return i
+            slot = (slot + 1) & self._mask
+
+    def lookup(self, doc_ids):
+        """Row of each doc_id, -1 for ids the index does not hold."""
+        return np.fromiter((self.row(doc_id) for doc_id in doc_ids), dtype="int64")
+
+    def rows(self, doc_ids):
+        """Sorted, distinct rows of the given doc_ids; unknown ids are skipped."""
+        rows = self.lookup(doc_ids)
+        return np.unique(rows[rows >= 0])
+
+    def verify(self, n_docs, fingerprint=None, source="index"):
+        """Raises ValueError unless the table has `n_docs` rows and (when given) the recorded fingerprint."""
+        if len(self) != n_docs:
+            raise ValueError(f"{source} has {n_docs} rows but its doc_id table '{self.directory}' has {len(self)}; "
+                             "rebuild the index.")
+        if fingerprint is not None and fingerprint != self.fingerprint:
+            raise ValueError(f"{source} was built with a different doc_id table than '{self.directory}'; "
+                             "rebuild the index.")
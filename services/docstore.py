@@ -0,0 +1,133 @@
+# services/docstore.py
+
+import json
+import mmap
+import os
+import threading
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+from services.term_table import TermTable, write_term_table
+from services.artifacts import resolve_artifact
+
+BLOCK_SIZE = 64 * 1024        # uncompressed bytes per block; one block is inflated per lookup
+COMPRESSION_LEVEL = 6
+BLOCK_CACHE_SIZE = int(os.getenv("IR_DOCSTORE_BLOCK_CACHE", "256"))
+
+
+def write_docstore(directory, rows, block_size=BLOCK_SIZE, source_fingerprint=None):
+    """
+    Writes (doc_id, text) rows, sorted by doc_id, as a compressed document store:
+      - docs.bin           : zlib-compressed blocks of concatenated UTF-8 texts
+      - block_offsets.npy  : int64, block b is docs.bin[offsets[b]:offsets[b + 1]]
+      - doc_block.npy      : int32 block of each document
+      - doc_start.npy      : uint32 byte offset of each document inside its inflated block
+      - doc_ids.bin/_offsets.npy : sorted doc_id term table; a doc's position is its number
+    `source_fingerprint` (the source table's content hash) goes into meta.json; the API
+    serves the store only if the table still has that fingerprint when it loads it.
+    """
+    directory = Path(directory)
+    os.makedirs(directory, exist_ok=True)
+
+    doc_ids, doc_block, doc_start = [], [], []
+    block_offsets = [0]
+    pending, pending_size = [], 0
+    raw_bytes = 0
+
+    with open(directory / "docs.bin", "wb") as out:
+        def flush():
+            nonlocal pending, pending_size
+            if pending:
+                compressed = zlib.compress(b"".join(pending), COMPRESSION_LEVEL)
+                out.write(compressed)
+                block_offsets.append(block_offsets[-1] + len(compressed))
+                pending, pending_size = [], 0
+
+        for doc_id, text in rows:
+            encoded = (text or "").encode("utf-8")
+            if pending and pending_size + len(encoded) > block_size:
+                flush()
+            doc_ids.append(doc_id)
+            doc_block.append(len(block_offsets) - 1)
+            doc_start.append(pending_size)
+            pending.append(encoded)
+            pending_size += len(encoded)
+            raw_bytes += len(encoded)
+        flush()
+
+    doc_block = np.array(doc_block, dtype="int32")
+    doc_start = np.array(doc_start, dtype="uint32")
+    write_term_table(directory, doc_ids, name="doc_ids")
+    np.save(directory / "block_offsets.npy", np.array(block_offsets, dtype="int64"))
+    np.save(directory / "doc_block.npy", doc_block)
+    np.save(directory / "doc_start.npy", doc_start)
+
+    meta = {
+        "format": "docstore-zlib",
+        "n_docs": len(doc_ids),
+        "n_blocks": len(block_offsets) - 1,
+        "block_size": block_size,
+        "raw_bytes": raw_bytes,
+        "compressed_bytes": block_offsets[-1],
+        "source_fingerprint": source_fingerprint,
+    }
+    with open(directory / "meta.json", "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+class DocStore:
+    """
+    Read-only, memory-mapped view of a store written by `write_docstore`.
+    `get(doc_id)` binary-searches the doc_id table and inflates the document's block;
+    the most recently used blocks stay inflated in an LRU.
+    """
+
+    def __init__(self, directory):
+        # Pinned to the version published right now (services/artifacts.py)
+        directory = resolve_artifact(directory)
+        with open(directory / "meta.json", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.doc_ids = TermTable(directory, name="doc_ids")
+        self._block_offsets = memoryview(np.load(directory / "block_offsets.npy", mmap_mode="r"))
+        self._doc_block = memoryview(np.load(directory / "doc_block.npy", mmap_mode="r"))
+        self._doc_start = memoryview(np.load(directory / "doc_start.npy", mmap_mode="r"))
+
+        with open(directory / "docs.bin", "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            self._blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+        self._blocks = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    def _block(self, b):
+        with self._lock:
+            block = self._blocks.get(b)
+            if block is not None:
+                self._blocks.move_to_end(b)
+                return block
+        block = zlib.decompress(self._blob[self._block_offsets[b]:self._block_offsets[b + 1]])
+        with self._lock:
+            self._blocks[b] = block
+            while len(self._blocks) > BLOCK_CACHE_SIZE:
+                self._blocks.popitem(last=False)
+        return block
+
+    def text(self, i):
+        """Text of document number `i` (its position in doc_id order)."""
+        b = self._doc_block[i]
+        block = self._block(b)
+        start = self._doc_start[i]
+        # A document ends where the next one starts, unless the next one opens a new block
+        end = self._doc_start[i + 1] if i + 1 < len(self) and self._doc_block[i + 1] == b else len(block)
+        return block[start:end].decode("utf-8")
+
+    def get(self, doc_id, default=""):
+        i = self.doc_ids.lookup(doc_id)
+        return self.text(i) if i >= 0 else default
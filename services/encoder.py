@@ -0,0 +1,87 @@
+# services/encoder.py
+
+import functools
+import os
+
+from sentence_transformers import SentenceTransformer
+
+# --- Configuration ---
+# Query-side encoder shared by BERT search, rerank and query expansion. Document embeddings
+# are always built with the float32 model offline; only the query side changes backend.
+#   torch : float32 PyTorch (the reference)
+#   int8  : PyTorch with dynamic int8 quantization of every nn.Linear
+#   onnx  : ONNX Runtime graph exported by sentence-transformers (needs onnxruntime + optimum)
+ENCODER_BACKEND = os.getenv("IR_ENCODER_BACKEND", "torch")
+DEFAULT_MODEL = "all-MiniLM-L6-v2"
+
+
+def encoder_threads():
+    """
+    Intra-op threads per worker: IR_ENCODER_THREADS, or the cores split evenly across the
+    WEB_CONCURRENCY workers, so workers do not oversubscribe the CPU fighting over cores.
+    """
+    configured = int(os.getenv("IR_ENCODER_THREADS", "0"))
+    if configured > 0:
+        return configured
+    workers = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+    return max(1, (os.cpu_count() or 1) // workers)
+
+
+def _load_torch(model_name, threads):
+    import torch
+    torch.set_num_threads(threads)
+    return SentenceTransformer(model_name, device="cpu")
+
+
+def _load_int8(model_name, threads):
+    import torch
+    model = _load_torch(model_name, threads)
+    # Weights of the linear layers (nearly all of MiniLM's compute) become int8; activations
+    # are quantized on the fly per batch, so no calibration data is needed
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def _load_onnx(model_name, threads):
+    import onnxruntime
+    options = onnxruntime.SessionOptions()
+    options.intra_op_num_threads = threads
+    options.inter_op_num_threads = 1
+    return SentenceTransformer(model_name, device="cpu", backend="onnx",
+                               model_kwargs={"provider": "CPUExecutionProvider", "session_options": options})
+
+
+_BACKENDS = {
+    "torch": _load_torch,
+    "int8": _load_int8,
+    "onnx": _load_onnx,
+}
+
+
+def get_encoder(model_name=DEFAULT_MODEL, backend=None):
+    """
+    Returns the shared query encoder (anything with SentenceTransformer's `encode`) for
+    `backend` (default IR_ENCODER_BACKEND). Falls back to float32 PyTorch when the
+    backend's dependencies are missing; `encoder.encoder_backend` names the backend
+    that was actually loaded.
+    """
+    backend = backend or ENCODER_BACKEND
+    if backend not in _BACKENDS:
+        raise ValueError(f"Unknown encoder backend '{backend}'; expected one of {sorted(_BACKENDS)}.")
+    # One cache key per (model, backend), however the caller spelled the arguments
+    return _load_encoder(model_name, backend)
+
+
+@functools.lru_cache(maxsize=None)
+def _load_encoder(model_name, backend):
+    threads = encoder_threads()
+    print(f"Loading query encoder {model_name} (backend={backend}, threads={threads})...")
+    try:
+        encoder = _BACKENDS[backend](model_name, threads)
+    except ImportError as e:
+        if backend == "torch":
+            raise
+        print(f"Warning: encoder backend '{backend}' unavailable ({e}); using float32 torch.")
+        return _load_encoder(model_name, "torch")
+    # Not `backend`: SentenceTransformer has an attribute of that name itself
+    encoder.encoder_backend = backend
+    return encoder
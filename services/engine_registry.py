@@ -0,0 +1,153 @@
+# services/engine_registry.py
+
+import contextlib
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class Generation:
+    """
+    One consistent set of loaded engines, created lazily per key by `factory(generation, key)`.
+    Also memoizes values derived from these engines (e.g. search results), which
+    therefore disappear together with the generation.
+    """
+
+    def __init__(self, generation_id, factory, memo_size):
+        self.id = generation_id
+        self.created_at = time.time()
+        self.refs = 0
+        self.retired = False
+        self._factory = factory
+        self._engines = {}
+        # Reentrant: building one engine may need another of the same generation (rerank)
+        self._lock = threading.RLock()
+        self._memo = OrderedDict()
+        self._memo_size = memo_size
+        self._memo_lock = threading.Lock()
+
+    def get(self, key):
+        engine = self._engines.get(key, _MISSING)
+        if engine is _MISSING:
+            # Engines may be requested from several threads at once (hybrid); build each only once.
+            # None is a valid value (e.g. no usable docstore) and is kept like any other.
+            with self._lock:
+                engine = self._engines.get(key, _MISSING)
+                if engine is _MISSING:
+                    engine = self._factory(self, key)
+                    self._engines[key] = engine
+        return engine
+
+    def keys(self):
+        return list(self._engines)
+
+    def cached(self, key, compute):
+        """Returns the memoized value for `key`, computing and storing it (LRU) on a miss."""
+        with self._memo_lock:
+            if key in self._memo:
+                self._memo.move_to_end(key)
+                return self._memo[key]
+        value = compute()
+        with self._memo_lock:
+            self._memo[key] = value
+            while len(self._memo) > self._memo_size:
+                self._memo.popitem(last=False)
+        return value
+
+    def release(self):
+        """Drops every engine; memory-mapped files are unmapped once nothing references them."""
+        with self._lock:
+            self._engines.clear()
+        with self._memo_lock:
+            self._memo.clear()
+        print(f"Released engine generation {self.id}.")
+
+
+class EngineRegistry:
+    """
+    Holds the live engine generation. Requests `acquire()` the current generation for
+    their whole duration; `reload()` builds a complete new generation in the caller's
+    thread, swaps it in atomically, and releases the old one when its last request ends.
+    """
+
+    def __init__(self, factory, memo_size=2048):
+        self._factory = factory
+        self._memo_size = memo_size
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._draining = []
+        self.current = Generation(0, factory, memo_size)
+        self.last_reload = None
+
+    @contextlib.contextmanager
+    def acquire(self):
+        with self._lock:
+            generation = self.current
+            generation.refs += 1
+        try:
+            yield generation
+        finally:
+            self._unref(generation)
+
+    def _unref(self, generation):
+        with self._lock:
+            generation.refs -= 1
+            release = generation.retired and generation.refs == 0
+            if release:
+                self._draining.remove(generation)
+        if release:
+            generation.release()
+
+    @property
+    def reloading(self):
+        return self._reload_lock.locked()
+
+    def reload(self, prepare=None):
+        """
+        Loads every engine of the current generation again from disk into a new generation,
+        runs `prepare(new_generation)` (e.g. cache warmup), then swaps. If loading fails the
+        current generation keeps serving and the error is raised. Only one reload runs at a time.
+        """
+        if not self._reload_lock.acquire(blocking=False):
+            raise RuntimeError("A reload is already running.")
+        try:
+            start = time.perf_counter()
+            old = self.current
+            new = Generation(old.id + 1, self._factory, self._memo_size)
+            for key in old.keys():
+                new.get(key)
+            if prepare is not None:
+                prepare(new)
+
+            with self._lock:
+                self.current = new
+                old.retired = True
+                self._draining.append(old)
+                # The +1/-1 lets _unref release it right away when no request holds it
+                old.refs += 1
+
+            self.last_reload = {
+                "generation": new.id,
+                "engines": len(new.keys()),
+                "seconds": round(time.perf_counter() - start, 2),
+                "finished_at": time.time(),
+            }
+            print(f"Swapped in engine generation {new.id} ({len(new.keys())} engines) "
+                  f"in {self.last_reload['seconds']}s.")
+            self._unref(old)
+            return self.last_reload
+        finally:
+            self._reload_lock.release()
+
+    def status(self):
+        with self._lock:
+            return {
+                "generation": self.current.id,
+                "engines": [":".join(key) for key in self.current.keys()],
+                "in_flight": self.current.refs,
+                "draining": [{"generation": g.id, "in_flight": g.refs} for g in self._draining],
+                "reloading": self.reloading,
+                "last_reload": self.last_reload,
+            }
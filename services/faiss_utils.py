@@ -0,0 +1,22 @@
+# services/faiss_utils.py
+
+import os
+import faiss
+
+# Memory-mapped, read-only FAISS indexes let every worker share one copy of the vectors
+# through the page cache. Set IR_FAISS_MMAP=0 to fall back to reading indexes into RAM.
+FAISS_MMAP = os.getenv("IR_FAISS_MMAP", "1") == "1"
+
+
+def read_faiss_index(path):
+    """
+    Opens a FAISS index, memory-mapped and read-only when supported.
+    Index types that cannot be mapped are read into memory as before.
+    """
+    path = str(path)
+    if FAISS_MMAP:
+        try:
+            return faiss.read_index(path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError as e:
+            print(f"Warning: could not memory-map FAISS index '{path}' ({e}); reading it into memory.")
+    return faiss.read_index(path)
@@ -0,0 +1,43 @@
+# services/fusion.py
+
+import warnings
+
+import numpy as np
+
+# How each engine's result list is turned into additive contributions before weighting:
+#   minmax : (score - min) / (max - min) over the engine's list, 0 when all scores are equal
+#   zscore : (score - mean) / std over the engine's list, 0 when all scores are equal
+#   rrf    : reciprocal rank fusion, 1 / (rrf_k + rank) with ranks starting at 1
+FUSION_METHODS = ("minmax", "zscore", "rrf")
+DEFAULT_RRF_K = 60
+
+
+def fusion_contributions(scores, method="minmax", rrf_k=DEFAULT_RRF_K):
+    """
+    Contributions of the scores along the last axis of `scores` (one engine's ranked list,
+    best first). NaN marks a document the engine did not return; it contributes 0.
+    Works on one list (search_service) or a (queries, candidates) matrix (offline/tune_fusion.py).
+    """
+    scores = np.asarray(scores, dtype="float64")
+    if scores.size == 0:
+        return scores
+    missing = np.isnan(scores)
+    with warnings.catch_warnings():
+        # All-missing rows (an engine without hits) are expected
+        warnings.simplefilter("ignore", RuntimeWarning)
+        if method == "rrf":
+            # Position in the list ordered by descending score (missing documents sort last)
+            order = np.argsort(np.where(missing, np.inf, -scores), axis=-1, kind="stable")
+            ranks = 1 + np.argsort(order, axis=-1, kind="stable")
+            values = 1.0 / (rrf_k + ranks)
+        elif method == "zscore":
+            mean = np.nanmean(scores, axis=-1, keepdims=True)
+            std = np.nanstd(scores, axis=-1, keepdims=True)
+            values = np.where(std > 0, (scores - mean) / np.where(std > 0, std, 1), 0.0)
+        elif method == "minmax":
+            low = np.nanmin(scores, axis=-1, keepdims=True)
+            span = np.nanmax(scores, axis=-1, keepdims=True) - low
+            values = np.where(span > 0, (scores - low) / np.where(span > 0, span, 1), 0.0)
+        else:
+            raise ValueError(f"Unknown fusion method '{method}'; expected one of {FUSION_METHODS}.")
+    return np.where(missing, 0.0, values)
@@ -0,0 +1,173 @@
+# services/metrics.py
+
+import bisect
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+# Upper bounds (seconds) of the latency histogram buckets; +Inf is implicit
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+METRIC_NAME = "ir_stage_duration_seconds"
+
+# (engine, dataset, stage) -> [bucket counts..., +Inf count, sum]
+_histograms = {}
+_lock = threading.Lock()
+
+# --- Multi-process mode ---
+# Histograms live in process memory, so under gunicorn each worker only knows its own requests.
+# With PROMETHEUS_MULTIPROC_DIR set (gunicorn.conf.py sets and empties it), every process also
+# writes its histograms to <dir>/<pid>-<start>.json (from a background thread, every FLUSH_SECONDS
+# while there are new observations, and before it renders), and /metrics sums the files of all
+# processes, exited ones included, so counters never go backwards. Other workers' observations
+# are therefore up to FLUSH_SECONDS late.
+MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR", "")
+FLUSH_SECONDS = 1.0
+_process_file = None
+_dirty = False
+_flusher_started = False
+_flush_lock = threading.Lock()
+
+# Stage timings of the request being served, used to build its Server-Timing header.
+# None outside a request, so timers used by scripts and offline code record histograms only.
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+def observe(engine, dataset, stage, seconds):
+    """Records one stage duration in its histogram and in the current request's timings."""
+    key = (engine, dataset, stage)
+    bucket = bisect.bisect_left(LATENCY_BUCKETS, seconds)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = [0] * (len(LATENCY_BUCKETS) + 1) + [0.0]
+        histogram[bucket] += 1
+        histogram[-1] += seconds
+
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((f"{engine}-{stage}", dataset, seconds))
+    if MULTIPROC_DIR:
+        _mark_dirty()
+
+
+@contextmanager
+def stage_timer(engine, dataset, stage):
+    """Times the enclosed block as one pipeline stage of `engine` on `dataset`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(engine, dataset, stage, time.perf_counter() - start)
+
+
+def start_request_timings():
+    """Starts collecting stage timings for the current request; returns the list they go into."""
+    timings = []
+    _request_timings.set(timings)
+    return timings
+
+
+def server_timing_header(timings, total_seconds=None):
+    """Formats collected timings as a Server-Timing header value (durations in ms)."""
+    entries = [f'{name};dur={seconds * 1000:.2f};desc="{dataset}"' for name, dataset, seconds in timings]
+    if total_seconds is not None:
+        entries.append(f"total;dur={total_seconds * 1000:.2f}")
+    return ", ".join(entries)
+
+
+def _snapshot():
+    with _lock:
+        return {key: list(values) for key, values in _histograms.items()}
+
+
+def _mark_dirty():
+    global _dirty, _flusher_started
+    _dirty = True
+    if not _flusher_started:
+        with _flush_lock:
+            if not _flusher_started:
+                _flusher_started = True
+                threading.Thread(target=_flush_loop, name="metrics-flusher", daemon=True).start()
+
+
+def _flush_loop():
+    while True:
+        time.sleep(FLUSH_SECONDS)
+        if _dirty:
+            _flush()
+
+
+def _flush():
+    """Writes this process's histograms to its file in MULTIPROC_DIR."""
+    global _process_file, _dirty
+    with _flush_lock:
+        _dirty = False
+        if _process_file is None:
+            os.makedirs(MULTIPROC_DIR, exist_ok=True)
+            _process_file = Path(MULTIPROC_DIR) / f"{os.getpid()}-{time.time_ns()}.json"
+        tmp_path = _process_file.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump([[list(key), values] for key, values in _snapshot().items()], f)
+        os.replace(tmp_path, _process_file)
+
+
+def _merged_snapshot():
+    """Sum of the histograms every process wrote to MULTIPROC_DIR."""
+    if _dirty or _process_file is None:
+        _flush()
+    merged = {}
+    for path in Path(MULTIPROC_DIR).glob("*.json"):
+        try:
+            with open(path, encoding="utf-8") as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for key, values in entries:
+            total = merged.setdefault(tuple(key), [0] * (len(LATENCY_BUCKETS) + 1) + [0.0])
+            for i, value in enumerate(values):
+                total[i] += value
+    return merged
+
+
+def _reset_after_fork():
+    # A forked worker starts empty; the parent's observations stay in the parent's file.
+    # Threads do not survive the fork, so the child starts its own flusher on first use.
+    global _lock, _flush_lock, _process_file, _dirty, _flusher_started
+    _histograms.clear()
+    _lock = threading.Lock()
+    _flush_lock = threading.Lock()
+    _process_file = None
+    _dirty = _flusher_started = False
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def render_prometheus():
+    """
+    Renders every stage histogram in the Prometheus text exposition format: this process's,
+    or with PROMETHEUS_MULTIPROC_DIR the sum over all worker processes.
+    """
+    snapshot = _merged_snapshot() if MULTIPROC_DIR else _snapshot()
+
+    lines = [
+        f"# HELP {METRIC_NAME} Latency of each search/chat pipeline stage.",
+        f"# TYPE {METRIC_NAME} histogram",
+    ]
+    for (engine, dataset, stage), values in sorted(snapshot.items()):
+        labels = f'engine="{engine}",dataset="{dataset}",stage="{stage}"'
+        cumulative = 0
+        for upper, count in zip(LATENCY_BUCKETS, values):
+            cumulative += count
+            lines.append(f'{METRIC_NAME}_bucket{{{labels},le="{upper}"}} {cumulative}')
+        cumulative += values[len(LATENCY_BUCKETS)]
+        lines.append(f'{METRIC_NAME}_bucket{{{labels},le="+Inf"}} {cumulative}')
+        lines.append(f"{METRIC_NAME}_sum{{{labels}}} {values[-1]}")
+        lines.append(f"{METRIC_NAME}_count{{{labels}}} {cumulative}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,231 @@
+# services/positional_index.py
+
+import json
+import os
+import re
+from pathlib import Path
+
+import numpy as np
+
+from services.term_table import TermTable, write_term_table
+from services.artifacts import resolve_artifact
+from services.doc_id_table import doc_ids_fingerprint
+
+POSITIONS_FORMAT = "positions-delta"
+
+# "red sea" is an exact phrase, "red sea"~3 allows up to 3 extra words between/around the terms
+_PHRASE_PATTERN = re.compile(r'"([^"]*)"(?:~(\d+))?')
+
+
+def parse_phrases(query):
+    """
+    Splits a raw query into (free text, [(phrase text, slop), ...]).
+    The free text keeps the phrase words (they still count towards the score) without the
+    quote syntax; a stray unbalanced quote is simply dropped.
+    """
+    phrases = [(m.group(1), int(m.group(2) or 0)) for m in _PHRASE_PATTERN.finditer(query)]
+    text = _PHRASE_PATTERN.sub(lambda m: f" {m.group(1)} ", query).replace('"', " ")
+    return text, [(phrase, slop) for phrase, slop in phrases if phrase.strip()]
+
+
+def _smallest_uint(max_value):
+    for dtype in ("uint8", "uint16", "uint32"):
+        if max_value <= np.iinfo(dtype).max:
+            return dtype
+    return "uint64"
+
+
+# --- Offline writer ---
+def write_positional_index(directory, tokenized_docs, doc_ids=None):
+    """
+    Writes the token positions of `tokenized_docs` (one token list per row):
+      - terms.bin / terms_offsets.npy : sorted term dictionary, position = term id
+      - postings_ptr.npy              : int64, postings of term t are [ptr[t], ptr[t + 1])
+      - postings_docs.npy             : int32 row ids, ascending within a term
+      - positions_ptr.npy             : int64, positions of posting p are [ptr[p], ptr[p + 1])
+      - positions.npy                 : delta-encoded positions (first absolute, then gaps),
+                                        in the smallest unsigned dtype that holds every gap
+    Rows are global (the index is never sharded); engines apply its matches as a row filter.
+    With `doc_ids` (the rows' doc_ids) meta.json records their fingerprint, so engines can
+    refuse positions built for other rows.
+    """
+    directory = Path(directory)
+    os.makedirs(directory, exist_ok=True)
+
+    n_docs = len(tokenized_docs)
+    doc_len = np.fromiter((len(doc) for doc in tokenized_docs), dtype="int64", count=n_docs)
+    n_tokens = int(doc_len.sum())
+
+    vocabulary = sorted({token for doc in tokenized_docs for token in doc})
+    term_ids = {term: i for i, term in enumerate(vocabulary)}
+    n_terms = len(vocabulary)
+
+    token_terms = np.fromiter((term_ids[token] for doc in tokenized_docs for token in doc),
+                              dtype="int64", count=n_tokens)
+    token_rows = np.repeat(np.arange(n_docs, dtype="int64"), doc_len)
+    doc_starts = np.concatenate(([0], np.cumsum(doc_len)[:-1])) if n_docs else np.zeros(0, dtype="int64")
+    token_positions = np.arange(n_tokens, dtype="int64") - np.repeat(doc_starts, doc_len)
+
+    # Occurrences are already in (row, position) order; a stable sort by term keeps it per term
+    order = np.argsort(token_terms, kind="stable")
+    token_terms, token_rows, token_positions = token_terms[order], token_rows[order], token_positions[order]
+
+    # Each run of equal (term, row) is one posting
+    new_posting = np.ones(n_tokens, dtype=bool)
+    if n_tokens:
+        new_posting[1:] = (token_terms[1:] != token_terms[:-1]) | (token_rows[1:] != token_rows[:-1])
+    posting_starts = np.flatnonzero(new_posting)
+    n_postings = posting_starts.size
+
+    postings_ptr = np.zeros(n_terms + 1, dtype="int64")
+    postings_ptr[1:] = np.cumsum(np.bincount(token_terms[posting_starts], minlength=n_terms))
+    positions_ptr = np.append(posting_starts, n_tokens).astype("int64")
+
+    deltas = token_positions.copy()
+    deltas[1:] -= token_positions[:-1]
+    deltas[posting_starts] = token_positions[posting_starts]
+    positions_dtype = _smallest_uint(int(deltas.max()) if n_tokens else 0)
+
+    write_term_table(directory, vocabulary)
+    np.save(directory / "postings_ptr.npy", postings_ptr)
+    np.save(directory / "postings_docs.npy", token_rows[posting_starts].astype("int32"))
+    np.save(directory / "positions_ptr.npy", positions_ptr)
+    np.save(directory / "positions.npy", deltas.astype(positions_dtype))
+
+    meta = {
+        "format": POSITIONS_FORMAT,
+        "n_docs": n_docs,
+        "n_terms": n_terms,
+        "n_postings": int(n_postings),
+        "n_positions": n_tokens,
+        "max_doc_len": int(doc_len.max()) if n_docs else 0,
+        "positions_dtype": positions_dtype,
+    }
+    if doc_ids is not None:
+        meta["doc_ids_fingerprint"] = doc_ids_fingerprint(doc_ids)
+    with open(directory / "meta.json", "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+# --- Query-time reader ---
+class PositionalIndex:
+    """
+    Memory-mapped positional index written by `write_positional_index`.
+    `match(tokens, slop)` returns the sorted row ids where the tokens occur as a phrase
+    (slop 0) or all within a window of len(tokens) - 1 + slop words.
+    """
+
+    def __init__(self, directory):
+        # Pinned to the version published right now (services/artifacts.py)
+        directory = resolve_artifact(directory)
+        with open(directory / "meta.json", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        if self.meta.get("format") != POSITIONS_FORMAT:
+            raise ValueError(f"'{directory}' does not contain a {POSITIONS_FORMAT} index.")
+        self.directory = directory
+        self.n_docs = self.meta["n_docs"]
+        self.terms = TermTable(directory)
+        self.postings_ptr = np.load(directory / "postings_ptr.npy", mmap_mode="r")
+        self.postings_docs = np.load(directory / "postings_docs.npy", mmap_mode="r")
+        self.positions_ptr = np.load(directory / "positions_ptr.npy", mmap_mode="r")
+        self.positions = np.load(directory / "positions.npy", mmap_mode="r")
+
+    def _positions(self, postings):
+        """
+        Decodes the positions of several postings at once.
+        Returns (owner, positions): owner[j] is the index into `postings` position j belongs to.
+        """
+        starts = np.asarray(self.positions_ptr[postings], dtype="int64")
+        lengths = np.asarray(self.positions_ptr[postings + 1], dtype="int64") - starts
+        owner = np.repeat(np.arange(len(postings)), lengths)
+        if not owner.size:
+            return owner, owner
+        first = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        gathered = np.arange(owner.size) - np.repeat(first, lengths) + np.repeat(starts, lengths)
+        deltas = np.asarray(self.positions[gathered], dtype="int64")
+        # Segmented prefix sum: undo the delta encoding separately within every posting
+        running = np.cumsum(deltas)
+        base = running[first] - deltas[first]
+        return owner, running - np.repeat(base, lengths)
+
+    def _candidates(self, term_ids):
+        """
+        Rows containing every term, intersecting the postings shortest list first so each
+        step only binary-searches the survivors. Returns (rows, {term id: posting indices}).
+        """
+        by_length = sorted(set(term_ids), key=lambda t: self.postings_ptr[t + 1] - self.postings_ptr[t])
+        first = by_length[0]
+        start, end = int(self.postings_ptr[first]), int(self.postings_ptr[first + 1])
+        rows = np.asarray(self.postings_docs[start:end], dtype="int64")
+        postings = {first: np.arange(start, end, dtype="int64")}
+
+        for term_id in by_length[1:]:
+            if not rows.size:
+                break
+            start, end = int(self.postings_ptr[term_id]), int(self.postings_ptr[term_id + 1])
+            docs = self.postings_docs[start:end]
+            found = np.searchsorted(docs, rows)
+            found[found == len(docs)] = 0
+            keep = docs[found] == rows if len(docs) else np.zeros(rows.size, dtype=bool)
+            rows = rows[keep]
+            postings = {t: p[keep] for t, p in postings.items()}
+            postings[term_id] = start + found[keep]
+        return rows, postings
+
+    def match(self, tokens, slop=0):
+        term_ids = [self.terms.lookup(token) for token in tokens]
+        if not term_ids or min(term_ids) < 0:
+            return np.empty(0, dtype="int64")
+        rows, postings = self._candidates(term_ids)
+        if len(tokens) == 1 or not rows.size:
+            return rows
+        if slop == 0:
+            return rows[self._phrase_mask(rows.size, term_ids, postings)]
+        return rows[self._window_mask(rows.size, postings, len(tokens) - 1 + slop)]
+
+    def _phrase_mask(self, n_rows, term_ids, postings):
+        # Token i of the phrase must sit at start + i: intersect the (row, position - i) keys
+        stride = self.meta["max_doc_len"] + 1
+        keys = None
+        for i, term_id in enumerate(term_ids):
+            owner, positions = self._positions(postings[term_id])
+            shifted = positions - i
+            valid = shifted >= 0
+            candidate_keys = owner[valid] * stride + shifted[valid]
+            keys = candidate_keys if keys is None else np.intersect1d(keys, candidate_keys, assume_unique=True)
+            if not keys.size:
+                break
+        mask = np.zeros(n_rows, dtype=bool)
+        mask[keys // stride] = True
+        return mask
+
+    def _window_mask(self, n_rows, postings, span):
+        # Smallest window holding every distinct term, per row, by a sliding window over the merged positions
+        merged = [self._positions(p) for p in postings.values()]
+        owner = np.concatenate([o for o, _ in merged])
+        positions = np.concatenate([p for _, p in merged])
+        labels = np.concatenate([np.full(o.size, t) for t, (o, _) in enumerate(merged)])
+        order = np.lexsort((positions, owner))
+        owner, positions, labels = owner[order], positions[order], labels[order]
+        bounds = np.searchsorted(owner, np.arange(n_rows + 1))
+
+        n_terms = len(merged)
+        mask = np.zeros(n_rows, dtype=bool)
+        for row in range(n_rows):
+            pos = positions[bounds[row]:bounds[row + 1]].tolist()
+            lab = labels[bounds[row]:bounds[row + 1]].tolist()
+            counts, covered, left = [0] * n_terms, 0, 0
+            for right in range(len(pos)):
+                counts[lab[right]] += 1
+                covered += counts[lab[right]] == 1
+                while covered == n_terms:
+                    if pos[right] - pos[left] <= span:
+                        mask[row] = True
+                        break
+                    counts[lab[left]] -= 1
+                    covered -= counts[lab[left]] == 0
+                    left += 1
+                if mask[row]:
+                    break
+        return mask
@@ -0,0 +1,179 @@
+# services/profiling.py
+
+import cProfile
+import contextvars
+import os
+import pstats
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter, deque
+from pathlib import Path
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import FileResponse
+
+# --- Configuration ---
+# Profiling is off unless IR_PROFILING=1; when off, neither the middleware nor the
+# /debug routes are installed, so requests pay nothing for it.
+PROFILING_ENABLED = os.getenv("IR_PROFILING", "0") == "1"
+PROFILE_SAMPLE_RATE = float(os.getenv("IR_PROFILE_SAMPLE_RATE", "0"))
+PROFILE_DIR = Path(os.getenv("IR_PROFILE_DIR", "profiles"))
+MAX_PROFILES = int(os.getenv("IR_MAX_PROFILES", "50"))
+PROFILE_HEADER = "x-profile"
+PROFILED_PATH_PREFIXES = ("/api/search", "/api/chat")
+SAMPLE_INTERVAL_SECONDS = 0.005
+
+_recent_profiles = deque(maxlen=MAX_PROFILES)
+_profiles_lock = threading.Lock()
+# Only one deterministic profiler can be hooked in at a time
+_cprofile_lock = threading.Lock()
+
+# Profiles collected from worker threads (asyncio.to_thread) of the request being profiled
+_thread_profiles = contextvars.ContextVar("thread_profiles", default=None)
+
+
+def profiled_call(fn):
+    """
+    Runs `fn()`; if the current request is being cProfiled, profiles it in this thread
+    too so work offloaded to threads shows up in the request's profile.
+    """
+    collected = _thread_profiles.get()
+    if collected is None:
+        return fn()
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        return fn()
+    finally:
+        profiler.disable()
+        collected.append(profiler)
+
+
+def _requested_mode(request: Request):
+    """Returns 'cprofile', 'sample' or None for this request."""
+    if not request.url.path.startswith(PROFILED_PATH_PREFIXES):
+        return None
+    header = request.headers.get(PROFILE_HEADER, "").lower()
+    if header in ("1", "true", "cprofile"):
+        return "cprofile"
+    if header == "sample":
+        return "sample"
+    if PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE:
+        return "cprofile"
+    return None
+
+
+class _StackSampler(threading.Thread):
+    """Samples every thread's Python stack at a fixed interval into collapsed-stack counts."""
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.stacks = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        own_id = threading.get_ident()
+        while not self._stop_event.wait(SAMPLE_INTERVAL_SECONDS):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                names = []
+                while frame is not None:
+                    code = frame.f_code
+                    names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                self.stacks[";".join(reversed(names))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def _record(profile_id, path, mode, duration, file_path):
+    with _profiles_lock:
+        _recent_profiles.appendleft({
+            "id": profile_id,
+            "path": path,
+            "mode": mode,
+            "duration_ms": round(duration * 1000, 2),
+            "created_at": time.time(),
+            "file": str(file_path),
+        })
+
+
+async def profile_requests(request: Request, call_next):
+    """
+    HTTP middleware: profiles a request when asked via the X-Profile header
+    ("1"/"cprofile" for cProfile, "sample" for a statistical stack sample) or when
+    picked by IR_PROFILE_SAMPLE_RATE, and stores the result under PROFILE_DIR.
+
+    cProfile covers the event-loop thread plus engine threads started through
+    `profiled_call`; since the loop is shared, other requests interleaving with
+    this one can appear in its profile. The sampler sees every thread.
+    """
+    mode = _requested_mode(request)
+    if mode == "cprofile" and not _cprofile_lock.acquire(blocking=False):
+        mode = None
+    if mode is None:
+        return await call_next(request)
+
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    slug = re.sub(r"[^A-Za-z0-9]+", "_", request.url.path).strip("_")
+    profile_id = f"{time.strftime('%Y%m%d-%H%M%S')}_{slug}_{random.getrandbits(32):08x}"
+    start = time.perf_counter()
+
+    if mode == "cprofile":
+        thread_profiles = []
+        token = _thread_profiles.set(thread_profiles)
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            response = await call_next(request)
+        finally:
+            profiler.disable()
+            _thread_profiles.reset(token)
+            _cprofile_lock.release()
+        duration = time.perf_counter() - start
+        stats = pstats.Stats(profiler)
+        for thread_profiler in thread_profiles:
+            stats.add(thread_profiler)
+        file_path = PROFILE_DIR / f"{profile_id}.pstats"
+        stats.dump_stats(file_path)
+    else:
+        sampler = _StackSampler()
+        sampler.start()
+        try:
+            response = await call_next(request)
+        finally:
+            sampler.stop()
+        duration = time.perf_counter() - start
+        file_path = PROFILE_DIR / f"{profile_id}.collapsed"
+        with open(file_path, "w", encoding="utf-8") as f:
+            for stack, count in sampler.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+    _record(profile_id, request.url.path, mode, duration, file_path)
+    response.headers["X-Profile-Id"] = profile_id
+    return response
+
+
+# --- Debug endpoints (only mounted when profiling is enabled) ---
+router = APIRouter()
+
+@router.get("/debug/profiles")
+async def list_profiles():
+    """Lists the most recent request profiles, newest first."""
+    with _profiles_lock:
+        return list(_recent_profiles)
+
+@router.get("/debug/profiles/{profile_id}")
+async def download_profile(profile_id: str):
+    """Downloads one stored profile (.pstats for cProfile, .collapsed for stack samples)."""
+    with _profiles_lock:
+        match = next((p for p in _recent_profiles if p["id"] == profile_id), None)
+    if match is None or not Path(match["file"]).exists():
+        raise HTTPException(status_code=404, detail=f"Profile '{profile_id}' not found.")
+    return FileResponse(match["file"], filename=Path(match["file"]).name)
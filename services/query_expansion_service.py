@@ -4,21 +4,23 @@ import string
 import joblib
 import faiss
 import numpy as np
-from sentence_transformers import SentenceTransformer
+from services.encoder import get_encoder
 import os
 from pathlib import Path
+from services.faiss_utils import read_faiss_index
 
 # --- Global Model Initialization ---
 try:
-    model = SentenceTransformer('all-MiniLM-L6-v2')
+    # The same (possibly quantized) encoder instance the BERT search uses
+    model = get_encoder('all-MiniLM-L6-v2')
 except Exception as e:
     print(f"Warning: Could not load SentenceTransformer model. Ensure 'all-MiniLM-L6-v2' is available. Error: {e}")
     model = None
 
-# --- Global Vocabulary and FAISS Index Loading - HARDCODED PATHS ---
+# --- Global Vocabulary and FAISS Index Loading ---
 # Directory where the FAISS index and vocabulary are located
 # This MUST match the FAISS_STORE path used in dataPipline.py
-FAISS_STORE = Path("C:/Users/Lenovo/Desktop/5th/second simester/IR/IR_PROJECT/offline_data")
+FAISS_STORE = Path(__file__).parent.parent / "offline_data"
 
 VOCAB_FILE_PATH = FAISS_STORE / "general_semantic_vocabulary.joblib"
 FAISS_INDEX_PATH = FAISS_STORE / "general_semantic_vocabulary.faiss"
@@ -29,7 +31,7 @@ faiss_index = None
 try:
     if VOCAB_FILE_PATH.exists() and FAISS_INDEX_PATH.exists():
         vocabulary_words = joblib.load(VOCAB_FILE_PATH)
-        faiss_index = faiss.read_index(str(FAISS_INDEX_PATH))
+        faiss_index = read_faiss_index(FAISS_INDEX_PATH)
         print(f"Loaded semantic vocabulary with {len(vocabulary_words)} words and FAISS index.")
     else:
         print(f"Warning: Semantic vocabulary files not found at {FAISS_STORE}. Query expansion will be limited.")
@@ -0,0 +1,166 @@
+# services/query_log.py
+
+import atexit
+import os
+import queue
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+# --- Configuration ---
+# Every /search/* and /chat/ query is appended here. Requests only put a tuple on an
+# in-memory queue; a background thread writes them to SQLite in batches.
+QUERY_LOG_ENABLED = os.getenv("IR_QUERY_LOG", "1") == "1"
+QUERY_LOG_PATH = Path(os.getenv("IR_QUERY_LOG_PATH", "offline/query_log.db"))
+BATCH_SIZE = 256
+FLUSH_SECONDS = 1.0
+MAX_PENDING = 10000        # beyond this, entries are dropped rather than slowing requests down
+
+_queue = None
+_writer = None
+_writer_pid = None
+_writer_lock = threading.Lock()
+_dropped = 0
+_STOP = object()
+
+
+def _connect(path=QUERY_LOG_PATH):
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS query_log (
+            ts REAL NOT NULL,
+            engine TEXT NOT NULL,
+            dataset TEXT NOT NULL,
+            query TEXT NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS query_log_engine_dataset ON query_log(engine, dataset)")
+    return conn
+
+
+def _write_loop(pending):
+    conn = _connect()
+    try:
+        while True:
+            try:
+                first = pending.get(timeout=FLUSH_SECONDS)
+            except queue.Empty:
+                continue
+            batch, stop = [], first is _STOP
+            if not stop:
+                batch.append(first)
+            while len(batch) < BATCH_SIZE and not stop:
+                try:
+                    item = pending.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                else:
+                    batch.append(item)
+            if batch:
+                with conn:
+                    conn.executemany("INSERT INTO query_log (ts, engine, dataset, query) VALUES (?, ?, ?, ?)", batch)
+            if stop:
+                return
+    except sqlite3.Error as e:
+        print(f"Query log writer stopped: {e}")
+    finally:
+        conn.close()
+
+
+def _ensure_writer():
+    """Starts the writer thread in this process (again after a fork, since threads do not survive it)."""
+    global _queue, _writer, _writer_pid
+    if _writer_pid == os.getpid():
+        return _queue
+    with _writer_lock:
+        if _writer_pid != os.getpid():
+            os.makedirs(QUERY_LOG_PATH.parent, exist_ok=True)
+            _queue = queue.Queue(maxsize=MAX_PENDING)
+            _writer = threading.Thread(target=_write_loop, args=(_queue,), name="query-log-writer", daemon=True)
+            _writer.start()
+            _writer_pid = os.getpid()
+    return _queue
+
+
+def log_query(engine, dataset, query):
+    """Records one query without blocking the request; a no-op when IR_QUERY_LOG=0."""
+    global _dropped
+    if not QUERY_LOG_ENABLED:
+        return
+    try:
+        _ensure_writer().put_nowait((time.time(), engine, dataset, query))
+    except queue.Full:
+        _dropped += 1
+
+
+@atexit.register
+def flush(timeout=5.0):
+    """Writes out everything queued so far and stops the writer."""
+    global _writer_pid
+    if _writer_pid != os.getpid() or _writer is None:
+        return
+    try:
+        _queue.put(_STOP, timeout=timeout)
+    except queue.Full:
+        return
+    _writer.join(timeout)
+    _writer_pid = None
+
+
+def top_queries(limit, engine=None, dataset=None, path=QUERY_LOG_PATH):
+    """
+    Returns {(engine, dataset): [(query, count), ...]} with the `limit` most frequent
+    queries of every engine/dataset pair (optionally only one engine or dataset).
+    Queries are grouped case- and whitespace-insensitively.
+    """
+    if not Path(path).exists():
+        return {}
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        rows = conn.execute("""
+            SELECT engine, dataset, query, count FROM (
+                SELECT engine, dataset, MIN(query) AS query, COUNT(*) AS count,
+                       ROW_NUMBER() OVER (PARTITION BY engine, dataset ORDER BY COUNT(*) DESC) AS rank
+                FROM query_log
+                WHERE (:engine IS NULL OR engine = :engine) AND (:dataset IS NULL OR dataset = :dataset)
+                GROUP BY engine, dataset, LOWER(TRIM(query))
+            )
+            WHERE rank <= :limit
+            ORDER BY engine, dataset, count DESC
+        """, {"engine": engine, "dataset": dataset, "limit": limit}).fetchall()
+    finally:
+        conn.close()
+
+    result = {}
+    for row_engine, row_dataset, query, count in rows:
+        result.setdefault((row_engine, row_dataset), []).append((query, count))
+    return result
+
+
+def query_counts(dataset=None, path=QUERY_LOG_PATH):
+    """Returns [(query, count), ...] over all engines, optionally for one dataset."""
+    if not Path(path).exists():
+        return []
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        return conn.execute("""
+            SELECT MIN(query), COUNT(*) FROM query_log
+            WHERE :dataset IS NULL OR dataset = :dataset
+            GROUP BY LOWER(TRIM(query))
+        """, {"dataset": dataset}).fetchall()
+    finally:
+        conn.close()
+
+
+def stats():
+    """Queue depth and dropped-entry counter of this process."""
+    return {
+        "enabled": QUERY_LOG_ENABLED,
+        "path": str(QUERY_LOG_PATH),
+        "pending": _queue.qsize() if _queue is not None and _writer_pid == os.getpid() else 0,
+        "dropped": _dropped,
+    }
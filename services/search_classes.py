@@ -1,112 +1,383 @@
 # services/search_classes.py
 
 from services.preprocessing_service import preprocess
-from sentence_transformers import SentenceTransformer
+from services.encoder import get_encoder
 import faiss
 import numpy as np
 import os
+from pathlib import Path
 import functools
-from services.database_utils import get_doc_text_by_id 
+import sqlite3
+import threading
+from services.database_utils import get_doc_text_by_id, DB_PATH
+from services.array_utils import top_k_indices, restricted_top_k, drop_unmatched
+from services.positional_index import parse_phrases
+from services.doc_filter import compile_row_mask, eligible_rows, faiss_search_params
+from services.faiss_utils import read_faiss_index
+from services.metrics import stage_timer
+from services.deadline import expired, DeadlineExceeded
+from services.artifacts import resolve_artifact, artifact_stamp
+from services.sharded_search import scatter_gather
+import json
 
 # --- Global Caches for BERT Components ---
-@functools.lru_cache(maxsize=None)
 def _get_bert_model(model_name='all-MiniLM-L6-v2'):
-    print(f"Loading BERT model: {model_name}...")
-    return SentenceTransformer(model_name)
+    # Shared with query expansion; IR_ENCODER_BACKEND selects float32, int8 or ONNX inference
+    return get_encoder(model_name)
 
-class TfIdfSearch:
-    def __init__(self, data):
-        self.vec = data["vectorizer"]
-        self.mat = data["matrix"]
-        self.doc_ids = data["doc_ids"]
-        self.dataset = data["dataset"]
+# Popular queries repeat; keep their embeddings instead of re-running the encoder
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("IR_QUERY_EMBEDDING_CACHE", "4096"))
 
-    def execute_search(self, query):
-        vec = self.vec.transform([preprocess(query)])
-        scores = (self.mat @ vec.T).toarray().flatten()
-        
-        # Sort by score and get all indices for scoring
-        # Limit to top 10 for efficiency if full list isn't needed by hybrid
-        top_idx = scores.argsort()[::-1][:10] # Fetch top 10 documents
+@functools.lru_cache(maxsize=QUERY_EMBEDDING_CACHE_SIZE)
+def _encode_query(processed):
+    """(1, dim) float32 embedding of an already preprocessed query; read-only, shared by callers."""
+    embedding = _get_bert_model().encode([processed]).astype("float32")
+    embedding.setflags(write=False)
+    return embedding
 
+def _hydrate_results(engine, dataset, doc_ids, rows, scores, docstore=None):
+    """Builds the result dicts for the selected rows, fetching each document's text (from `docstore` if given)."""
+    with stage_timer(engine, dataset, "hydrate"):
         results = []
-        for i in top_idx:
-            doc_id = self.doc_ids[i]
-            doc_text = get_doc_text_by_id(self.dataset, doc_id) 
+        for i, score in zip(rows, scores):
+            doc_id = doc_ids[i]
+            doc_text = get_doc_text_by_id(dataset, doc_id, docstore) 
             results.append({
                 "doc_id": doc_id,
                 "doc_text": doc_text,
-                "score": float(scores[i]) 
+                "score": float(score) 
             })
         return results
 
+def _phrase_filter(engine, dataset, positions, query):
+    """
+    Splits quoted phrases ("red sea", "red sea"~3) off the query. Returns (free text, rows):
+    the sorted rows satisfying every phrase, or None when there is no phrase constraint.
+    """
+    text, phrases = parse_phrases(query)
+    if not phrases:
+        return query, None
+    if positions is None:
+        print(f"Warning: no positional index for '{dataset}'; treating quoted phrases as plain words.")
+        return text, None
+    with stage_timer(engine, dataset, "phrase"):
+        rows = None
+        for phrase, slop in phrases:
+            tokens = preprocess(phrase).split()
+            if not tokens:
+                continue
+            matched = positions.match(tokens, slop)
+            rows = matched if rows is None else np.intersect1d(rows, matched, assume_unique=True)
+    return text, rows
+
+class TfIdfSearch:
+    def __init__(self, data):
+        self.index = data["tfidf_index"]
+        self.positions = data.get("positions")
+        self.doc_ids = data["doc_ids"]
+        self.dataset = data["dataset"]
+        self.docstore = data.get("docstore")
+
+    def execute_search(self, query, doc_filter=None, top_k=10):
+        top_idx, top_scores = self.search_rows(query, top_k, doc_filter)
+        return _hydrate_results("tfidf", self.dataset, self.doc_ids, top_idx, top_scores, self.docstore)
+
+    def search_rows(self, query, k, doc_filter=None):
+        """
+        Returns (row ids, scores) of the k best documents the query matches (like FTS), without
+        fetching any text. Only documents allowed by `doc_filter` (a DocFilter) are ranked.
+        """
+        query, rows = _phrase_filter("tfidf", self.dataset, self.positions, query)
+        with stage_timer("tfidf", self.dataset, "filter"):
+            rows, mask = eligible_rows(self.doc_ids, doc_filter, rows)
+        if rows is not None and not rows.size:
+            return rows, np.empty(0, dtype="float64")
+        with stage_timer("tfidf", self.dataset, "preprocess"):
+            processed = preprocess(query)
+        with stage_timer("tfidf", self.dataset, "vectorize"):
+            term_ids, weights = self.index.transform(processed)
+
+        if self.index.is_sharded:
+            # Shards are scored in parallel worker processes and merged by score
+            with stage_timer("tfidf", self.dataset, "scatter_gather"):
+                top_idx, top_scores = scatter_gather(
+                    "tfidf", self.index.directory, self.index.row_offsets, (term_ids, weights), k, rows, mask,
+                    stamp=self.index.stamp,
+                )
+        else:
+            with stage_timer("tfidf", self.dataset, "score"):
+                scores = self.index.score_vector(term_ids, weights)
+            with stage_timer("tfidf", self.dataset, "topk"):
+                top_idx, top_scores = restricted_top_k(scores, k, rows, mask)
+
+        return drop_unmatched(top_idx, top_scores)
+
 class Bm25Search:
     def __init__(self, data):
-        self.bm25 = data["bm25"]
+        self.index = data["bm25_index"]
+        self.positions = data.get("positions")
         self.doc_ids = data["doc_ids"]
-        self.tokenized = data["tokenized_docs"]
         self.dataset = data["dataset"]
+        self.docstore = data.get("docstore")
 
-    def execute_search(self, query):
-        tokens = preprocess(query).split()
-        scores = self.bm25.get_scores(tokens)
-        
-        # Limit to top 10 documents
-        top_idx = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)[:10] 
+    def execute_search(self, query, doc_filter=None, top_k=10):
+        top_idx, top_scores = self.search_rows(query, top_k, doc_filter)
+        return _hydrate_results("bm25", self.dataset, self.doc_ids, top_idx, top_scores, self.docstore)
 
-        results = []
-        for i in top_idx:
-            doc_id = self.doc_ids[i]
-            doc_text = get_doc_text_by_id(self.dataset, doc_id) 
-            results.append({
-                "doc_id": doc_id,
-                "doc_text": doc_text,
-                "score": float(scores[i]) 
-            })
-        return results
+    def search_rows(self, query, k, doc_filter=None):
+        """
+        Returns (row ids, scores) of the k best documents the query matches (like FTS), without
+        fetching any text. Only documents allowed by `doc_filter` (a DocFilter) are ranked.
+        """
+        query, rows = _phrase_filter("bm25", self.dataset, self.positions, query)
+        with stage_timer("bm25", self.dataset, "filter"):
+            rows, mask = eligible_rows(self.doc_ids, doc_filter, rows)
+        if rows is not None and not rows.size:
+            return rows, np.empty(0, dtype="float64")
+        with stage_timer("bm25", self.dataset, "preprocess"):
+            tokens = preprocess(query).split()
+
+        if self.index.is_sharded:
+            # Shards are scored in parallel worker processes and merged by score
+            with stage_timer("bm25", self.dataset, "scatter_gather"):
+                top_idx, top_scores = scatter_gather(
+                    "bm25", self.index.directory, self.index.row_offsets,
+                    (tokens, self.index.k1, self.index.b), k, rows, mask, stamp=self.index.stamp,
+                )
+        else:
+            with stage_timer("bm25", self.dataset, "score"):
+                scores = self.index.get_scores(tokens)
+            with stage_timer("bm25", self.dataset, "topk"):
+                top_idx, top_scores = restricted_top_k(scores, k, rows, mask)
+
+        return drop_unmatched(top_idx, top_scores)
 
 class BertSearch:
     def __init__(self, data):
         self.model = _get_bert_model()
         self.dataset = data["dataset"]
         self.doc_ids = data["doc_ids"]
+        self.docstore = data.get("docstore")
 
-        index_path = f"faiss_store/{self.dataset}/index.faiss"
+        # The store version the doc_id table came from (faiss_store/<dataset> is swapped on rebuilds)
+        self.store_dir = data.get("store_dir") or resolve_artifact(f"faiss_store/{self.dataset}")
+        index_path = str(self.store_dir / "index.faiss")
         if not os.path.exists(index_path):
             raise FileNotFoundError(f"FAISS index for dataset '{self.dataset}' not found at '{index_path}'. "
                                     "Please ensure it has been pre-computed and saved.")
         try:
-            self.index = faiss.read_index(index_path)
+            self.index = read_faiss_index(index_path)
             if self.index.ntotal > 0:
                 print(f"FAISS index loaded for dataset: {self.dataset} (size: {self.index.ntotal})")
             else:
                 print(f"Warning: FAISS index for {self.dataset} is empty. No documents to search.")
         except Exception as e:
             raise RuntimeError(f"Failed to load FAISS index from '{index_path}': {e}")
+
+        # Vector i must belong to doc_ids[i]; meta.json records the table bert_service.py added them with
+        meta_path = self.store_dir / "meta.json"
+        fingerprint = None
+        if meta_path.exists():
+            with open(meta_path, encoding="utf-8") as f:
+                fingerprint = json.load(f).get("doc_ids_fingerprint")
+        self.doc_ids.verify(self.index.ntotal, fingerprint, f"FAISS index of '{self.dataset}'")
+
+        # Optional per-shard indexes written by bert_service.py, searched in parallel
+        self.row_offsets = self.shards_stamp = None
+        shards_path = self.store_dir / "shards.json"
+        if shards_path.exists():
+            self.shards_stamp = artifact_stamp(shards_path)
+            with open(shards_path, encoding="utf-8") as f:
+                self.row_offsets = json.load(f)["row_offsets"]
+            print(f"Using {len(self.row_offsets) - 1} FAISS shards for dataset: {self.dataset}")
         
-    def execute_search(self, query):
+    def execute_search(self, query, doc_filter=None, top_k=10):
         if not self.index or self.index.ntotal == 0 or not self.doc_ids:
             print(f"Skipping search: Index or document data is empty for this BertSearch instance.")
             return []
+        rows, scores = self.search_rows(query, top_k, doc_filter)
+        return _hydrate_results("bert", self.dataset, self.doc_ids, rows, scores, self.docstore)
 
-        processed = preprocess(query) 
-        q_emb = self.model.encode([processed]).astype("float32")
+    def search_rows(self, query, k, doc_filter=None):
+        """Returns (row ids, cosine scores) of the k nearest documents, without fetching any text."""
+        with stage_timer("bert", self.dataset, "preprocess"):
+            processed = preprocess(query) 
+        with stage_timer("bert", self.dataset, "encode"):
+            q_emb = _encode_query(processed)
+
+        # FAISS skips filtered-out vectors while scanning, via an IDSelectorBitmap over the rows
+        mask = None
+        if doc_filter is not None:
+            with stage_timer("bert", self.dataset, "filter"):
+                mask = compile_row_mask(self.doc_ids, doc_filter)
+            if not mask.any():
+                return np.empty(0, dtype="int64"), np.empty(0, dtype="float64")
         
-        # Search for top 50 as before, then return top 10 with text
-        distances, indices = self.index.search(q_emb, 50) 
+        if self.row_offsets is not None:
+            with stage_timer("bert", self.dataset, "scatter_gather"):
+                return scatter_gather("bert", self.store_dir, self.row_offsets, q_emb, k, mask=mask,
+                                      stamp=self.shards_stamp)
+
+        # Search for at least 50 as before, then keep the k best valid hits
+        with stage_timer("bert", self.dataset, "faiss_search"):
+            distances, indices = self.index.search(q_emb, max(k, 50), params=faiss_search_params(mask))
         
-        results = []
-        for i, dist in zip(indices[0], distances[0]):
-            if i < len(self.doc_ids): 
-                doc_id = self.doc_ids[i]
-                doc_text = get_doc_text_by_id(self.dataset, doc_id) 
-                bert_score = 1 - (dist / 2) 
-                results.append({
-                    "doc_id": doc_id,
-                    "doc_text": doc_text,
-                    "score": float(bert_score) 
-                })
-        # Return top 10 after getting all relevant docs
-        return sorted(results, key=lambda x: x['score'], reverse=True)[:10]
+        # FAISS returns neighbours by ascending distance, i.e. descending score,
+        # so only the first k valid hits are kept
+        with stage_timer("bert", self.dataset, "topk"):
+            rows, scores = [], []
+            for i, dist in zip(indices[0], distances[0]):
+                if 0 <= i < len(self.doc_ids): 
+                    rows.append(i)
+                    scores.append(1 - (dist / 2))
+                if len(rows) == k:
+                    break
+        return np.array(rows, dtype="int64"), np.array(scores, dtype="float64")
+
+class RerankSearch:
+    """
+    Two-stage retrieval: a lexical engine (TfIdfSearch / Bm25Search) proposes the top-N
+    candidates, then their precomputed document embeddings are scored against the query
+    embedding with a single matrix-vector product. Gives dense ordering without a full
+    vector search over the corpus.
+    """
+
+    def __init__(self, first_stage, bert, first_stage_name, candidates=100):
+        self.first_stage = first_stage
+        self.bert = bert
+        self.first_stage_name = first_stage_name
+        self.candidates = candidates
+        self.dataset = bert.dataset
+        self.doc_ids = bert.doc_ids
+
+        # Prefer the raw embedding matrix written by bert_service.py (memory-mapped);
+        # otherwise reconstruct the vectors from the flat FAISS index
+        embeddings_path = bert.store_dir / "embeddings.npy"
+        self.embeddings = np.load(embeddings_path, mmap_mode="r") if embeddings_path.exists() else None
+
+    def _gather_embeddings(self, rows):
+        """Returns (embeddings, rows) for the candidate rows, in the order they were read."""
+        if self.embeddings is not None:
+            # Sorted row order keeps the mmap reads sequential
+            rows = np.sort(rows)
+            return np.asarray(self.embeddings[rows], dtype="float32"), rows
+        return self.bert.index.reconstruct_batch(rows), rows
+
+    def execute_search(self, query, doc_filter=None, top_k=10):
+        with stage_timer("rerank", self.dataset, "candidates"):
+            rows, _ = self.first_stage.search_rows(query, self.candidates, doc_filter)
+        rows = np.asarray(rows, dtype="int64")
+        if self.first_stage.doc_ids.fingerprint != self.doc_ids.fingerprint:
+            # Indexes built with different row orders: map the candidates to embedding rows by doc_id
+            rows = self.doc_ids.lookup(self.first_stage.doc_ids[i] for i in rows)
+            rows = rows[rows >= 0]
+        if rows.size == 0:
+            return []
+
+        with stage_timer("rerank", self.dataset, "encode"):
+            q_emb = _encode_query(preprocess(query))[0]
+        with stage_timer("rerank", self.dataset, "gather"):
+            doc_embs, rows = self._gather_embeddings(rows)
+        with stage_timer("rerank", self.dataset, "score"):
+            # all-MiniLM-L6-v2 embeddings are unit length, so the dot product is the cosine
+            scores = doc_embs @ q_emb
+            best = top_k_indices(scores, top_k)
+
+        return _hydrate_results("rerank", self.dataset, self.doc_ids, rows[best], scores[best], self.bert.docstore)
+
+class FtsSearch:
+    """
+    Lexical search served straight from SQLite's FTS5 index (`<dataset>_fts`) with its
+    built-in bm25() ranking. Nothing is loaded into RAM up front; the OS page cache
+    holds whatever parts of the index queries actually touch.
+    """
+
+    def __init__(self, data):
+        self.dataset = data["dataset"]
+        self.fts_table = f"{self.dataset}_fts"
+        self.db_uri = f"file:{Path(DB_PATH).as_posix()}?mode=ro"
+        self._local = threading.local()
+
+        conn = self._connection()
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (self.fts_table,)
+        ).fetchone()
+        if not exists:
+            raise FileNotFoundError(f"FTS5 table '{self.fts_table}' not found in '{DB_PATH}'. "
+                                    "Run offline/fts_service.py first.")
+        # FTS5 indexes every row; collapsed near-duplicates (offline/dedup_service.py) are filtered out
+        self.dups_table = f"{self.dataset}_dups"
+        self.has_dups = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (self.dups_table,)
+        ).fetchone() is not None
+
+    def _connection(self):
+        # sqlite3 connections must stay on the thread that opened them
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_uri, uri=True)
+            # SQLite calls this every few thousand VM steps; non-zero aborts a query past the request deadline
+            conn.set_progress_handler(expired, 10000)
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _quote(token):
+        return '"' + token.replace('"', '""') + '"'
+
+    @classmethod
+    def _match_expression(cls, tokens, phrases=()):
+        # Quote every token so FTS5 never reads it as query syntax; OR keeps bag-of-words semantics.
+        # Phrases become FTS5 phrase / NEAR() constraints that every hit must satisfy.
+        expression = "(" + " OR ".join(cls._quote(token) for token in tokens) + ")"
+        for phrase_tokens, slop in phrases:
+            if slop == 0 or len(phrase_tokens) == 1:
+                constraint = " + ".join(cls._quote(token) for token in phrase_tokens)
+            else:
+                constraint = f"NEAR({' '.join(cls._quote(token) for token in phrase_tokens)}, {slop})"
+            expression += f" AND ({constraint})"
+        return expression
+
+    def execute_search(self, query, doc_filter=None, top_k=10):
+        with stage_timer("fts", self.dataset, "preprocess"):
+            text, phrases = parse_phrases(query)
+            tokens = preprocess(text).split()
+            phrases = [(preprocess(phrase).split(), slop) for phrase, slop in phrases]
+            phrases = [(phrase_tokens, slop) for phrase_tokens, slop in phrases if phrase_tokens]
+        if not tokens:
+            return []
+
+        # Id lists go in as one JSON parameter each, so their size is not bound by SQLite's variable limit
+        filters, params = "", [self._match_expression(tokens, phrases)]
+        if self.has_dups:
+            filters += f" AND d.doc_id NOT IN (SELECT doc_id FROM `{self.dups_table}`)"
+        if doc_filter is not None:
+            if doc_filter.include is not None:
+                filters += " AND d.doc_id IN (SELECT value FROM json_each(?))"
+                params.append(json.dumps(sorted(doc_filter.include)))
+            if doc_filter.exclude:
+                filters += " AND d.doc_id NOT IN (SELECT value FROM json_each(?))"
+                params.append(json.dumps(sorted(doc_filter.exclude)))
+
+        # bm25() is lower-is-better, so it is negated into a higher-is-better score
+        with stage_timer("fts", self.dataset, "score"):
+            try:
+                rows = self._connection().execute(
+                    f"""
+                    SELECT d.doc_id, d.doc, -bm25({self.fts_table}) AS score
+                    FROM {self.fts_table}
+                    JOIN `{self.dataset}` AS d ON d.rowid = {self.fts_table}.rowid
+                    WHERE {self.fts_table} MATCH ?{filters}
+                    ORDER BY bm25({self.fts_table})
+                    LIMIT ?
+                    """,
+                    (*params, top_k),
+                ).fetchall()
+            except sqlite3.OperationalError:
+                if expired():
+                    raise DeadlineExceeded(f"FTS search on {self.dataset} interrupted at the deadline")
+                raise
+
+        return [{"doc_id": doc_id, "doc_text": doc_text, "score": float(score)} for doc_id, doc_text, score in rows]
 
 # HybridSearch class is removed from here. Its logic moves to search_service.py.
\ No newline at end of file
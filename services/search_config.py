@@ -0,0 +1,24 @@
+# services/search_config.py
+
+import json
+import os
+from pathlib import Path
+
+# Written by offline/tune_fusion.py; read per dataset by search_service (reloaded with the engines):
+#   {"generated_at": ..., "metric": "map",
+#    "datasets": {"antique": {"bm25": {"k1": 1.2, "b": 0.6, ...},
+#                             "hybrid": {"weights": {"bert": 0.6, ...}, "method": "rrf", "rrf_k": 60, "depth": 100, ...}}}}
+SEARCH_CONFIG_PATH = Path(os.getenv("IR_SEARCH_CONFIG", "offline_data/search_config.json"))
+
+
+def load_search_config(dataset: str) -> dict:
+    """The tuned settings of one dataset, or {} (built-in defaults) when there are none."""
+    if not SEARCH_CONFIG_PATH.exists():
+        return {}
+    try:
+        with open(SEARCH_CONFIG_PATH, encoding="utf-8") as f:
+            config = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Warning: ignoring unreadable search config '{SEARCH_CONFIG_PATH}': {e}")
+        return {}
+    return config.get("datasets", {}).get(dataset, {})
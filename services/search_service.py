@@ -1,15 +1,32 @@
 # services/search_service.py
 
-from fastapi import APIRouter, Body, HTTPException
-from pydantic import BaseModel, Field
+from fastapi import APIRouter, Body, Header, HTTPException, Query, Response
+from pydantic import BaseModel, Field, field_validator
+from typing import Optional, Union
 import joblib
 import sqlite3
-import functools
 from services.query_expansion_service import expand_query_with_synonyms
-from services.database_utils import get_doc_text_by_id # Still used by the search classes
-from services.search_classes import TfIdfSearch, Bm25Search, BertSearch
-import httpx # For making HTTP requests to other local endpoints
-import asyncio # <--- ADDED THIS IMPORT
+from services.database_utils import get_doc_text_by_id, load_doc_ids, get_duplicates, open_docstore, DB_PATH
+from services.search_classes import TfIdfSearch, Bm25Search, BertSearch, FtsSearch, RerankSearch
+import os
+from services.bm25_index import Bm25Index
+from services.tfidf_index import TfIdfIndex
+import asyncio
+import threading
+from services.metrics import stage_timer
+from services.profiling import profiled_call
+from services.suggest_index import SuggestIndex
+from services.query_log import log_query, top_queries
+from services.memory_report import page_in
+from services.engine_registry import EngineRegistry
+from services.positional_index import PositionalIndex
+from services.doc_filter import DocFilter
+from services.snippets import make_snippet, query_terms
+from services.fusion import fusion_contributions, DEFAULT_RRF_K
+from services.search_config import load_search_config, SEARCH_CONFIG_PATH
+from services.artifacts import resolve_artifact
+from services.deadline import deadline_scope, remaining, DeadlineExceeded, DEFAULT_BUDGET_MS, BUDGET_HEADER
+import time
 
 router = APIRouter()
 
@@ -19,64 +36,259 @@ class RefineQueryRequest(BaseModel):
 
 class SearchRequest(BaseModel):
     query: str = Field(..., min_length=1, max_length=100, description="The query string to search with.")
-    dataset: str = Field(..., description="The dataset to search in (e.g., 'antique', 'quora')")
+    dataset: Union[str, list[str]] = Field(
+        ..., description="The dataset to search in (e.g., 'antique', 'quora'), a list of datasets, or 'all'."
+    )
+    snippets: bool = Field(
+        False, description="Return only the best-matching passage of each document, HTML-escaped, with <mark>ed query terms."
+    )
+    include_ids: Optional[list[str]] = Field(
+        None, description="Only these doc_ids may be returned (e.g. the hits of a previous query)."
+    )
+    exclude_ids: list[str] = Field(default_factory=list, description="These doc_ids are never returned.")
+    expand_duplicates: bool = Field(
+        False, description="List, per hit, the near-duplicate doc_ids that were collapsed into it at index time."
+    )
+    budget_ms: Optional[int] = Field(
+        None, ge=1, le=600000,
+        description="Latency budget; engines that miss it are left out (X-Search-Budget-Ms header works too).",
+    )
+
+    @field_validator("dataset")
+    @classmethod
+    def check_datasets(cls, value):
+        """A list must name at least one known dataset; anything else is a 422, not an empty or error-only result."""
+        if isinstance(value, list):
+            if not value:
+                raise ValueError("give at least one dataset")
+            unknown = [name for name in value if name not in KNOWN_DATASETS]
+            if unknown:
+                raise ValueError(f"unknown dataset(s) {unknown}; known datasets are {KNOWN_DATASETS}")
+        return value
+
+    def doc_filter(self):
+        """The include/exclude lists as a DocFilter, applied inside each engine's scoring; None if unused."""
+        return DocFilter.from_ids(self.include_ids, self.exclude_ids)
+
+    def federated_datasets(self):
+        """The datasets of a multi-dataset request, or None for a plain single-dataset one."""
+        if isinstance(self.dataset, list):
+            return list(dict.fromkeys(self.dataset))
+        if self.dataset == "all":
+            return list(KNOWN_DATASETS)
+        return None
+
+class RerankRequest(SearchRequest):
+    first_stage: str = Field("bm25", pattern="^(bm25|tfidf)$", description="Lexical engine that proposes candidates.")
+    candidates: int = Field(100, ge=10, le=1000, description="Number of lexical candidates to re-rank.")
 
 class SearchResult(BaseModel):
     doc_id: str
     doc_text: str
     score: float
+    dataset: Optional[str] = None  # set in multi-dataset responses
+    duplicates: Optional[list[str]] = None  # set with expand_duplicates
 
-# --- Cached Data Loading ---
-@functools.lru_cache(maxsize=None)
-def _cached_load_data(search_type: str, dataset: str):
+class FederatedSearchResponse(BaseModel):
+    results: list[SearchResult]
+    metadata: dict
+
+SearchResponse = Union[list[SearchResult], FederatedSearchResponse]
+
+# --- Data Loading ---
+_INDEX_CLASSES = {
+    "tfidf": TfIdfIndex,
+    "bm25": Bm25Index,
+}
+
+def _doc_id_dir(search_type: str, dataset: str, joblib_data: dict):
+    """
+    Directory holding the row -> doc_id table written by the engine's builder (None: no index
+    of its own): the same published version the engine's index was opened from.
     """
-    Loads and caches the necessary data (vectorizer, matrix, bm25, doc_ids, faiss index)
+    index = joblib_data.get(f"{search_type}_index")
+    if index is not None:
+        return index.directory
+    if search_type == "bert":
+        joblib_data["store_dir"] = resolve_artifact(f"faiss_store/{dataset}")
+        return joblib_data["store_dir"]
+    return None
+
+def _load_data(search_type: str, dataset: str):
+    """
+    Loads the necessary data (vectorizer, matrix, bm25, doc_ids, faiss index)
     for a given search_type and dataset.
     This now specifically loads only the components relevant to the requested search_type.
+    Called once per engine and generation, so a reload reads the artifacts from disk again.
     """
     joblib_data = {}
     
-    # Load search-type specific joblib data
-    joblib_path = f"offline_data/{search_type}_{dataset}.joblib"
-    try:
-        loaded_joblib = joblib.load(joblib_path)
-        joblib_data.update(loaded_joblib)
-        print(f"Loaded {search_type} model data for dataset '{dataset}' from '{joblib_path}'.")
-    except FileNotFoundError:
-        # BERT does not have a joblib model file, its FAISS index is loaded separately in BertSearch
-        if search_type not in ["bert", "hybrid"]: # Hybrid doesn't load direct models
-            print(f"Warning: Offline data for {search_type} and dataset {dataset} not found at {joblib_path}. "
-                  "This might be expected for BERT (index loaded by class) or Hybrid (orchestrates).")
-    except Exception as e:
-        print(f"Error loading joblib data for {search_type} from {joblib_path}: {e}")
-        raise HTTPException(status_code=500, detail=f"Failed to load search model for {search_type}: {e}")
+    if search_type in _INDEX_CLASSES:
+        # Lexical models ship as memory-mapped array directories, not joblib pickles
+        index_dir = f"offline_data/{search_type}_{dataset}"
+        try:
+            joblib_data[f"{search_type}_index"] = _INDEX_CLASSES[search_type](index_dir)
+            print(f"Opened {search_type} index for dataset '{dataset}' from '{index_dir}'.")
+            if search_type == "bm25":
+                # k1 / b chosen by offline/tune_fusion.py replace the builder's defaults
+                tuned = load_search_config(dataset).get("bm25")
+                if tuned:
+                    joblib_data["bm25_index"].k1 = tuned["k1"]
+                    joblib_data["bm25_index"].b = tuned["b"]
+                    print(f"Using tuned BM25 k1={tuned['k1']}, b={tuned['b']} for dataset '{dataset}'.")
+        except Exception as e:
+            print(f"Error opening {search_type} index from {index_dir}: {e}")
+            raise HTTPException(status_code=500, detail=f"Failed to load search model for {search_type}: {e}")
+    elif search_type == "fts":
+        # FTS5 lives inside ir_project.db and carries doc_id/doc itself; nothing to load
+        return {"dataset": dataset}
+    else:
+        # Load search-type specific joblib data
+        joblib_path = f"offline_data/{search_type}_{dataset}.joblib"
+        try:
+            loaded_joblib = joblib.load(joblib_path)
+            joblib_data.update(loaded_joblib)
+            print(f"Loaded {search_type} model data for dataset '{dataset}' from '{joblib_path}'.")
+        except FileNotFoundError:
+            # BERT does not have a joblib model file, its FAISS index is loaded separately in BertSearch
+            if search_type not in ["bert", "hybrid"]: # Hybrid doesn't load direct models
+                print(f"Warning: Offline data for {search_type} and dataset {dataset} not found at {joblib_path}. "
+                      "This might be expected for BERT (index loaded by class) or Hybrid (orchestrates).")
+        except Exception as e:
+            print(f"Error loading joblib data for {search_type} from {joblib_path}: {e}")
+            raise HTTPException(status_code=500, detail=f"Failed to load search model for {search_type}: {e}")
 
 
-    # Always load doc_ids list from SQLite. This list is needed for mapping.
-    conn = None
-    doc_ids_list = []
+    # The row -> doc_id table the engine's builder wrote next to its index (memory-mapped),
+    # else one read from SQLite in the builders' row order. This is needed for mapping.
     try:
-        db_path = "offline/ir_project.db" # Make sure this path is correct relative to your app's root
-        conn = sqlite3.connect(db_path)
-        cursor = conn.execute(f"SELECT doc_id FROM `{dataset}` ORDER BY doc_id ASC") 
-        doc_ids_list = [row[0] for row in cursor.fetchall()]
-        print(f"Loaded {len(doc_ids_list)} document IDs for dataset '{dataset}' from '{db_path}'.")
+        doc_ids_list = load_doc_ids(dataset, _doc_id_dir(search_type, dataset, joblib_data))
+        print(f"Loaded {len(doc_ids_list)} document IDs for dataset '{dataset}'.")
     except sqlite3.OperationalError as e:
-        print(f"SQLite error loading document IDs for '{dataset}': {e}. Ensure table `{dataset}` exists in '{db_path}' and is accessible.")
+        print(f"SQLite error loading document IDs for '{dataset}': {e}. Ensure table `{dataset}` exists and is accessible.")
         raise HTTPException(status_code=500, detail=f"Failed to load document IDs for dataset {dataset}: {e}")
-    finally:
-        if conn:
-            conn.close()
-    
+    index = joblib_data.get(f"{search_type}_index")
+    if index is not None:
+        # A table from another build would silently map rows to the wrong documents
+        try:
+            doc_ids_list.verify(index.meta["n_docs"], index.meta.get("doc_ids_fingerprint"),
+                                f"{search_type} index of '{dataset}'")
+        except ValueError as e:
+            print(f"Error: {e}")
+            raise HTTPException(status_code=500, detail=f"Failed to load search model for {search_type}: {e}")
+
+        # Optional positional index (bm25 builder) for quoted phrase / proximity queries.
+        # Its matches filter this engine's rows, so it must have been built over exactly these rows.
+        positions_dir = f"offline_data/positions_{dataset}"
+        if os.path.exists(os.path.join(positions_dir, "meta.json")):
+            positions = PositionalIndex(positions_dir)
+            fingerprint = positions.meta.get("doc_ids_fingerprint")
+            try:
+                if fingerprint is None:
+                    raise ValueError(f"positional index '{positions.directory}' does not record its rows; rebuild it.")
+                doc_ids_list.verify(positions.n_docs, fingerprint, f"positional index of '{dataset}'")
+                joblib_data["positions"] = positions
+            except ValueError as e:
+                print(f"Warning: ignoring {e} Quoted phrases are treated as plain words.")
+
     joblib_data["dataset"] = dataset 
     joblib_data["doc_ids"] = doc_ids_list 
 
     return joblib_data
 
-# --- Search Service Instances Cache (per dataset/type) ---
-# This dictionary will hold the instantiated search class objects (TfIdfSearch, Bm25Search, BertSearch)
-# preventing re-initialization on every request for the same dataset/type.
-_search_service_instances = {}
+# --- Search Engine Registry ---
+# Engines live in generations (services/engine_registry.py): rebuilt artifacts are loaded into a
+# new generation in the background and swapped in without a restart, via POST /admin/reload or
+# the artifact watcher (IR_WATCH_ARTIFACTS=<seconds>). Requests finish on the generation they started on.
+_SEARCH_CLASSES = {
+    "tfidf": TfIdfSearch,
+    "bm25": Bm25Search,
+    "bert": BertSearch,
+    "fts": FtsSearch,
+}
+
+KNOWN_DATASETS = ["antique", "quora"]
+
+# Repeated queries (and those replayed by the warmup) skip the engines entirely
+RESULT_CACHE_SIZE = int(os.getenv("IR_RESULT_CACHE", "2048"))
+
+def _build_engine(generation, key):
+    """Registry factory: creates the engine for `key` = (kind, dataset) within `generation`."""
+    kind, dataset = key
+    if kind.startswith("rerank:"):
+        # RerankSearch shares the lexical and BERT engines of its own generation
+        _, first_stage, candidates = kind.split(":")
+        return RerankSearch(generation.get((first_stage, dataset)), generation.get(("bert", dataset)),
+                            first_stage, candidates=int(candidates))
+    if kind == "suggest":
+        return SuggestIndex(f"offline_data/suggest_{dataset}")
+    if kind == "search_config":
+        return load_search_config(dataset)
+    if kind == "docstore":
+        # Checked against its source table once per generation; None means documents come from SQLite
+        return open_docstore(dataset)
+    search_class = _SEARCH_CLASSES[kind]
+    print(f"Initializing {search_class.__name__} for {dataset}...")
+    data = _load_data(kind, dataset)
+    if kind != "fts":
+        data["docstore"] = generation.get(("docstore", dataset))
+    return search_class(data)
+
+_registry = EngineRegistry(_build_engine, memo_size=RESULT_CACHE_SIZE)
+
+def _get_search_service(search_type: str, dataset: str, generation=None):
+    """Returns the search instance for (search_type, dataset) of `generation` (default: the live one)."""
+    return (generation or _registry.current).get((search_type, dataset))
+
+def _get_rerank_service(first_stage: str, dataset: str, candidates: int, generation=None):
+    """Returns a RerankSearch sharing the lexical and BERT instances of the same generation."""
+    return (generation or _registry.current).get((f"rerank:{first_stage}:{candidates}", dataset))
+
+def _search(generation, search_type: str, dataset: str, query: str, doc_filter=None, top_k: int = 10):
+    """One engine's results, from the generation's result cache if possible; copied so callers may annotate them."""
+    results = generation.cached(
+        (search_type, dataset, query, doc_filter, top_k),
+        lambda: tuple(generation.get((search_type, dataset)).execute_search(query, doc_filter, top_k)),
+    )
+    return [dict(result) for result in results]
+
+def _search_hits(generation, search_type: str, dataset: str, query: str, doc_filter=None, depth: int = 10):
+    """
+    One engine's ranked hits for fusion, without fetching any text: {"doc_id", "score"} from the
+    engine's rows. FTS reads the text along with its matches, so its hits carry "doc_text" too.
+    Cached like _search and copied the same way.
+    """
+    def compute():
+        service = generation.get((search_type, dataset))
+        if not hasattr(service, "search_rows"):
+            return tuple(service.execute_search(query, doc_filter, depth))
+        rows, scores = service.search_rows(query, depth, doc_filter)
+        return tuple({"doc_id": service.doc_ids[i], "score": float(score)} for i, score in zip(rows, scores))
+
+    results = generation.cached(("hits", search_type, dataset, query, doc_filter, depth), compute)
+    return [dict(result) for result in results]
+
+def preload_search_services(spec: str):
+    """
+    Opens search instances ahead of the first request, e.g. in a gunicorn master
+    before it forks workers, so every worker shares the same mapped pages.
+    `spec` is "all" or a comma list of "engine:dataset" entries ("*" matches every dataset).
+    """
+    if spec.strip() == "all":
+        # FTS is the low-memory alternative to bm25/tfidf; preload it explicitly when wanted
+        pairs = [(engine, dataset) for engine in _SEARCH_CLASSES if engine != "fts" for dataset in KNOWN_DATASETS]
+    else:
+        pairs = []
+        for item in filter(None, (part.strip() for part in spec.split(","))):
+            engine, _, dataset = item.partition(":")
+            datasets = KNOWN_DATASETS if dataset in ("", "*") else [dataset]
+            pairs.extend((engine, name) for name in datasets)
+
+    for engine, dataset in pairs:
+        try:
+            _get_search_service(engine, dataset)
+        except Exception as e:
+            print(f"Warning: could not preload {engine} for {dataset}: {e}")
 
 
 # --- API Endpoints ---
@@ -88,182 +300,504 @@ async def refine_query(
     """
     Expands the given query using synonym expansion and returns the original and expanded query.
     """
-    expanded_query = expand_query_with_synonyms(request.query) 
+    with stage_timer("refine", "all", "expand"):
+        expanded_query = expand_query_with_synonyms(request.query) 
     print("original_query: "+ request.query) 
     print("expanded_query: "+ expanded_query)
     return {"original_query": request.query, "expanded_query": expanded_query}
 
 
-@router.post("/search/tfidf", response_model=list[SearchResult])
-async def search_tfidf(req: SearchRequest):
-    """Performs TFIDF search for the given query and dataset."""
+# --- Autocomplete ---
+def _get_suggest_index(dataset: str):
+    """The memory-mapped suggest index built by offline/suggest_service.py, per generation."""
+    return _registry.current.get(("suggest", dataset))
+
+@router.get("/suggest")
+async def suggest(
+    q: str = Query(..., min_length=1, max_length=100, description="What the user has typed so far."),
+    dataset: str = Query(..., description="The dataset to suggest for (e.g., 'antique', 'quora')"),
+    k: int = Query(10, ge=1, le=10),
+):
+    """
+    Type-ahead completions of `q`, most frequent first. When nothing completes it,
+    a spelling correction is offered instead.
+    """
     try:
-        data_payload = _cached_load_data("tfidf", req.dataset)
-        cache_key = ("tfidf", req.dataset)
-        
-        if cache_key not in _search_service_instances:
-            print(f"Initializing TfIdfSearch for {req.dataset}...")
-            service = TfIdfSearch(data_payload)
-            _search_service_instances[cache_key] = service
+        index = _get_suggest_index(dataset)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=f"No suggest index for dataset '{dataset}'.")
+    with stage_timer("suggest", dataset, "complete"):
+        completions = index.complete(q, k)
+    did_you_mean = None
+    if not completions:
+        with stage_timer("suggest", dataset, "spell"):
+            did_you_mean = index.did_you_mean(q)
+    return {
+        "query": q,
+        "completions": [{"text": text, "score": score} for text, score in completions],
+        "did_you_mean": did_you_mean,
+    }
+
+
+# --- Deadlines ---
+# A request's latency budget (services/deadline.py) bounds every engine call: work still running
+# at the deadline is cancelled or ignored and the response is built from whatever arrived.
+# Ignored engine threads finish in the background and still fill the result cache.
+# Hybrid fusion of partial results runs right at the deadline, so callers waiting on it allow this much more:
+FUSION_GRACE_SECONDS = 0.05
+
+async def _gather_until_deadline(awaitables: dict, grace: float = 0.0):
+    """
+    Runs the named awaitables concurrently until all have finished or the request's deadline
+    (+ grace) has passed; unfinished ones are cancelled. Returns ({name: result},
+    {name: "ok" | "timeout" | "error"}, {name: exception}).
+    """
+    tasks = {name: asyncio.ensure_future(awaitable) for name, awaitable in awaitables.items()}
+    timeout = remaining()
+    if tasks:
+        await asyncio.wait(tasks.values(), timeout=None if timeout is None else timeout + grace)
+
+    results, statuses, errors = {}, {}, {}
+    for name, task in tasks.items():
+        if not task.done():
+            task.cancel()
+            statuses[name] = "timeout"
+            print(f"Warning: {name} missed the search deadline; continuing without it.")
+        elif task.exception() is not None:
+            errors[name] = task.exception()
+            statuses[name] = "timeout" if isinstance(errors[name], DeadlineExceeded) else "error"
+            print(f"Warning: {name} failed: {errors[name]}")
         else:
-            service = _search_service_instances[cache_key]
-        
-        results = service.execute_search(req.query)
-        return results
+            results[name] = task.result()
+            statuses[name] = "ok"
+    return results, statuses, errors
+
+def _set_contribution_headers(response: Response, engines: dict):
+    """X-Search-Engines / X-Search-Missing / X-Search-Partial from {name: status}, so degraded answers stand out."""
+    if response is None:
+        return
+    missing = {name: status for name, status in engines.items() if status != "ok"}
+    response.headers["X-Search-Engines"] = ",".join(name for name, status in engines.items() if status == "ok")
+    response.headers["X-Search-Missing"] = ",".join(f"{name}={status}" for name, status in missing.items())
+    response.headers["X-Search-Partial"] = "1" if missing else "0"
+
+
+# --- Federated (multi-dataset) Search ---
+async def _federated_search(datasets, run_one, engines: dict, k: int = 10):
+    """
+    Runs `run_one(dataset, engines[dataset])` for every dataset concurrently, min-max normalizes
+    each dataset's scores on its own (raw scores of different corpora are not comparable) and
+    merges them into one top-k, each hit tagged with its dataset. Datasets that miss the deadline
+    are left out. Returns (results, per-dataset metadata).
+    """
+    async def timed(dataset):
+        start = time.perf_counter()
+        results = await run_one(dataset, engines.setdefault(dataset, {}))
+        return results, (time.perf_counter() - start) * 1000
+
+    finished, statuses, errors = await _gather_until_deadline(
+        {dataset: timed(dataset) for dataset in datasets}, grace=FUSION_GRACE_SECONDS
+    )
+
+    merged, metadata = [], {}
+    for dataset in datasets:
+        if dataset not in finished:
+            metadata[dataset] = {"status": statuses[dataset], "engines": engines[dataset]}
+            if dataset in errors:
+                metadata[dataset]["error"] = str(errors[dataset])
+            continue
+        results, took_ms = finished[dataset]
+        for res in _normalize_scores(results):
+            merged.append({"doc_id": res["doc_id"], "doc_text": res["doc_text"],
+                           "score": res.get("normalized_score", 0.0), "dataset": dataset})
+        metadata[dataset] = {"status": "ok", "took_ms": round(took_ms, 2), "hits": len(results),
+                             "engines": engines[dataset]}
+
+    merged.sort(key=lambda x: x["score"], reverse=True)
+    return merged[:k], metadata
+
+def _apply_snippets(req: SearchRequest, results):
+    """Replaces each final hit's doc_text by its query-biased snippet when the request asks for it."""
+    if req.snippets:
+        terms = query_terms(req.query)
+        for res in results:
+            res["doc_text"] = make_snippet(res["doc_text"], terms)
+    return results
+
+def _apply_duplicates(req: SearchRequest, results, dataset=None):
+    """Adds each hit's collapsed near-duplicates (offline/dedup_service.py) when the request asks for them."""
+    if req.expand_duplicates:
+        for name in {dataset or res.get("dataset") for res in results}:
+            hits = [res for res in results if (dataset or res.get("dataset")) == name]
+            duplicates = get_duplicates(name, [res["doc_id"] for res in hits])
+            for res in hits:
+                res["duplicates"] = duplicates.get(res["doc_id"], [])
+    return results
+
+async def _search_response(req: SearchRequest, engine: str, run_one, response: Response = None,
+                           budget_header: Optional[int] = None):
+    """
+    One dataset: the engine's result list, as before. A list of datasets or "all":
+    a FederatedSearchResponse with per-dataset timings in its metadata.
+    `run_one(dataset, engines)` searches one dataset; hybrid records each engine's status
+    in `engines`. The whole request runs under its latency budget (field, header or default).
+    """
+    with deadline_scope(req.budget_ms or budget_header or DEFAULT_BUDGET_MS):
+        datasets = req.federated_datasets()
+        if datasets is None:
+            engines = {}
+            timeout = remaining()
+            try:
+                results = await asyncio.wait_for(
+                    run_one(req.dataset, engines), None if timeout is None else timeout + FUSION_GRACE_SECONDS
+                )
+            except (asyncio.TimeoutError, DeadlineExceeded):
+                raise HTTPException(status_code=504, detail=f"{engine} search on '{req.dataset}' missed the latency budget.")
+            _set_contribution_headers(response, engines or {engine: "ok"})
+            log_query(engine, req.dataset, req.query)
+            return _apply_snippets(req, _apply_duplicates(req, results, req.dataset))
+
+        start = time.perf_counter()
+        engines = {}
+        results, per_dataset = await _federated_search(datasets, run_one, engines)
+        for dataset in datasets:
+            log_query(engine, dataset, req.query)
+            if not engines[dataset]:
+                engines[dataset] = {engine: per_dataset[dataset]["status"]}
+                per_dataset[dataset]["engines"] = engines[dataset]
+        _set_contribution_headers(response, {f"{dataset}/{name}": status for dataset in datasets
+                                             for name, status in engines[dataset].items()})
+        results = _apply_snippets(req, _apply_duplicates(req, results))
+        return {
+            "results": results,
+            "metadata": {
+                "engine": engine,
+                "took_ms": round((time.perf_counter() - start) * 1000, 2),
+                "partial": any(status != "ok" for per_engine in engines.values() for status in per_engine.values()),
+                "datasets": per_dataset,
+            },
+        }
+
+
+@router.post("/search/tfidf", response_model=SearchResponse, response_model_exclude_none=True)
+async def search_tfidf(req: SearchRequest, response: Response,
+                       budget_ms: Optional[int] = Header(None, alias=BUDGET_HEADER)):
+    """Performs TFIDF search for the given query and dataset(s)."""
+    try:
+        with _registry.acquire() as generation:
+            return await _search_response(
+                req, "tfidf", lambda ds, engines: _run_search(generation, "tfidf", ds, req.query, req.doc_filter()),
+                response, budget_ms,
+            )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"TFIDF Search Error: {e}")
 
-@router.post("/search/bm25", response_model=list[SearchResult])
-async def search_bm25(req: SearchRequest):
-    """Performs BM25 search for the given query and dataset."""
+@router.post("/search/bm25", response_model=SearchResponse, response_model_exclude_none=True)
+async def search_bm25(req: SearchRequest, response: Response,
+                      budget_ms: Optional[int] = Header(None, alias=BUDGET_HEADER)):
+    """Performs BM25 search for the given query and dataset(s)."""
     try:
-        data_payload = _cached_load_data("bm25", req.dataset)
-        cache_key = ("bm25", req.dataset)
-        
-        if cache_key not in _search_service_instances:
-            print(f"Initializing Bm25Search for {req.dataset}...")
-            service = Bm25Search(data_payload)
-            _search_service_instances[cache_key] = service
-        else:
-            service = _search_service_instances[cache_key]
-        
-        results = service.execute_search(req.query)
-        return results
+        with _registry.acquire() as generation:
+            return await _search_response(
+                req, "bm25", lambda ds, engines: _run_search(generation, "bm25", ds, req.query, req.doc_filter()),
+                response, budget_ms,
+            )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"BM25 Search Error: {e}")
 
-@router.post("/search/bert", response_model=list[SearchResult])
-async def search_bert(req: SearchRequest):
-    """Performs BERT search for the given query and dataset."""
+@router.post("/search/bert", response_model=SearchResponse, response_model_exclude_none=True)
+async def search_bert(req: SearchRequest, response: Response,
+                      budget_ms: Optional[int] = Header(None, alias=BUDGET_HEADER)):
+    """Performs BERT search for the given query and dataset(s)."""
     try:
-        data_payload = _cached_load_data("bert", req.dataset)
-        cache_key = ("bert", req.dataset)
-        
-        if cache_key not in _search_service_instances:
-            print(f"Initializing BertSearch for {req.dataset}...")
-            service = BertSearch(data_payload)
-            _search_service_instances[cache_key] = service
-        else:
-            service = _search_service_instances[cache_key]
-        
-        results = service.execute_search(req.query)
-        return results
+        with _registry.acquire() as generation:
+            return await _search_response(
+                req, "bert", lambda ds, engines: _run_search(generation, "bert", ds, req.query, req.doc_filter()),
+                response, budget_ms,
+            )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"BERT Search Error: {e}")
 
 
-@router.post("/search/hybrid", response_model=list[SearchResult])
-async def search_hybrid(req: SearchRequest):
+@router.post("/search/fts", response_model=SearchResponse, response_model_exclude_none=True)
+async def search_fts(req: SearchRequest, response: Response,
+                     budget_ms: Optional[int] = Header(None, alias=BUDGET_HEADER)):
+    """Performs SQLite FTS5 (bm25) search for the given query and dataset(s)."""
+    try:
+        with _registry.acquire() as generation:
+            return await _search_response(
+                req, "fts", lambda ds, engines: _run_search(generation, "fts", ds, req.query, req.doc_filter()),
+                response, budget_ms,
+            )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"FTS Search Error: {e}")
+
+
+@router.post("/search/rerank", response_model=SearchResponse, response_model_exclude_none=True)
+async def search_rerank(req: RerankRequest, response: Response,
+                        budget_ms: Optional[int] = Header(None, alias=BUDGET_HEADER)):
     """
-    Performs a hybrid search by combining results from BERT, TFIDF, and BM25 APIs.
+    Two-stage search: BM25 or TFIDF candidates re-ordered by BERT similarity
+    computed from the stored document embeddings.
     """
-    # Define weights
-    weights = {
+    try:
+        with _registry.acquire() as generation:
+            def run_one(dataset, engines):
+                service = _get_rerank_service(req.first_stage, dataset, req.candidates, generation)
+                return asyncio.to_thread(profiled_call, lambda: service.execute_search(req.query, req.doc_filter()))
+            return await _search_response(req, "rerank", run_one, response, budget_ms)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Rerank Search Error: {e}")
+
+
+# --- Hybrid Search ---
+# "low_memory" swaps the in-RAM lexical models for the on-disk FTS5 index
+HYBRID_PROFILES = {
+    "default": {
         "bert": 0.5,
         "tfidf": 0.2,
         "bm25": 0.3
-    }
-    
-    # asynchronous HTTP requests to local endpoints
-    async with httpx.AsyncClient() as client:
-        bert_task = client.post(
-            "http://127.0.0.1:8000/api/search/bert", 
-            json={"query": req.query, "dataset": req.dataset}
-        )
-        tfidf_task = client.post(
-            "http://127.0.0.1:8000/api/search/tfidf",
-            json={"query": req.query, "dataset": req.dataset}
-        )
-        bm25_task = client.post(
-            "http://127.00.1:8000/api/search/bm25",
-            json={"query": req.query, "dataset": req.dataset}
-        )
+    },
+    "low_memory": {
+        "bert": 0.5,
+        "fts": 0.5
+    },
+}
+HYBRID_WEIGHTS = HYBRID_PROFILES[os.getenv("IR_HYBRID_PROFILE", "default")]
+
+def _normalize_scores(results_list):
+    """Min-max normalizes the scores of one result list into 'normalized_score' (1.0 when they are all equal)."""
+    scores = [res["score"] for res in results_list if "score" in res]
+    if not scores:
+        return results_list
+    min_score = min(scores)
+    max_score = max(scores)
+
+    for res in results_list:
+        if "score" in res:
+            if max_score == min_score:
+                # A single hit or all tied: each is its dataset's best match, not its worst
+                res["normalized_score"] = 1.0
+            else:
+                res["normalized_score"] = (res["score"] - min_score) / (max_score - min_score)
+    return results_list
+
+def _fuse_results(results_by_engine, weights, method="minmax", rrf_k=DEFAULT_RRF_K):
+    """Weighted sum of each engine's contributions (services/fusion.py) per doc_id, best first."""
+    combined_scores_map = {} 
+
+    for engine, results in results_by_engine.items():
+        contributions = fusion_contributions([res["score"] for res in results], method, rrf_k)
+        for res, contribution in zip(results, contributions):
+            doc_id = res["doc_id"]
+            combined_scores_map.setdefault(doc_id, {"score": 0.0, "doc_text": res.get("doc_text", "")})
+            combined_scores_map[doc_id]["score"] += float(contribution) * weights[engine]
+            # If doc_text was not present from an earlier engine, take it from this one
+            if not combined_scores_map[doc_id]["doc_text"] and res.get("doc_text"):
+                combined_scores_map[doc_id]["doc_text"] = res["doc_text"]
+
+    final_results = [
+        {"doc_id": doc_id, "doc_text": data["doc_text"], "score": data["score"]}
+        for doc_id, data in combined_scores_map.items()
+    ]
+    # Sort by score in descending order
+    final_results.sort(key=lambda x: x["score"], reverse=True)
+    return final_results
+
+async def _run_search(generation, search_type: str, dataset: str, query: str, doc_filter=None, top_k: int = 10):
+    """Runs one engine in a worker thread so several engines can score concurrently."""
+    return await asyncio.to_thread(
+        profiled_call, lambda: _search(generation, search_type, dataset, query, doc_filter, top_k)
+    )
+
+async def _run_hits(generation, search_type: str, dataset: str, query: str, doc_filter=None, depth: int = 10):
+    """_search_hits of one engine in a worker thread, like _run_search."""
+    return await asyncio.to_thread(
+        profiled_call, lambda: _search_hits(generation, search_type, dataset, query, doc_filter, depth)
+    )
 
-        bert_response, tfidf_response, bm25_response = await asyncio.gather(
-            bert_task, tfidf_task, bm25_task, return_exceptions=True 
+def _hybrid_fusion(generation, dataset: str):
+    """
+    The fusion settings of one dataset: the tuned ones from offline/tune_fusion.py when they
+    were tuned for the engines of the active profile, else the profile's weights with min-max
+    fusion of each engine's top 10.
+    """
+    tuned = generation.get(("search_config", dataset)).get("hybrid")
+    if tuned and set(tuned["weights"]) == set(HYBRID_WEIGHTS):
+        return tuned
+    return {"weights": HYBRID_WEIGHTS, "method": "minmax", "rrf_k": DEFAULT_RRF_K, "depth": 10}
+
+async def _hybrid_search(generation, dataset: str, query: str, doc_filter=None, engines=None):
+    """
+    Fused top 10 of the hybrid engines on one dataset. Engines that fail or miss the request's
+    deadline are left out of the fusion; `engines` (a dict) receives each engine's status.
+    Fusion works on doc_ids and scores; only the 10 returned documents have their text fetched.
+    """
+    fusion = _hybrid_fusion(generation, dataset)
+    weights = fusion["weights"]
+
+    # The engines run in-process (in threads) rather than through HTTP calls back into this API
+    results_by_engine, statuses, _ = await _gather_until_deadline({
+        engine: _run_hits(generation, engine, dataset, query, doc_filter, fusion["depth"]) for engine in weights
+    })
+    if engines is not None:
+        engines.update(statuses)
+
+    with stage_timer("hybrid", dataset, "fusion"):
+        final_results = _fuse_results(results_by_engine, weights, fusion["method"], fusion["rrf_k"])
+
+    # Return top 10, with the text of those FTS did not already provide
+    final_results = final_results[:10]
+    docstore = generation.get(("docstore", dataset))
+    with stage_timer("hybrid", dataset, "hydrate"):
+        for res in final_results:
+            if not res["doc_text"]:
+                res["doc_text"] = get_doc_text_by_id(dataset, res["doc_id"], docstore)
+    return final_results
+
+@router.post("/search/hybrid", response_model=SearchResponse, response_model_exclude_none=True)
+async def search_hybrid(req: SearchRequest, response: Response,
+                        budget_ms: Optional[int] = Header(None, alias=BUDGET_HEADER)):
+    """
+    Performs a hybrid search by combining results from the BERT, TFIDF, and BM25 engines
+    (BERT and FTS with IR_HYBRID_PROFILE=low_memory). With a latency budget, the engines that
+    answered in time are fused; X-Search-Engines / X-Search-Missing say which ones those were.
+    """
+    # All engines of all datasets run on the same generation even if a reload swaps in a new one meanwhile
+    with _registry.acquire() as generation:
+        return await _search_response(
+            req, "hybrid", lambda ds, engines: _hybrid_search(generation, ds, req.query, req.doc_filter(), engines),
+            response, budget_ms,
         )
 
-    bert_results = []
-    if isinstance(bert_response, httpx.Response) and bert_response.status_code == 200:
-        bert_results = bert_response.json()
-    else:
-        print(f"Warning: BERT search failed or returned non-200: {bert_response}")
 
-    tfidf_results = []
-    if isinstance(tfidf_response, httpx.Response) and tfidf_response.status_code == 200:
-        tfidf_results = tfidf_response.json()
-    else:
-        print(f"Warning: TFIDF search failed or returned non-200: {tfidf_response}")
+# --- Startup Warmup ---
+# Replays the most frequent logged queries so the result and query-embedding caches are
+# filled and the memory-mapped artifacts are paged in before the worker takes traffic.
+WARMUP_TOP_N = int(os.getenv("IR_WARMUP_TOP_N", "100"))
 
-    bm25_results = []
-    if isinstance(bm25_response, httpx.Response) and bm25_response.status_code == 200:
-        bm25_results = bm25_response.json()
-    else:
-        print(f"Warning: BM25 search failed or returned non-200: {bm25_response}")
-
-    # Normalize scores
-    def normalize_scores(results_list):
-        if not results_list:
-            return results_list
-        scores = [res["score"] for res in results_list if "score" in res]
-        if not scores:
-            return results_list
-        min_score = min(scores)
-        max_score = max(scores)
-        
-        if max_score == min_score: 
-            for res in results_list:
-                if "score" in res:
-                    res["normalized_score"] = 0.0 
-            else:
-                for res in results_list: # This 'else' block will never be reached, remove for clarity
-                    if "score" in res:
-                        res["normalized_score"] = 0.0 # Assign 0 if min and max are the same
-        else:
-            for res in results_list:
-                if "score" in res:
-                    res["normalized_score"] = (res["score"] - min_score) / (max_score - min_score)
-        return results_list
+def _artifact_paths(search_type: str, dataset: str):
+    """Files and directories an engine reads from (doc ids included)."""
+    paths = [f"offline_data/doc_ids_{dataset}"]
+    if search_type in _INDEX_CLASSES:
+        paths.append(f"offline_data/{search_type}_{dataset}")
+        paths.append(f"offline_data/positions_{dataset}")
+    elif search_type == "bert":
+        paths.append(f"faiss_store/{dataset}")
+    elif search_type == "suggest":
+        paths.append(f"offline_data/suggest_{dataset}")
+    elif search_type == "docstore":
+        paths.append(f"offline_data/docstore_{dataset}")
+    if search_type in ("bm25", "search_config"):
+        # Tuned settings take effect on the next reload, like rebuilt artifacts
+        paths.append(str(SEARCH_CONFIG_PATH))
+    return [path for path in paths if os.path.exists(path)]
 
-    bert_results = normalize_scores(bert_results)
-    tfidf_results = normalize_scores(tfidf_results)
-    bm25_results = normalize_scores(bm25_results)
+def warm_up_search_services(top_n: int = WARMUP_TOP_N, generation=None):
+    """
+    Replays the top-N logged queries of every engine/dataset pair (hybrid queries through
+    each hybrid engine) on `generation` (default: the live one), then pages in the
+    artifacts of every engine it has open.
+    """
+    generation = generation or _registry.current
+    start = time.perf_counter()
+    replayed = 0
+    for (engine, dataset), queries in top_queries(top_n).items():
+        if dataset not in KNOWN_DATASETS:
+            continue
+        # Hybrid queries are replayed at the depth the hybrid endpoint asks each engine for
+        depth = _hybrid_fusion(generation, dataset)["depth"] if engine == "hybrid" else 10
+        engines = list(HYBRID_WEIGHTS) if engine == "hybrid" else [engine]
+        for search_type in engines:
+            if search_type not in _SEARCH_CLASSES:
+                continue
+            try:
+                for query, _ in queries:
+                    if engine == "hybrid":
+                        _search_hits(generation, search_type, dataset, query, depth=depth)
+                    else:
+                        _search(generation, search_type, dataset, query, top_k=depth)
+                    replayed += 1
+            except Exception as e:
+                print(f"Warning: warmup of {search_type} for {dataset} stopped: {e}")
 
-    # Combine scores
-    combined_scores_map = {} 
+    paged_mb = 0.0
+    for search_type, dataset in generation.keys():
+        if search_type in _SEARCH_CLASSES:
+            paged_mb += page_in(_artifact_paths(search_type, dataset))
+    print(f"Warmup: replayed {replayed} logged queries and paged in {paged_mb:.1f} MB "
+          f"in {time.perf_counter() - start:.1f}s")
 
-    for res in bert_results:
-        doc_id = res["doc_id"]
-        # Ensure doc_text is carried over as it's needed for final results
-        combined_scores_map.setdefault(doc_id, {"score": 0.0, "doc_text": res.get("doc_text", "")})
-        combined_scores_map[doc_id]["score"] += res.get("normalized_score", 0.0) * weights["bert"]
-
-    for res in tfidf_results:
-        doc_id = res["doc_id"]
-        combined_scores_map.setdefault(doc_id, {"score": 0.0, "doc_text": res.get("doc_text", "")})
-        combined_scores_map[doc_id]["score"] += res.get("normalized_score", 0.0) * weights["tfidf"]
-        # If doc_text was not present from BERT, take it from TFIDF (or vice-versa)
-        if not combined_scores_map[doc_id]["doc_text"] and res.get("doc_text"):
-            combined_scores_map[doc_id]["doc_text"] = res["doc_text"]
-        
-    for res in bm25_results:
-        doc_id = res["doc_id"]
-        combined_scores_map.setdefault(doc_id, {"score": 0.0, "doc_text": res.get("doc_text", "")})
-        combined_scores_map[doc_id]["score"] += res.get("normalized_score", 0.0) * weights["bm25"]
-        # If doc_text was not present from other sources, take it from BM25
-        if not combined_scores_map[doc_id]["doc_text"] and res.get("doc_text"):
-            combined_scores_map[doc_id]["doc_text"] = res["doc_text"]
-
-    # Sort final results
-    final_results = []
-    for doc_id, data in combined_scores_map.items():
-        final_results.append({
-            "doc_id": doc_id,
-            "doc_text": data["doc_text"],
-            "score": data["score"]
-        })
-
-    # Sort by score in descending order and return top 10
-    final_results.sort(key=lambda x: x["score"], reverse=True)
-    
-    return final_results[:10]
\ No newline at end of file
+
+# --- Hot Reload ---
+def reload_search_services():
+    """Loads every open engine again into a new generation, warms it up, then swaps it in."""
+    return _registry.reload(
+        prepare=lambda generation: warm_up_search_services(WARMUP_TOP_N, generation) if WARMUP_TOP_N else None
+    )
+
+def search_services_status():
+    return _registry.status()
+
+def _artifact_stamps(generation):
+    """(mtime, size) of every file the generation's engines were loaded from."""
+    stamps = {}
+    for search_type, dataset in generation.keys():
+        paths = _artifact_paths(search_type, dataset)
+        if search_type == "fts":
+            paths.append(str(DB_PATH))
+        for path in paths:
+            files = [path] if os.path.isfile(path) else [
+                os.path.join(root, name) for root, _, names in os.walk(path) for name in names
+            ]
+            for file_path in files:
+                try:
+                    stat = os.stat(file_path)
+                except OSError:
+                    continue
+                stamps[file_path] = (stat.st_mtime_ns, stat.st_size)
+    return stamps
+
+def start_artifact_watcher(interval: float):
+    """
+    Polls the artifacts of the open engines every `interval` seconds and reloads when one
+    changed. A change must stay the same for one more poll first, so files that a build is
+    still writing are not loaded. Every worker process runs its own watcher.
+    """
+    def watch():
+        loaded = _artifact_stamps(_registry.current)
+        loaded_generation = _registry.current.id
+        previous = loaded
+        while True:
+            time.sleep(interval)
+            if _registry.current.id != loaded_generation:
+                # Reloaded through the admin endpoint meanwhile
+                loaded = previous = _artifact_stamps(_registry.current)
+                loaded_generation = _registry.current.id
+                continue
+            current = _artifact_stamps(_registry.current)
+            # Engines opened since the last poll are new, not changed
+            for path, stamp in current.items():
+                loaded.setdefault(path, stamp)
+            changed = [path for path, stamp in current.items() if loaded[path] != stamp]
+            if changed and all(previous.get(path) == current[path] for path in changed):
+                print(f"Artifacts changed ({len(changed)} files, e.g. {changed[0]}); reloading engines...")
+                try:
+                    reload_search_services()
+                except Exception as e:
+                    print(f"Warning: artifact reload failed, keeping generation {_registry.current.id}: {e}")
+                loaded = _artifact_stamps(_registry.current)
+                loaded_generation = _registry.current.id
+            previous = current
+
+    threading.Thread(target=watch, name="artifact-watcher", daemon=True).start()
@@ -0,0 +1,136 @@
+# services/sharded_search.py
+
+import heapq
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, wait
+from pathlib import Path
+
+import numpy as np
+
+from services.array_utils import restricted_top_k, shard_dir_name
+from services.bm25_index import Bm25Index
+from services.tfidf_index import TfIdfIndex
+from services.faiss_utils import read_faiss_index
+from services.doc_filter import faiss_search_params
+from services.deadline import remaining, DeadlineExceeded
+
+# Size of the per-process pool that scores shards; defaults to one process per core
+SHARD_WORKERS = int(os.getenv("IR_SHARD_WORKERS", str(os.cpu_count() or 1)))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+# Shards opened by this (pool worker) process, keyed by (engine, directory, stamp, shard): the
+# resolved version directory and the index's meta stamp of the generation that sent the query, so
+# a hot reload never scores against shards of another build. Least recently used ones are closed.
+# Opening is cheap because every array is memory-mapped and shared via the page cache.
+OPEN_SHARDS_LIMIT = 256
+_open_shards = OrderedDict()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                # spawn: the API process has threads and a loaded torch model, which fork does not survive well
+                _executor = ProcessPoolExecutor(max_workers=SHARD_WORKERS,
+                                                mp_context=multiprocessing.get_context("spawn"))
+    return _executor
+
+
+def _reset_executor_after_fork():
+    # A pool created before a fork (e.g. by the preload warmup in the gunicorn master) belongs to
+    # the parent: its management thread does not exist in the child and its pipes are shared with
+    # the master, so nothing submitted from the child would ever complete. Each child starts its own.
+    global _executor, _executor_lock
+    _executor = None
+    _executor_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_executor_after_fork)
+
+
+def _open_shard(engine, directory, stamp, shard):
+    key = (engine, directory, stamp, shard)
+    index = _open_shards.get(key)
+    if index is not None:
+        _open_shards.move_to_end(key)
+    else:
+        if engine == "bm25":
+            index = Bm25Index(directory, shard=shard)
+        elif engine == "tfidf":
+            index = TfIdfIndex(directory, shard=shard)
+        elif engine == "bert":
+            index = read_faiss_index(Path(directory) / f"{shard_dir_name(shard)}.faiss")
+        else:
+            raise ValueError(f"Engine '{engine}' does not support sharding.")
+        _open_shards[key] = index
+        while len(_open_shards) > OPEN_SHARDS_LIMIT:
+            _open_shards.popitem(last=False)
+    return index
+
+
+def _search_shard(engine, directory, stamp, shard, row_offset, payload, k, rows=None, mask=None):
+    """
+    Runs in a pool worker: scores one shard and returns its top-k as
+    (global row ids, scores). `payload` is the query in the engine's own form:
+    (tokens, k1, b) (bm25), (term_ids, weights) (tfidf) or a query embedding (bert).
+    Only shard-local `rows` (lexical engines) or rows set in `mask` may be returned.
+    """
+    index = _open_shard(engine, directory, stamp, shard)
+    if engine == "bert":
+        distances, ids = index.search(payload, k, params=faiss_search_params(mask))
+        valid = ids[0] >= 0
+        return ids[0][valid] + row_offset, 1 - (distances[0][valid] / 2)
+
+    if engine == "bm25":
+        scores = index.get_scores(*payload)
+    else:
+        scores = index.score_vector(*payload)
+    top, top_scores = restricted_top_k(scores, k, rows, mask)
+    return top + row_offset, top_scores
+
+
+def scatter_gather(engine, directory, row_offsets, payload, k, rows=None, mask=None, stamp=None):
+    """
+    Scores every shard in parallel on the process pool and merges the per-shard
+    top-k lists with a heap. Returns (global row ids, scores), best first.
+    With `rows` (sorted global row ids) or `mask` (bool per global row) only those rows
+    can be returned; each shard receives just its own slice, and shards without any
+    eligible row are not searched. Shards still queued at the request's deadline are
+    cancelled and DeadlineExceeded is raised. `stamp` identifies the build of `directory` the
+    caller loaded (its artifact_stamp), so pool workers reopen shards after a rebuild.
+    """
+    executor = _get_executor()
+    futures = []
+    for shard in range(len(row_offsets) - 1):
+        lo, hi = row_offsets[shard], row_offsets[shard + 1]
+        local_rows = local_mask = None
+        if rows is not None:
+            local_rows = rows[np.searchsorted(rows, lo):np.searchsorted(rows, hi)] - lo
+            if not local_rows.size:
+                continue
+        if mask is not None:
+            local_mask = mask[lo:hi]
+            if not local_mask.any():
+                continue
+        futures.append(executor.submit(
+            _search_shard, engine, str(directory), stamp, shard, lo, payload, k, local_rows, local_mask
+        ))
+    _, pending = wait(futures, timeout=remaining())
+    if pending:
+        for future in pending:
+            future.cancel()
+        raise DeadlineExceeded(f"{len(pending)} of {len(futures)} {engine} shards missed the deadline")
+    candidates = heapq.nlargest(
+        k,
+        ((float(score), int(row)) for future in futures for row, score in zip(*future.result())),
+    )
+    rows = np.array([row for _, row in candidates], dtype="int64")
+    scores = np.array([score for score, _ in candidates], dtype="float64")
+    return rows, scores
@@ -0,0 +1,68 @@
+# services/snippets.py
+
+import functools
+import html
+import re
+from collections import Counter
+
+from nltk.stem import PorterStemmer
+
+from services.preprocessing_service import preprocess
+
+SNIPPET_WORDS = 30
+_WORD = re.compile(r"\w+")
+_stemmer = PorterStemmer()
+
+
+@functools.lru_cache(maxsize=65536)
+def _stem(word):
+    return _stemmer.stem(word.lower())
+
+
+def query_terms(query):
+    """The query's terms as the engines see them: lowercased, stopwords removed, stemmed."""
+    return frozenset(preprocess(query).split())
+
+
+def make_snippet(text, terms, window=SNIPPET_WORDS):
+    """
+    Returns the `window`-word passage of `text` containing the most distinct query terms
+    (then the most matches), HTML-escaped, with matching words wrapped in <mark>.
+    `terms` comes from `query_terms`; document words are stemmed the same way to match.
+    """
+    words = list(_WORD.finditer(text))
+    if not words:
+        return html.escape(text)
+    stems = [_stem(match.group()) for match in words]
+
+    # Sliding window over word positions, tracking per-term counts inside it
+    counts, total = Counter(), 0
+    best_start, best_key = 0, (-1, -1)
+    for end, stem in enumerate(stems):
+        if stem in terms:
+            counts[stem] += 1
+            total += 1
+        start = end - window + 1
+        if start > 0 and stems[start - 1] in terms:
+            leaving = stems[start - 1]
+            counts[leaving] -= 1
+            total -= 1
+            if not counts[leaving]:
+                del counts[leaving]
+        key = (len(counts), total)
+        if key > best_key:
+            best_key, best_start = key, max(start, 0)
+
+    last = min(best_start + window, len(words)) - 1
+    begin, finish = words[best_start].start(), words[last].end()
+    parts = ["… "] if begin > 0 else []
+    position = begin
+    for i in range(best_start, last + 1):
+        match = words[i]
+        parts.append(html.escape(text[position:match.start()]))
+        word = html.escape(match.group())
+        parts.append(f"<mark>{word}</mark>" if stems[i] in terms else word)
+        position = match.end()
+    if finish < len(text):
+        parts.append(" …")
+    return "".join(parts)
@@ -0,0 +1,160 @@
+# services/suggest_index.py
+
+import hashlib
+import json
+import string
+
+import numpy as np
+
+from services.array_utils import top_k_indices
+from services.term_table import TermTable
+from services.artifacts import resolve_artifact
+
+# Only the first PREFIX_LENGTH characters of a word take part in the deletion index
+# (SymSpell's prefix optimisation): it bounds the deletes per word without hurting recall much.
+PREFIX_LENGTH = 7
+MAX_EDIT_DISTANCE = 2
+SHORT_WORD_LENGTH = 4
+
+_PUNCTUATION = str.maketrans("", "", string.punctuation)
+
+
+def normalize(text):
+    """Lowercases, strips punctuation and collapses whitespace, like the first steps of preprocess()."""
+    return " ".join(text.lower().translate(_PUNCTUATION).split())
+
+
+def deletes(word, max_distance=MAX_EDIT_DISTANCE, prefix_length=PREFIX_LENGTH):
+    """The word's prefix plus every string obtained by deleting up to `max_distance` characters from it."""
+    variants = frontier = {word[:prefix_length]}
+    for _ in range(max_distance):
+        frontier = {v[:i] + v[i + 1:] for v in frontier for i in range(len(v))}
+        variants = variants | frontier
+    return variants
+
+
+def delete_hash(text):
+    """Stable 64-bit hash of a delete variant; collisions only add candidates that fail verification."""
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def edit_distance(a, b, max_distance):
+    """
+    Damerau-Levenshtein (optimal string alignment) distance between `a` and `b`,
+    or max_distance + 1 as soon as it is known to exceed `max_distance`.
+    """
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    previous_previous = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        row_min = current[0]
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                value = min(value, previous_previous[j - 2] + 1)
+            current[j] = value
+            row_min = min(row_min, value)
+        if row_min > max_distance:
+            return max_distance + 1
+        previous_previous, previous = previous, current
+    return previous[-1]
+
+
+class SuggestIndex:
+    """
+    Read-only, memory-mapped autocomplete and spelling index written by offline/suggest_service.py.
+
+    - completions: sorted TermTable of words and past queries, with a frequency score each.
+      A prefix maps to one contiguous id range by binary search.
+    - prefixes / prefix_topk: the precomputed best completions of every prefix whose range is
+      larger than `scan_limit` (kept in a dict); smaller ranges are ranked directly.
+    - delete_hashes / delete_ids: sorted SymSpell deletion index over the dictionary words.
+    """
+
+    def __init__(self, directory):
+        # Pinned to the version published right now (services/artifacts.py)
+        directory = resolve_artifact(directory)
+        with open(directory / "meta.json", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.scan_limit = self.meta["scan_limit"]
+        self.top_k = self.meta["top_k"]
+        self.max_distance = self.meta["max_edit_distance"]
+        self.prefix_length = self.meta["prefix_length"]
+
+        self.completions = TermTable(directory, name="completions")
+        # np.asarray drops the np.memmap subclass (slow to slice) but keeps the mapping
+        self.scores = np.asarray(np.load(directory / "scores.npy", mmap_mode="r"))
+        prefixes = TermTable(directory, name="prefixes")
+        # Few prefixes are heavy (short ones, mostly), so a dict costs little and skips the binary search
+        self.heavy_prefixes = {prefixes.term(i): i for i in range(len(prefixes))}
+        self.prefix_topk = np.asarray(np.load(directory / "prefix_topk.npy", mmap_mode="r"))
+        self.delete_hashes = np.asarray(np.load(directory / "delete_hashes.npy", mmap_mode="r"))
+        self.delete_ids = np.asarray(np.load(directory / "delete_ids.npy", mmap_mode="r"))
+        # Plain int indexing without numpy scalars on the per-request paths
+        self._scores = memoryview(self.scores)
+        self._delete_ids = memoryview(self.delete_ids)
+
+    def complete(self, prefix, k=10):
+        """Returns up to k (completion, score) pairs starting with `prefix`, most frequent first."""
+        typed = prefix
+        prefix = normalize(typed)
+        if not prefix:
+            return []
+        if typed[-1].isspace():
+            # A finished word: complete the next one rather than longer words
+            prefix += " "
+        row = self.heavy_prefixes.get(prefix)
+        if row is not None:
+            ids = [i for i in self.prefix_topk[row].tolist() if i >= 0][:k]
+        else:
+            start, end = self.completions.prefix_range(prefix)
+            ids = (start + top_k_indices(self.scores[start:end], k)).tolist()
+        return [(self.completions.term(i), self._scores[i]) for i in ids]
+
+    def correct(self, word, k=5, max_distance=None):
+        """
+        Returns up to k (word, distance, score) spelling candidates for `word`,
+        closest first, then most frequent.
+        """
+        word = normalize(word)
+        if not word or " " in word:
+            return []
+        max_distance = self.max_distance if max_distance is None else min(max_distance, self.max_distance)
+        # Two edits on a short word match a large part of the dictionary; allow one
+        if len(word) <= SHORT_WORD_LENGTH:
+            max_distance = min(max_distance, 1)
+
+        hashes = np.array(
+            sorted({delete_hash(v) for v in deletes(word, max_distance, self.prefix_length)}), dtype="uint64"
+        )
+        lo = np.searchsorted(self.delete_hashes, hashes, side="left").tolist()
+        hi = np.searchsorted(self.delete_hashes, hashes, side="right").tolist()
+        candidate_ids = {i for a, b in zip(lo, hi) for i in self._delete_ids[a:b]}
+
+        offsets = self.completions._offsets
+        found = []
+        for i in candidate_ids:
+            # A word never has more characters than UTF-8 bytes: skip candidates that are too short
+            if offsets[i + 1] - offsets[i] < len(word) - max_distance:
+                continue
+            candidate = self.completions.term(i)
+            distance = edit_distance(word, candidate, max_distance)
+            if distance <= max_distance:
+                found.append((candidate, distance, self._scores[i]))
+        found.sort(key=lambda item: (item[1], -item[2]))
+        return found[:k]
+
+    def did_you_mean(self, query):
+        """Replaces every unknown word of `query` with its best correction; None if nothing changes."""
+        words = normalize(query).split()
+        corrected = []
+        for word in words:
+            if self.completions.lookup(word) >= 0:
+                corrected.append(word)
+                continue
+            candidates = self.correct(word, k=1)
+            corrected.append(candidates[0][0] if candidates else word)
+        return " ".join(corrected) if corrected != words else None
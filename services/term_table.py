@@ -0,0 +1,82 @@
+# services/term_table.py
+
+import mmap
+import os
+from pathlib import Path
+
+import numpy as np
+
+
+def write_term_table(directory, terms, name="terms"):
+    """
+    Writes a sorted term dictionary as two flat files:
+      - {name}.bin          : every term's UTF-8 bytes concatenated
+      - {name}_offsets.npy  : int64 offsets, term i is bin[offsets[i]:offsets[i + 1]]
+    `terms` must already be sorted; the position of a term is its id.
+    """
+    directory = Path(directory)
+    os.makedirs(directory, exist_ok=True)
+
+    encoded = [term.encode("utf-8") for term in terms]
+    if any(encoded[i] >= encoded[i + 1] for i in range(len(encoded) - 1)):
+        raise ValueError("Terms must be unique and sorted before writing a term table.")
+
+    offsets = np.zeros(len(encoded) + 1, dtype="int64")
+    if encoded:
+        offsets[1:] = np.cumsum([len(term) for term in encoded])
+
+    with open(directory / f"{name}.bin", "wb") as f:
+        f.write(b"".join(encoded))
+    np.save(directory / f"{name}_offsets.npy", offsets)
+
+
+class TermTable:
+    """
+    Read-only, memory-mapped view of a table written by `write_term_table`.
+    Lookups binary-search the mapped bytes directly, so loading costs nothing
+    and no per-term Python objects are created.
+    """
+
+    def __init__(self, directory, name="terms"):
+        directory = Path(directory)
+        self.offsets = np.load(directory / f"{name}_offsets.npy", mmap_mode="r")
+        self._offsets = memoryview(self.offsets)  # plain int indexing without numpy scalars
+
+        with open(directory / f"{name}.bin", "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            # mmap refuses zero-length files; an empty vocabulary is still a valid table
+            self._blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def _key(self, i):
+        return self._blob[self._offsets[i]:self._offsets[i + 1]]
+
+    def term(self, i):
+        return self._key(i).decode("utf-8")
+
+    def lower_bound(self, key):
+        """Returns the first id whose bytes are >= `key` (bytes)."""
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def lookup(self, term):
+        """Returns the id of `term`, or -1 if it is not in the table."""
+        key = term.encode("utf-8")
+        i = self.lower_bound(key)
+        if i < len(self) and self._key(i) == key:
+            return i
+        return -1
+
+    def prefix_range(self, prefix):
+        """Returns (start, end) ids of all terms beginning with `prefix`."""
+        key = prefix.encode("utf-8")
+        # 0xff never occurs in UTF-8, so it sorts after every continuation of the prefix
+        return self.lower_bound(key), self.lower_bound(key + b"\xff")
@@ -0,0 +1,180 @@
+# services/tfidf_index.py
+
+import json
+import os
+import re
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+
+from services.term_table import TermTable, write_term_table
+from services.doc_id_table import write_doc_id_table
+from services.array_utils import shard_row_offsets, shard_dir_name
+from services.artifacts import resolve_artifact, artifact_stamp
+
+TFIDF_FORMAT = "tfidf-csc"
+TFIDF_FORMAT_VERSION = 1
+
+
+# --- Offline writer ---
+def write_tfidf_index(directory, vectorizer, matrix, dtype="float32", num_shards=1, doc_ids=None):
+    """
+    Writes a fitted TfidfVectorizer and its document matrix as flat arrays:
+      - terms.bin / terms_offsets.npy : vectorizer vocabulary, sorted, position = column
+      - idf.npy                       : float64 idf_ per column
+      - csc_indptr.npy                : int64, column t holds entries [indptr[t], indptr[t + 1])
+      - csc_indices.npy               : int32 row ids of the non-zeros
+      - csc_data.npy                  : tf-idf weights of the non-zeros (`dtype`)
+      - meta.json                     : shape and the analyzer settings the query side must replay
+      - doc_ids.*                     : with `doc_ids`, the row -> doc_id table (services/doc_id_table.py)
+    The matrix is stored column-major (CSC) because queries only touch the columns
+    of their own terms.
+
+    With num_shards > 1 the rows are split into contiguous ranges, each with its own
+    csc_*.npy under shard_NNN/ (row ids local to the shard); vocabulary and idf are
+    shared, so shard scores equal the corresponding unsharded scores.
+    """
+    params = vectorizer.get_params()
+    if params["analyzer"] != "word" or params["ngram_range"] != (1, 1) or params["stop_words"] is not None \
+            or params["preprocessor"] is not None or params["tokenizer"] is not None:
+        raise ValueError("Only unigram word vectorizers with the default analyzer can be exported.")
+
+    directory = Path(directory)
+    os.makedirs(directory, exist_ok=True)
+
+    # get_feature_names_out() is ordered by column index, which sklearn assigns alphabetically
+    terms = vectorizer.get_feature_names_out().tolist()
+    csr = matrix.tocsr()
+
+    write_term_table(directory, terms)
+    np.save(directory / "idf.npy", vectorizer.idf_.astype("float64"))
+
+    row_offsets = shard_row_offsets(csr.shape[0], num_shards)
+    for shard in range(len(row_offsets) - 1):
+        lo, hi = row_offsets[shard], row_offsets[shard + 1]
+        shard_dir = directory if len(row_offsets) == 2 else directory / shard_dir_name(shard)
+        os.makedirs(shard_dir, exist_ok=True)
+
+        csc = csr[lo:hi].tocsc()
+        csc.sort_indices()
+        np.save(shard_dir / "csc_indptr.npy", csc.indptr.astype("int64"))
+        np.save(shard_dir / "csc_indices.npy", csc.indices.astype("int32"))
+        np.save(shard_dir / "csc_data.npy", csc.data.astype(dtype))
+
+    meta = {
+        "format": TFIDF_FORMAT,
+        "version": TFIDF_FORMAT_VERSION,
+        "n_docs": int(csr.shape[0]),
+        "n_terms": int(csr.shape[1]),
+        "nnz": int(csr.nnz),
+        "lowercase": params["lowercase"],
+        "token_pattern": params["token_pattern"],
+        "norm": params["norm"],
+        "use_idf": params["use_idf"],
+        "sublinear_tf": params["sublinear_tf"],
+        "num_shards": len(row_offsets) - 1,
+        "row_offsets": row_offsets,
+    }
+    if doc_ids is not None:
+        meta["doc_ids_fingerprint"] = write_doc_id_table(directory, doc_ids)["fingerprint"]
+    with open(directory / "meta.json", "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+# --- Query-time reader ---
+class TfIdfIndex:
+    """
+    Memory-mapped TF-IDF index written by `write_tfidf_index`.
+    `transform` reproduces TfidfVectorizer.transform for a single query without
+    sklearn, and `get_scores` computes matrix @ query.T from the query's columns only.
+
+    For a sharded index, `TfIdfIndex(directory)` opens only the vocabulary and idf
+    (`is_sharded` is True; scoring goes through services.sharded_search), while
+    `TfIdfIndex(directory, shard=s)` opens one shard's columns.
+    """
+
+    def __init__(self, directory, shard=None):
+        # Pinned to the version published right now (services/artifacts.py)
+        directory = resolve_artifact(directory)
+        meta_path = directory / "meta.json"
+        if not meta_path.exists():
+            raise FileNotFoundError(f"TF-IDF index not found at '{directory}'. Run offline/tfidf_service.py first.")
+        with open(meta_path, encoding="utf-8") as f:
+            self.meta = json.load(f)
+        if self.meta.get("format") != TFIDF_FORMAT:
+            raise ValueError(f"'{directory}' does not contain a {TFIDF_FORMAT} index.")
+
+        self.directory = directory
+        # Identifies this build to the shard pool workers (services/sharded_search.py)
+        self.stamp = artifact_stamp(meta_path)
+        self.terms = TermTable(directory)
+        self.idf = np.load(directory / "idf.npy", mmap_mode="r")
+
+        self.row_offsets = self.meta.get("row_offsets", [0, self.meta["n_docs"]])
+        self.num_shards = len(self.row_offsets) - 1
+        self.is_sharded = self.num_shards > 1 and shard is None
+        self.n_docs = self.meta["n_docs"]
+        self._token_re = re.compile(self.meta["token_pattern"])
+
+        if self.is_sharded:
+            return
+        shard_dir = directory
+        if shard is not None and self.num_shards > 1:
+            shard_dir = directory / shard_dir_name(shard)
+            self.n_docs = self.row_offsets[shard + 1] - self.row_offsets[shard]
+        self.indptr = np.load(shard_dir / "csc_indptr.npy", mmap_mode="r")
+        self.indices = np.load(shard_dir / "csc_indices.npy", mmap_mode="r")
+        self.data = np.load(shard_dir / "csc_data.npy", mmap_mode="r")
+
+    def __len__(self):
+        return self.n_docs
+
+    def column(self, term_id):
+        """Returns (row ids, weights) of one vocabulary column."""
+        start, end = self.indptr[term_id], self.indptr[term_id + 1]
+        return self.indices[start:end], self.data[start:end]
+
+    def transform(self, text):
+        """
+        Returns the query vector as (term ids, weights), matching the non-zeros of
+        TfidfVectorizer.transform([text]). Out-of-vocabulary tokens are dropped.
+        """
+        if self.meta["lowercase"]:
+            text = text.lower()
+
+        counts = Counter()
+        for token in self._token_re.findall(text):
+            term_id = self.terms.lookup(token)
+            if term_id >= 0:
+                counts[term_id] += 1
+
+        term_ids = np.fromiter(counts.keys(), dtype="int64", count=len(counts))
+        weights = np.fromiter(counts.values(), dtype="float64", count=len(counts))
+        if self.meta["sublinear_tf"]:
+            weights = 1 + np.log(weights)
+        if self.meta["use_idf"]:
+            weights = weights * self.idf[term_ids]
+
+        if self.meta["norm"] == "l2":
+            norm = np.sqrt(np.dot(weights, weights))
+        elif self.meta["norm"] == "l1":
+            norm = np.abs(weights).sum()
+        else:
+            norm = 0.0
+        if norm > 0:
+            weights = weights / norm
+        return term_ids, weights
+
+    def score_vector(self, term_ids, weights):
+        """Dot product of every document row with a query vector from `transform`."""
+        scores = np.zeros(self.n_docs, dtype="float64")
+        for term_id, weight in zip(term_ids, weights):
+            rows, data = self.column(term_id)
+            scores[rows] += weight * data
+        return scores
+
+    def get_scores(self, text):
+        """Dot product of every document row with the transformed query."""
+        return self.score_vector(*self.transform(text))